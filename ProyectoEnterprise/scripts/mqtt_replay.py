@@ -0,0 +1,296 @@
+"""Record-and-replay load harness for the MQTT event pipeline.
+
+    python mqtt_replay.py record traffic.mqr --seconds 600
+    python mqtt_replay.py replay traffic.mqr --speed 10 --assets 50
+    python mqtt_replay.py replay traffic.mqr --speed 0    # as fast as the broker takes it
+
+`record` captures enterprise/+/state (JSON and /bin frames) and
+enterprise/alarms from a live system. Recordings ending in .gz are
+gzipped. Layout (little-endian) after the 4-byte magic b"MQR1":
+
+    record   kind:u8 | offset_us:u64 | topic id:u16 | length:u32 | body
+    kind 0   topic id -> body (utf-8 topic name), once per topic
+    kind 1   one message on topic id, body = payload bytes
+
+JSON-lines recordings from ai-service/bench_replay.py
+({"t", "topic", "payload": base64}) replay as well.
+
+`replay` publishes the recording at `--speed` times real time (0 = no
+pacing). With `--assets N`, every message is sent N times: as recorded,
+then as synthetic assets <asset>-001 ... (topic and JSON `asset` fields
+renamed), so historian-service still sees its own asset.
+While it runs, each service's /metrics is scraped for
+mqtt_messages_consumed_total. Lag is the number of messages published on
+topics the service subscribes to minus the number it has handled. Alarms
+that alarm-service and ai-service raise during the replay are counted by a
+tap subscriber, so historian and gateway lag include them.
+A service whose lag is still above zero after `--drain` seconds could not
+keep up: its peak rate is its saturation point.
+"""
+import argparse
+import base64
+import gzip
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import httpx
+import paho.mqtt.client as mqtt
+from prometheus_client.parser import text_string_to_metric_families
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("mqtt-replay")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+MAGIC = b"MQR1"
+RECORD = struct.Struct("<BQHI")
+TOPIC, MESSAGE = 0, 1
+ALARM_TOPIC = "enterprise/alarms"
+RECORD_TOPICS = ("enterprise/+/state", "enterprise/+/state/bin", ALARM_TOPIC)
+CONSUMED_METRIC = "mqtt_messages_consumed_total"
+
+def default_services(binary):
+    """name -> (metrics URL, subscriptions), as each service subscribes with WIRE_FORMAT."""
+    state = "enterprise/+/state" + ("/bin" if binary else "")
+    return {
+        "alarm-service": ("http://127.0.0.1:8002/metrics/", (state,)),
+        "historian-service": ("http://127.0.0.1:8003/metrics/", (state.replace("+", "machine"), ALARM_TOPIC)),
+        "ai-service": ("http://127.0.0.1:8004/metrics/", (state,)),
+        "api-gateway": ("http://127.0.0.1:8080/metrics/prometheus/", (state, ALARM_TOPIC)),
+    }
+
+def open_recording(path, mode):
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+# --- Record ---
+class Recorder:
+    def __init__(self, path):
+        self.file = open_recording(path, "wb")
+        self.file.write(MAGIC)
+        self.topics = {}
+        self.start = None
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def on_message(self, client, userdata, msg):
+        now = time.monotonic()
+        with self.lock:
+            if self.file.closed: return
+            if self.start is None: self.start = now
+            offset = int((now - self.start) * 1_000_000)
+            topic_id = self.topics.get(msg.topic)
+            if topic_id is None:
+                topic_id = self.topics[msg.topic] = len(self.topics)
+                name = msg.topic.encode()
+                self.file.write(RECORD.pack(TOPIC, offset, topic_id, len(name)) + name)
+            self.file.write(RECORD.pack(MESSAGE, offset, topic_id, len(msg.payload)) + msg.payload)
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def record(args):
+    recorder = Recorder(args.path)
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "REPLAY_RECORDER")
+    client.on_message = recorder.on_message
+    client.on_connect = lambda c, u, f, rc, p: c.subscribe([(t, 0) for t in RECORD_TOPICS])
+    client.connect(args.broker, args.port, 60)
+    client.loop_start()
+    logger.info(f"Recording {', '.join(RECORD_TOPICS)} from {args.broker} to {args.path} (Ctrl+C to stop)")
+    deadline = time.monotonic() + args.seconds if args.seconds > 0 else None
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(min(10.0, deadline - time.monotonic()) if deadline else 10.0)
+            logger.info(f"{recorder.count:,} messages, {len(recorder.topics)} topics")
+    except KeyboardInterrupt:
+        pass
+    client.loop_stop()
+    recorder.close()
+    logger.info(f"Recorded {recorder.count:,} messages to {args.path} ({os.path.getsize(args.path) / 1e6:.1f} MB)")
+
+# --- Load ---
+def load(path):
+    """[(offset seconds, topic, payload)], oldest first."""
+    with open_recording(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC): return load_jsonl(data)
+    topics, messages, pos = {}, [], len(MAGIC)
+    while pos + RECORD.size <= len(data):
+        kind, offset, topic_id, length = RECORD.unpack_from(data, pos)
+        pos += RECORD.size
+        if pos + length > len(data): break # recorder killed mid-write
+        body = data[pos:pos + length]
+        pos += length
+        if kind == TOPIC: topics[topic_id] = body.decode()
+        else: messages.append((offset / 1_000_000, topics[topic_id], body))
+    return messages
+
+def load_jsonl(data):
+    rows = [json.loads(line) for line in data.decode().splitlines() if line.strip()]
+    rows.sort(key=lambda r: r["t"])
+    first = rows[0]["t"] if rows else 0
+    return [(r["t"] - first, r["topic"], base64.b64decode(r["payload"])) for r in rows]
+
+def rename(topic, payload, suffix):
+    """One synthetic copy of a message: enterprise/<asset>/state[/bin] becomes
+    enterprise/<asset>-<suffix>/state[/bin] and JSON `asset` fields follow."""
+    parts = topic.split("/")
+    is_state = len(parts) > 2 and parts[2] == "state"
+    if is_state: parts[1] = f"{parts[1]}-{suffix}"
+    if topic.endswith("/bin"): return "/".join(parts), payload
+    try:
+        body = json.loads(payload)
+    except ValueError:
+        return "/".join(parts), payload
+    for holder in (body, body.get("data")):
+        if isinstance(holder, dict) and holder.get("asset"): holder["asset"] = f"{holder['asset']}-{suffix}"
+    return "/".join(parts), json.dumps(body).encode()
+
+def expand(messages, assets, repeat):
+    """Fans messages out across `assets` synthetic assets and loops the
+    recording `repeat` times, all before the clock starts."""
+    span = messages[-1][0] + 1.0 if messages else 0.0
+    copies = [(offset, topic, payload) if k == 0 else (offset, *rename(topic, payload, f"{k:03d}"))
+              for offset, topic, payload in messages for k in range(max(assets, 1))]
+    return [(offset + n * span, topic, payload) for n in range(repeat) for offset, topic, payload in copies]
+
+# --- Replay ---
+class Service:
+    def __init__(self, name, url, subscriptions):
+        self.name = name
+        self.url = url
+        self.subscriptions = subscriptions
+        self.base = None
+        self.published = 0
+        self.consumed = 0
+        self.rate = 0.0
+        self.peak_rate = 0.0
+        self.max_lag = 0
+
+    def matches(self, topic):
+        return any(mqtt.topic_matches_sub(sub, topic) for sub in self.subscriptions)
+
+    @property
+    def lag(self):
+        return self.published - self.consumed
+
+def scrape(http, url):
+    try:
+        r = http.get(url)
+        r.raise_for_status()
+    except httpx.HTTPError:
+        return None
+    for family in text_string_to_metric_families(r.text):
+        for sample in family.samples:
+            if sample.name == CONSUMED_METRIC: return sample.value
+    return None
+
+def monitor(http, services, interval, stop):
+    last = time.monotonic()
+    while not stop.wait(interval):
+        now = time.monotonic()
+        for s in services:
+            total = scrape(http, s.url)
+            if total is None: continue
+            consumed = total - s.base
+            s.rate = (consumed - s.consumed) / (now - last)
+            s.consumed = consumed
+            s.peak_rate = max(s.peak_rate, s.rate)
+            s.max_lag = max(s.max_lag, s.lag)
+        last = now
+        logger.info(" | ".join(f"{s.name} {s.rate:,.0f} msg/s lag {s.lag:,.0f}" for s in services))
+
+def publish_all(client, messages, speed, routes):
+    start = time.monotonic()
+    info = None
+    for i, (offset, topic, payload) in enumerate(messages):
+        if speed > 0:
+            delay = start + offset / speed - time.monotonic()
+            if delay > 0: time.sleep(delay)
+        info = client.publish(topic, payload)
+        for s in routes[topic]: s.published += 1
+        # Unpaced, paho would queue the whole recording; wait for the socket every 1000 messages
+        if i % 1000 == 999: info.wait_for_publish()
+    if info: info.wait_for_publish()
+    return time.monotonic() - start
+
+def replay(args):
+    messages = load(args.path)
+    if args.no_alarms: messages = [m for m in messages if m[1] != ALARM_TOPIC]
+    messages = expand(messages, args.assets, args.repeat)
+    if not messages:
+        logger.error(f"No messages in {args.path}")
+        return
+    services = default_services(args.wire == "binary")
+    for spec in args.service:
+        name, url = spec.split("=", 1)
+        services[name] = (url, services.get(name, (None, ("enterprise/+/state", ALARM_TOPIC)))[1])
+
+    http = httpx.Client(timeout=2.0)
+    watched = []
+    for name, (url, subscriptions) in services.items():
+        s = Service(name, url, subscriptions)
+        s.base = scrape(http, url)
+        if s.base is None: logger.warning(f"{name}: no {CONSUMED_METRIC} at {url}, not monitored")
+        else: watched.append(s)
+    # Replayed alarms are counted by the tap along with the ones services raise
+    routes = {topic: [s for s in watched if s.matches(topic)] if topic != ALARM_TOPIC else []
+              for topic in {m[1] for m in messages}}
+    tap = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "REPLAY_TAP")
+    alarm_watchers = [s for s in watched if s.matches(ALARM_TOPIC)]
+    def on_alarm(client, userdata, msg):
+        for s in alarm_watchers: s.published += 1
+    tap.on_message = on_alarm
+    tap.on_connect = lambda c, u, f, rc, p: c.subscribe(ALARM_TOPIC)
+    tap.connect(args.broker, args.port, 60)
+    tap.loop_start()
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "REPLAY_HARNESS")
+    client.connect(args.broker, args.port, 60)
+    client.loop_start()
+
+    pace = f"{args.speed:g}x" if args.speed > 0 else "max speed"
+    logger.info(f"Replaying {len(messages):,} messages ({args.assets} asset copies, {args.repeat} loops) at {pace} "
+                f"against {args.broker}, watching {', '.join(s.name for s in watched) or 'no services'}")
+    stop = threading.Event()
+    reporter = threading.Thread(target=monitor, args=(http, watched, args.interval, stop), daemon=True)
+    reporter.start()
+    elapsed = publish_all(client, messages, args.speed, routes)
+    logger.info(f"Published {len(messages):,} messages in {elapsed:.1f}s ({len(messages) / elapsed:,.0f} msg/s)")
+    deadline = time.monotonic() + args.drain
+    while time.monotonic() < deadline and any(s.lag > 0 for s in watched):
+        time.sleep(args.interval)
+    stop.set()
+    reporter.join()
+    client.loop_stop()
+    tap.loop_stop()
+    http.close()
+
+    for s in watched:
+        verdict = "kept up" if s.lag <= 0 else f"SATURATED, {s.lag:,.0f} still queued after {args.drain:g}s drain"
+        logger.info(f"{s.name}: {s.consumed:,.0f}/{s.published:,} consumed, peak {s.peak_rate:,.0f} msg/s, "
+                    f"max lag {s.max_lag:,.0f} -> {verdict}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--broker", default=os.getenv("MQTT_BROKER", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=1883)
+    commands = parser.add_subparsers(dest="command", required=True)
+    rec = commands.add_parser("record", help="Capture live state and alarm traffic")
+    rec.add_argument("path")
+    rec.add_argument("--seconds", type=float, default=0, help="Stop after this long (0 = until Ctrl+C)")
+    rep = commands.add_parser("replay", help="Publish a recording and report per-service throughput and lag")
+    rep.add_argument("path")
+    rep.add_argument("--speed", type=float, default=1.0, help="Multiple of real time (0 = unpaced)")
+    rep.add_argument("--assets", type=int, default=1, help="Synthetic asset copies of every state message")
+    rep.add_argument("--repeat", type=int, default=1, help="Play the recording this many times back to back")
+    rep.add_argument("--no-alarms", action="store_true", help="Skip recorded enterprise/alarms messages")
+    rep.add_argument("--wire", default=os.getenv("WIRE_FORMAT", "json"), help="json | binary, as the services subscribe")
+    rep.add_argument("--service", action="append", default=[], metavar="NAME=URL", help="Metrics URL for a service (repeatable)")
+    rep.add_argument("--interval", type=float, default=2.0, help="Seconds between metric scrapes")
+    rep.add_argument("--drain", type=float, default=30.0, help="Seconds to wait for lag to clear after publishing")
+    args = parser.parse_args()
+    if args.command == "record": record(args)
+    else: replay(args)
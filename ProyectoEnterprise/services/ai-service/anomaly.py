@@ -0,0 +1,182 @@
+from prometheus_client import Counter, Gauge
+from streaming import EWMA, P2Quantile, Welford
+
+# --- PROMETHEUS METRICS ---
+AI_TRIPS = Counter('ai_trips_total', 'Completed trips analysed', ['asset', 'direction'])
+AI_ANOMALIES = Counter('ai_anomalies_total', 'Trips scored as anomalous', ['asset', 'direction'])
+AI_ZSCORE = Gauge('ai_trip_zscore', 'z-score of the last trip against the baseline', ['asset', 'direction'])
+AI_DRIFT = Gauge('ai_trip_drift_ratio', 'Fast vs slow EWMA of trip time, (fast - slow) / slow', ['asset', 'direction'])
+AI_HEALTH = Gauge('ai_health_score', 'Health score per asset (0-100)', ['asset'])
+
+DIRECTIONS = ("up", "down")
+
+class DirectionStats:
+    """Trip-time model for one asset and direction. The baseline (Welford)
+    only learns from normal trips, so a fault does not teach itself in;
+    the EWMAs and quantiles see every trip, so a slow shift still shows up
+    as drift. A run of `persist_trips` anomalous trips in a row is a new
+    normal (adjustment, part swap): the baseline restarts from that run."""
+    def __init__(self, fast_alpha, slow_alpha, persist_trips=10):
+        self.baseline = Welford()
+        self.persist_trips = persist_trips
+        self.streak = [] # durations of the current run of anomalous trips
+        self.rebases = 0
+        self.reference = None # baseline mean frozen once trained, for wear trends
+        self.fast = EWMA(fast_alpha)
+        self.slow = EWMA(slow_alpha)
+        self.p50 = P2Quantile(0.5)
+        self.p95 = P2Quantile(0.95)
+        self.last = None
+        self.last_z = 0.0
+        self.anomalies = 0
+
+    def zscore(self, duration, min_samples, min_rel_std):
+        if self.baseline.n < min_samples: return 0.0
+        # Simulated trips are almost identical; a floor keeps scan jitter from scoring as anomalies
+        std = max(self.baseline.std, min_rel_std * self.baseline.mean)
+        return (duration - self.baseline.mean) / std if std > 0 else 0.0
+
+    def update(self, duration, z, anomalous):
+        if not anomalous:
+            self.streak.clear()
+            self.baseline.update(duration)
+        else:
+            self.streak.append(duration)
+            if len(self.streak) >= self.persist_trips: self._rebase()
+        self.fast.update(duration)
+        self.slow.update(duration)
+        self.p50.update(duration)
+        self.p95.update(duration)
+        self.last, self.last_z = duration, z
+        if anomalous: self.anomalies += 1
+
+    def _rebase(self):
+        self.baseline = Welford()
+        for duration in self.streak: self.baseline.update(duration)
+        self.streak.clear()
+        self.rebases += 1
+
+    def seed(self, n, mean, std):
+        """Starts the baseline and EWMAs from a trained model instead of
+        empty, so scoring works from the first trip after a restart."""
+        self.baseline.n, self.baseline.mean = n, mean
+        self.baseline.m2 = std * std * (n - 1) if n > 1 else 0.0
+        self.reference = mean
+        self.fast.mean = self.slow.mean = mean
+
+    @property
+    def drift(self):
+        return (self.fast.mean - self.slow.mean) / self.slow.mean if self.slow.mean else 0.0
+
+    def snapshot(self):
+        return {
+            "trips": self.fast.n,
+            "baseline_mean": round(self.baseline.mean, 3),
+            "baseline_std": round(self.baseline.std, 3),
+            "ewma": round(self.fast.mean, 3) if self.fast.mean is not None else None,
+            "p50": round(self.p50.value, 3) if self.p50.value is not None else None,
+            "p95": round(self.p95.value, 3) if self.p95.value is not None else None,
+            "last": round(self.last, 3) if self.last is not None else None,
+            "last_z": round(self.last_z, 2),
+            "drift": round(self.drift, 4),
+            "anomalies": self.anomalies,
+            "rebases": self.rebases
+        }
+
+class TripAnalyzer:
+    """Segments one asset's state stream into trips (contactor on -> off)
+    and scores each against its direction's statistics."""
+    def __init__(self, asset, config):
+        self.asset = asset
+        self.config = config
+        self.stats = {d: DirectionStats(config["fast_alpha"], config["slow_alpha"], config["persist_trips"]) for d in DIRECTIONS}
+        self.run_start = None
+        self.direction = None
+        self.health_score = 100
+        self.insights = "Analizando patrones de motor..."
+        AI_HEALTH.labels(asset=asset).set(self.health_score)
+
+    def on_state(self, state, t):
+        """`t` is the message time in seconds. Returns the scored trip when one ends."""
+        direction = "up" if state.get("mc1") else "down" if state.get("mc2") else None
+        if direction == self.direction: return None
+        result = None
+        if self.direction is not None:
+            duration = t - self.run_start
+            if duration > self.config["min_trip"]:
+                result = self.score(self.direction, duration)
+        self.direction = direction
+        self.run_start = t if direction else None
+        return result
+
+    def score(self, direction, duration):
+        cfg, stats = self.config, self.stats[direction]
+        z = stats.zscore(duration, cfg["min_samples"], cfg["min_rel_std"])
+        anomalous = z > cfg["z_threshold"]
+        # One alarm per run of anomalous trips, not one per trip
+        alarm = anomalous and not stats.streak
+        rebases = stats.rebases
+        stats.update(duration, z, anomalous)
+        if stats.reference is None and stats.baseline.n >= cfg["min_samples"]: stats.reference = stats.baseline.mean
+
+        AI_TRIPS.labels(asset=self.asset, direction=direction).inc()
+        AI_ZSCORE.labels(asset=self.asset, direction=direction).set(z)
+        AI_DRIFT.labels(asset=self.asset, direction=direction).set(stats.drift)
+        if anomalous:
+            AI_ANOMALIES.labels(asset=self.asset, direction=direction).inc()
+            self.health_score = max(0, self.health_score - 10)
+            self.insights = f"⚠️ ANOMALÍA: Viaje de {'subida' if direction == 'up' else 'bajada'} lento ({duration:.1f}s vs avg {stats.baseline.mean:.1f}s, z={z:.1f})."
+        else:
+            self.health_score = min(100, self.health_score + 2)
+        if stats.rebases > rebases:
+            self.insights = f"🔁 Nuevo nivel de referencia en {'subida' if direction == 'up' else 'bajada'}: {stats.baseline.mean:.1f}s tras {cfg['persist_trips']} viajes lentos seguidos."
+        elif not anomalous:
+            if stats.drift > cfg["drift_warn"]:
+                self.insights = f"📈 Tendencia: viajes de {'subida' if direction == 'up' else 'bajada'} {stats.drift * 100:.0f}% más lentos que el promedio histórico."
+            else:
+                self.insights = "Estado óptimo: Patrones consistentes."
+        AI_HEALTH.labels(asset=self.asset).set(self.health_score)
+        return {"asset": self.asset, "direction": direction, "duration": duration, "z": z,
+                "anomalous": anomalous, "alarm": alarm, "drift": stats.drift, "baseline": stats.baseline.mean,
+                "baseline_n": stats.baseline.n, "reference": stats.reference}
+
+    def avg_travel_time(self):
+        n = sum(s.baseline.n for s in self.stats.values())
+        return sum(s.baseline.mean * s.baseline.n for s in self.stats.values()) / n if n else 0
+
+    def snapshot(self):
+        return {
+            "health_score": self.health_score,
+            "insights": self.insights,
+            "avg_travel_time": round(self.avg_travel_time(), 2),
+            "directions": {d: s.snapshot() for d, s in self.stats.items()}
+        }
+
+class AnomalyEngine:
+    def __init__(self, **config):
+        self.config = config
+        self.analyzers = {}
+
+    def analyzer(self, asset):
+        analyzer = self.analyzers.get(asset)
+        if analyzer is None:
+            analyzer = self.analyzers[asset] = TripAnalyzer(asset, self.config)
+        return analyzer
+
+    def on_state(self, asset, state, t):
+        return self.analyzer(asset).on_state(state, t)
+
+    def seed(self, model):
+        """Seeds per-direction baselines from a training.py model; returns the seeded assets."""
+        seeded = []
+        for asset, trained in model.get("assets", {}).items():
+            directions = [d for d in DIRECTIONS if d in trained]
+            for direction in directions:
+                b = trained[direction]
+                self.analyzer(asset).stats[direction].seed(b["n"], b["mean"], b["std"])
+            if directions: seeded.append(asset)
+        return seeded
+
+    def worst(self):
+        # Snapshot: the MQTT thread adds analyzers while the API iterates
+        return min(list(self.analyzers.values()), key=lambda a: a.health_score, default=None)
@@ -0,0 +1,55 @@
+import logging
+import sys
+import time
+import numpy as np
+import training
+from anomaly import AnomalyEngine
+from main import AI_CONFIG
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("ai-training-bench")
+
+def synthesize(rows, seed=7):
+    """Historian-like columns at 20 Hz: up/down trips of ~4.2/3.9 s with
+    3 s rests, 2% of trips jammed at 1.6x."""
+    rng = np.random.default_rng(seed)
+    trips = rows // 140 + 1
+    up = np.arange(trips) % 2 == 0
+    duration = np.where(up, 4.2, 3.9) * rng.normal(1.0, 0.01, trips)
+    jammed = rng.random(trips) < 0.02
+    duration[jammed] *= 1.6
+    moving = (duration / 0.05).astype(np.int64)
+    # Each trip is `moving` samples with a contactor on, then 60 idle samples
+    per_trip = moving + 60
+    trip_of = np.repeat(np.arange(trips), per_trip)[:rows]
+    offset = np.arange(len(trip_of)) - np.repeat(np.cumsum(per_trip) - per_trip, per_trip)[:rows]
+    on = offset < moving[trip_of]
+    ts = 1_700_000_000_000 + np.arange(len(trip_of), dtype=np.int64) * 50
+    return ts, on & up[trip_of], on & ~up[trip_of], int(jammed[:trip_of[-1]].sum())
+
+def python_loop(ts, mc1, mc2):
+    """The streaming engine fed sample by sample, for comparison."""
+    engine = AnomalyEngine(**AI_CONFIG)
+    trips = 0
+    for t, a, b in zip((ts / 1000.0).tolist(), mc1.tolist(), mc2.tolist()):
+        if engine.on_state("bench", {"mc1": a, "mc2": b}, t): trips += 1
+    return trips
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    ts, mc1, mc2, jammed = synthesize(rows)
+    logger.info(f"Synthesized {len(ts):,} rows ({(ts[-1] - ts[0]) / 3_600_000:.1f} h at 20 Hz), {jammed} jammed trips")
+
+    start = time.perf_counter()
+    result = training.train_asset(ts, mc1, mc2, AI_CONFIG["z_threshold"], AI_CONFIG["min_rel_std"])
+    elapsed = time.perf_counter() - start
+    logger.info(f"Vectorized: {elapsed:.3f}s -> {len(ts) / elapsed:,.0f} rows/s {result['timings']}")
+    logger.info(f"  {result['rescore']['trips']:,} trips, {result['rescore']['anomalies']} anomalies; "
+                f"up {result['up']['mean']:.3f}±{result['up']['std']:.3f}s, down {result['down']['mean']:.3f}±{result['down']['std']:.3f}s, "
+                f"duty {result['duty']['mean'] * 100:.0f}%")
+
+    n = min(len(ts), 1_000_000)
+    start = time.perf_counter()
+    trips = python_loop(ts[:n], mc1[:n], mc2[:n])
+    elapsed_py = time.perf_counter() - start
+    logger.info(f"Per-sample loop on {n:,} rows: {elapsed_py:.3f}s -> {n / elapsed_py:,.0f} rows/s ({trips:,} trips)")
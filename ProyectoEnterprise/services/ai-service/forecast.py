@@ -0,0 +1,115 @@
+import math
+import threading
+from datetime import datetime
+from prometheus_client import Gauge
+from streaming import DecayingTrend
+
+# --- PROMETHEUS METRICS ---
+AI_RUL_HOURS = Gauge('ai_rul_hours', 'Projected hours until a signal reaches its maintenance threshold', ['asset', 'signal'])
+
+class AssetForecast:
+    """Degradation trends for one asset, each fitted against time in hours:
+
+    - trip_time:  trip duration / direction reference, the baseline frozen
+                  at training or after min_samples trips (1.0 = as new)
+    - motor_temp: plc_motor_temperature_celsius
+    - cycles:     plc_work_cycles_total, whose slope is the usage rate
+
+    Every update refreshes `cached`, so reads never touch the fits."""
+    def __init__(self, asset, config):
+        self.asset = asset
+        self.config = config
+        self.trip = DecayingTrend(config["half_life_h"])
+        self.temp = DecayingTrend(config["half_life_h"])
+        self.cycles = DecayingTrend(config["half_life_h"])
+        self.cycle_offset = 0.0 # plc-service counters restart at 0 with the service
+        self.last_cycles = None
+        self.cached = None
+
+    def on_trip(self, ratio, t):
+        self.trip.update(t / 3600.0, ratio)
+        self.refresh(t)
+
+    def on_metrics(self, temperature, cycles, t):
+        h = t / 3600.0
+        if temperature is not None: self.temp.update(h, temperature)
+        if cycles is not None:
+            if self.last_cycles is not None and cycles < self.last_cycles: self.cycle_offset += self.last_cycles
+            self.last_cycles = cycles
+            self.cycles.update(h, cycles + self.cycle_offset)
+        self.refresh(t)
+
+    def refresh(self, t):
+        cfg, signals = self.config, {}
+        trip_limit = 1.0 + cfg["trip_slowdown"]
+        signals["trip_time"] = self._signal(self.trip, trip_limit, 4)
+        signals["motor_temp"] = self._signal(self.temp, cfg["temp_limit"], 2)
+        service = signals["cycles"] = self._signal(self.cycles, None, 1)
+        if service["level"] is not None:
+            # Threshold is the next service interval, reached at the fitted cycle rate
+            done = service["level"]
+            service["threshold"] = (math.floor(done / cfg["service_cycles"]) + 1) * cfg["service_cycles"]
+            rate = self.cycles.slope
+            service["hours_to_threshold"] = round((service["threshold"] - done) / rate, 1) \
+                if rate > 0 and self.cycles.n >= cfg["min_samples"] else None
+
+        due = {name: s["hours_to_threshold"] for name, s in signals.items() if s["hours_to_threshold"] is not None}
+        for name in signals:
+            # NaN (no projection) rather than the last due time once a trend flattens or reverses
+            AI_RUL_HOURS.labels(asset=self.asset, signal=name).set(due.get(name, math.nan))
+        limiting = min(due, key=due.get, default=None)
+        rul = due[limiting] if limiting else None
+        self.cached = {
+            "asset": self.asset,
+            "rul_hours": rul,
+            "limiting_signal": limiting,
+            "maintenance_due": datetime.fromtimestamp(t + rul * 3600).isoformat() if rul is not None else None,
+            "signals": signals,
+            "updated_at": datetime.fromtimestamp(t).isoformat()
+        }
+
+    def _signal(self, trend, threshold, digits):
+        ready = trend.n >= self.config["min_samples"]
+        level = trend.level
+        hours = trend.time_to(threshold) if ready and threshold is not None else None
+        if hours is not None and hours > self.config["horizon_h"]: hours = None # trend too flat to call
+        return {
+            "samples": trend.n,
+            "level": round(level, digits) if level is not None else None,
+            "slope_per_hour": round(trend.slope, digits + 2) if ready else None,
+            "threshold": threshold,
+            "hours_to_threshold": round(hours, 1) if hours is not None else None
+        }
+
+class Forecaster:
+    """Remaining-useful-life per asset, kept precomputed: trips (MQTT thread)
+    and metric scrapes (event loop) refresh one asset's cached forecast,
+    and the API only reads those dicts."""
+    def __init__(self, **config):
+        self.config = config
+        self.assets = {}
+        self.lock = threading.Lock() # writers only; readers take the cached dict as is
+
+    def asset(self, asset):
+        forecast = self.assets.get(asset)
+        if forecast is None:
+            forecast = self.assets[asset] = AssetForecast(asset, self.config)
+        return forecast
+
+    def on_trip(self, trip, t):
+        # A fixed reference: the live baseline keeps learning the slowdown and would hide it
+        if trip["reference"]:
+            with self.lock:
+                self.asset(trip["asset"]).on_trip(trip["duration"] / trip["reference"], t)
+
+    def on_metrics(self, asset, temperature, cycles, t):
+        with self.lock:
+            self.asset(asset).on_metrics(temperature, cycles, t)
+
+    def get(self, asset):
+        forecast = self.assets.get(asset)
+        return forecast.cached if forecast else None
+
+    def all(self):
+        # Snapshot: the MQTT thread adds assets while the API iterates
+        return {asset: f.cached for asset, f in list(self.assets.items()) if f.cached}
@@ -5,9 +5,16 @@ import os
 from datetime import datetime
 from contextlib import asynccontextmanager
 import paho.mqtt.client as mqtt
+import telemetry_codec
 import httpx
-from fastapi import FastAPI
+from typing import Optional
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import Counter, make_asgi_app
+from anomaly import AnomalyEngine
+from forecast import Forecaster
+from prometheus_client.parser import text_string_to_metric_families
+import training
 
 # --- Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -16,80 +23,160 @@ logger = logging.getLogger("ai-service")
 # --- Config ---
 MQTT_BROKER = os.getenv("MQTT_BROKER", "127.0.0.1")
 HISTORIAN_URL = os.getenv("HISTORIAN_URL", "http://historian-service:8003")
-AI_THRESHOLD = 1.25 
+PLC_URL = os.getenv("PLC_URL", "http://plc-service:8000")
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "json") # json | binary
+# Every asset's state (plc-service publishes enterprise/<asset>/state)
+STATE_TOPIC = telemetry_codec.state_topic("enterprise/+/state", WIRE_FORMAT == "binary")
+# Anomaly model: a trip is anomalous when its z-score against the direction's baseline exceeds AI_Z_THRESHOLD
+AI_CONFIG = {
+    "z_threshold": float(os.getenv("AI_Z_THRESHOLD", "3.0")),
+    "min_samples": int(os.getenv("AI_MIN_SAMPLES", "5")),
+    "min_rel_std": float(os.getenv("AI_MIN_REL_STD", "0.02")),
+    "fast_alpha": float(os.getenv("AI_EWMA_FAST", "0.3")),
+    "slow_alpha": float(os.getenv("AI_EWMA_SLOW", "0.02")),
+    "drift_warn": float(os.getenv("AI_DRIFT_WARN", "0.10")),
+    # Anomalous trips in a row after which the slower time becomes the new baseline
+    "persist_trips": int(os.getenv("AI_PERSIST_TRIPS", "10")),
+    "min_trip": 1.0,
+}
+# Batch training (training.py): baselines fitted on historian data, loaded at startup.
+# The historian records a single state stream, stored under HISTORIAN_ASSET.
+AI_MODEL_PATH = os.getenv("AI_MODEL_PATH", "ai_model.json")
+HISTORIAN_ASSET = os.getenv("HISTORIAN_ASSET", "machine")
+# Maintenance forecast: trends of trip time, motor temperature and cycle count (scraped from plc-service /metrics)
+RUL_CONFIG = {
+    "half_life_h": float(os.getenv("AI_RUL_HALF_LIFE_H", "72")),
+    "min_samples": int(os.getenv("AI_RUL_MIN_SAMPLES", "10")),
+    "horizon_h": float(os.getenv("AI_RUL_HORIZON_H", "8760")),
+    "trip_slowdown": float(os.getenv("AI_RUL_TRIP_SLOWDOWN", "0.25")),
+    "temp_limit": float(os.getenv("AI_RUL_TEMP_LIMIT", "70")),
+    "service_cycles": int(os.getenv("AI_RUL_SERVICE_CYCLES", "50000")),
+}
+PLC_SCRAPE_INTERVAL = float(os.getenv("AI_PLC_SCRAPE_INTERVAL", "15"))
 
 # State
-current_run_start = None
-travel_times = [] 
-system_health_score = 100
-ai_insights = "Analizando patrones de motor..."
+engine = AnomalyEngine(**AI_CONFIG)
+forecaster = Forecaster(**RUL_CONFIG)
+training_lock = asyncio.Lock()
 
 # --- MQTT Setup ---
+MQTT_CONSUMED = Counter('mqtt_messages_consumed_total', 'MQTT messages handled by on_message')
 mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "AI_PREDICTIVE_ENGINE")
 
 def on_connect(client, userdata, flags, reason_code, properties):
-    client.subscribe("enterprise/machine/state")
+    client.subscribe(STATE_TOPIC)
     logger.info("🧠 AI Engine: Suscrito al flujo de datos")
 
+def message_time(payload):
+    # Trip durations come from publish timestamps, so broker/consumer lag does not skew them
+    try: return datetime.fromisoformat(payload["timestamp"]).timestamp()
+    except (KeyError, TypeError, ValueError): return datetime.now().timestamp()
+
 def on_message(client, userdata, msg):
-    global current_run_start, travel_times, ai_insights, system_health_score
     try:
-        data = json.loads(msg.payload.decode())
+        data = telemetry_codec.decode_message(msg.topic, msg.payload)
         if data.get("event") == "machine.state.changed":
-            state = data["data"]
-            mc1, mc2 = state.get("mc1"), state.get("mc2")
-
-            if (mc1 or mc2) and current_run_start is None:
-                current_run_start = datetime.now()
-            elif not mc1 and not mc2 and current_run_start is not None:
-                duration = (datetime.now() - current_run_start).total_seconds()
-                current_run_start = None
-                if duration > 1.0: analyze_performance(duration, client)
+            asset = data.get("asset") or msg.topic.split("/")[1]
+            t = message_time(data)
+            trip = engine.on_state(asset, data["data"], t)
+            if trip:
+                forecaster.on_trip(trip, t)
+                if trip["alarm"]: publish_anomaly(trip, client)
     except Exception as e: logger.error(f"AI Logic Error: {e}")
+    MQTT_CONSUMED.inc()
 
-def analyze_performance(duration, client):
-    global ai_insights, system_health_score, travel_times
-    if not travel_times:
-        travel_times.append(duration)
-        return
-
-    avg_time = sum(travel_times) / len(travel_times)
-    if duration > (avg_time * AI_THRESHOLD):
-        system_health_score = max(0, system_health_score - 10)
-        ai_insights = f"⚠️ ANOMALÍA: Viaje lento ({duration:.1f}s vs avg {avg_time:.1f}s)."
-        client.publish("enterprise/alarms", json.dumps({
-            "event": "alarm.predictive",
-            "data": {"code": "PRED_MECH_WEAR", "message": ai_insights, "severity": "WARNING"},
-            "timestamp": datetime.now().isoformat()
-        }))
-    else:
-        system_health_score = min(100, system_health_score + 2)
-        ai_insights = "Estado óptimo: Patrones consistentes."
-    
-    travel_times.append(duration)
-    if len(travel_times) > 50: travel_times.pop(0)
+def publish_anomaly(trip, client):
+    message = engine.analyzers[trip["asset"]].insights
+    client.publish("enterprise/alarms", json.dumps({
+        "event": "alarm.predictive",
+        "data": {"code": "PRED_MECH_WEAR", "message": message, "severity": "WARNING", "asset": trip["asset"],
+                 "direction": trip["direction"], "zscore": round(trip["z"], 2)},
+        "timestamp": datetime.now().isoformat()
+    }))
 
 mqtt_client.on_connect = on_connect
 mqtt_client.on_message = on_message
 
+# --- PLC metrics scrape ---
+def parse_plc_metrics(text):
+    """plc-service exposition -> {asset: (motor temperature, work cycles)}"""
+    temps, cycles = {}, {}
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            if sample.name == "plc_motor_temperature_celsius": temps[sample.labels["asset"]] = sample.value
+            elif sample.name == "plc_work_cycles_total": cycles[sample.labels["asset"]] = sample.value
+    return {asset: (temps.get(asset), cycles.get(asset)) for asset in temps.keys() | cycles.keys()}
+
+async def scrape_plc_metrics():
+    async with httpx.AsyncClient(timeout=5.0) as client:
+        while True:
+            try:
+                r = await client.get(f"{PLC_URL}/metrics/")
+                r.raise_for_status()
+                now = datetime.now().timestamp()
+                for asset, (temperature, cycles) in parse_plc_metrics(r.text).items():
+                    forecaster.on_metrics(asset, temperature, cycles, now)
+            except (httpx.HTTPError, ValueError) as e:
+                logger.warning(f"⚠️ No se pudieron leer métricas del PLC: {e}")
+            await asyncio.sleep(PLC_SCRAPE_INTERVAL)
+
 # --- App ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    model = training.load_model(AI_MODEL_PATH)
+    if model:
+        logger.info(f"📦 Modelo {AI_MODEL_PATH} ({model['trained_at']}) cargado: {engine.seed(model)}")
     mqtt_client.connect(MQTT_BROKER, 1883, 60)
     mqtt_client.loop_start()
+    scraper = asyncio.create_task(scrape_plc_metrics())
     yield
+    scraper.cancel()
     mqtt_client.loop_stop()
 
 app = FastAPI(title="Enterprise AI Analytics", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"])
+app.mount("/metrics", make_asgi_app())
 
 @app.get("/ai/status")
-async def get_ai_status():
-    return {
-        "health_score": system_health_score,
-        "insights": ai_insights,
-        "avg_travel_time": round(sum(travel_times)/len(travel_times), 2) if travel_times else 0
-    }
+async def get_ai_status(asset: Optional[str] = None):
+    """One asset, or by default the asset in the worst health."""
+    analyzer = engine.analyzers.get(asset) if asset else engine.worst()
+    if analyzer is None:
+        if asset: raise HTTPException(status_code=404, detail=f"No trips seen for asset {asset}")
+        return {"health_score": 100, "insights": "Analizando patrones de motor...", "avg_travel_time": 0}
+    return {"asset": analyzer.asset, **analyzer.snapshot()}
+
+@app.get("/ai/assets")
+async def get_ai_assets():
+    return {asset: analyzer.snapshot() for asset, analyzer in list(engine.analyzers.items())}
+
+@app.get("/ai/forecast")
+async def get_ai_forecast(asset: Optional[str] = None):
+    """Remaining useful life per asset, served from the precomputed cache."""
+    if asset is None: return forecaster.all()
+    forecast = forecaster.get(asset)
+    if forecast is None: raise HTTPException(status_code=404, detail=f"No forecast yet for asset {asset}")
+    return forecast
+
+@app.get("/ai/model")
+async def get_ai_model():
+    model = training.load_model(AI_MODEL_PATH)
+    if model is None: raise HTTPException(status_code=404, detail="No trained model")
+    return model
+
+@app.post("/ai/train")
+async def train_model(hours: float = 24.0):
+    """Fits baselines on the last `hours` of historian telemetry, rescores
+    that history, saves the model and seeds the live engine with it."""
+    if training_lock.locked(): raise HTTPException(status_code=409, detail="Training already running")
+    async with training_lock:
+        try:
+            model = await asyncio.to_thread(training.train, HISTORIAN_URL, HISTORIAN_ASSET, hours, AI_MODEL_PATH,
+                                            AI_CONFIG["z_threshold"], AI_CONFIG["min_rel_std"])
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=502, detail=f"Historian unavailable: {e}")
+    engine.seed({"assets": {HISTORIAN_ASSET: model["assets"][HISTORIAN_ASSET]}})
+    return {"asset": HISTORIAN_ASSET, "trained_at": model["trained_at"], **model["assets"][HISTORIAN_ASSET]}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,137 @@
+"""O(1)-per-sample statistics for the trip-time anomaly engine."""
+import math
+
+class Welford:
+    """Running mean/variance (Welford 1962), numerically stable, no history kept."""
+    __slots__ = ("n", "mean", "m2")
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+class EWMA:
+    """Exponentially weighted mean and variance; `alpha` is the weight of the newest sample."""
+    __slots__ = ("alpha", "mean", "var", "n")
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.mean = None
+        self.var = 0.0
+        self.n = 0
+
+    def update(self, x):
+        self.n += 1
+        if self.mean is None:
+            self.mean = x
+            return
+        delta = x - self.mean
+        self.mean += self.alpha * delta
+        self.var = (1 - self.alpha) * (self.var + self.alpha * delta * delta)
+
+class P2Quantile:
+    """Streaming quantile estimate with five markers (Jain & Chlamtac P²):
+    constant memory and time per sample, exact for the first five."""
+    __slots__ = ("p", "q", "pos", "want", "step")
+    def __init__(self, p):
+        self.p = p
+        self.q = []
+        self.pos = [1, 2, 3, 4, 5]
+        self.want = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.step = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def update(self, x):
+        q = self.q
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+        for i in range(k + 1, 5):
+            self.pos[i] += 1
+        for i in range(5):
+            self.want[i] += self.step[i]
+        for i in (1, 2, 3):
+            d = self.want[i] - self.pos[i]
+            if (d >= 1 and self.pos[i + 1] - self.pos[i] > 1) or (d <= -1 and self.pos[i - 1] - self.pos[i] < -1):
+                d = 1 if d > 0 else -1
+                candidate = self._parabolic(i, d)
+                if not q[i - 1] < candidate < q[i + 1]:
+                    candidate = q[i] + d * (q[i + d] - q[i]) / (self.pos[i + d] - self.pos[i])
+                q[i] = candidate
+                self.pos[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.q, self.pos
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    @property
+    def value(self):
+        if not self.q: return None
+        if len(self.q) < 5:
+            return sorted(self.q)[min(len(self.q) - 1, int(self.p * len(self.q)))]
+        return self.q[2]
+
+class DecayingTrend:
+    """Weighted least-squares line through (x, y) where a sample's weight
+    halves every `half_life` units of x. The sums are kept relative to the
+    newest x, so `level` is the fitted value now and they stay well
+    conditioned however long the stream runs."""
+    __slots__ = ("half_life", "origin", "n", "sw", "sx", "sy", "sxx", "sxy")
+    def __init__(self, half_life):
+        self.half_life = half_life
+        self.origin = None
+        self.n = 0
+        self.sw = self.sx = self.sy = self.sxx = self.sxy = 0.0 # weighted sums of 1, x, y, x², xy
+
+    def update(self, x, y):
+        if self.origin is None: self.origin = x
+        dx = x - self.origin
+        if dx > 0:
+            k = 0.5 ** (dx / self.half_life)
+            sw, sx, sy = self.sw * k, self.sx * k, self.sy * k
+            # Move the origin to x: every stored offset shifts by -dx
+            self.sxx = (self.sxx - 2 * dx * self.sx + dx * dx * self.sw) * k
+            self.sxy = (self.sxy - dx * self.sy) * k
+            self.sw, self.sx, self.sy = sw, sx - dx * sw, sy
+            self.origin, dx = x, 0.0
+        self.n += 1
+        self.sw += 1.0
+        self.sx += dx
+        self.sy += y
+        self.sxx += dx * dx
+        self.sxy += dx * y
+
+    @property
+    def slope(self):
+        denom = self.sw * self.sxx - self.sx * self.sx
+        return (self.sw * self.sxy - self.sx * self.sy) / denom if denom > 1e-12 * self.sw * self.sw else 0.0
+
+    @property
+    def level(self):
+        return (self.sy - self.slope * self.sx) / self.sw if self.sw else None
+
+    def time_to(self, threshold):
+        """x distance from the newest sample until the line reaches `threshold`
+        (0 if already past it), or None if it is not heading there."""
+        level, slope = self.level, self.slope
+        if level is None: return None
+        if level >= threshold: return 0.0
+        return (threshold - level) / slope if slope > 0 else None
@@ -0,0 +1,64 @@
+"""Compact wire format for enterprise/<machine>/state.
+
+The whole machine state is the DB_Elevador_Interface byte plus the car
+position, so the binary frame is fixed-size (18 bytes):
+
+    version:u8 | bits:u8 | pos:f32 | ts_ms:u64 | seq:u32   (little-endian)
+
+Bit order matches the PLC data block (bit 0 = bp1 ... bit 7 = l2), so the
+producer can copy the DB byte straight into the frame.
+
+Binary frames travel on the JSON topic plus BINARY_SUFFIX; subscribers opt
+in by subscribing to that topic. This file is shared verbatim by every
+service that publishes or consumes machine state; keep the copies in sync.
+"""
+import json
+import struct
+from datetime import datetime
+
+FRAME = struct.Struct("<BBfQI")
+VERSION = 1
+BINARY_SUFFIX = "/bin"
+TAGS = ("bp1", "bp2", "ls1", "ls2", "mc1", "mc2", "l1", "l2")
+
+def pack_bits(state):
+    bits = 0
+    for i, tag in enumerate(TAGS):
+        if state.get(tag): bits |= 1 << i
+    return bits
+
+# Every possible DB byte decoded once, so unpacking is a table lookup
+_BIT_TABLE = [tuple(bool(b >> i & 1) for i in range(len(TAGS))) for b in range(256)]
+
+def unpack_bits(bits):
+    return dict(zip(TAGS, _BIT_TABLE[bits]))
+
+def encode_state(bits, pos, ts_ms, seq):
+    return FRAME.pack(VERSION, bits, pos, ts_ms, seq & 0xFFFFFFFF)
+
+def decode_state(payload):
+    version, bits, pos, ts_ms, seq = FRAME.unpack(payload)
+    if version != VERSION:
+        raise ValueError(f"Unsupported telemetry frame version {version}")
+    state = unpack_bits(bits)
+    state["pos"] = round(pos, 3)
+    return state, ts_ms, seq
+
+def state_topic(base, binary):
+    return base + BINARY_SUFFIX if binary else base
+
+def is_binary_topic(topic):
+    return topic.endswith(BINARY_SUFFIX)
+
+def decode_message(topic, payload):
+    """Returns the JSON event envelope for either wire format, so consumers
+    keep a single code path."""
+    if not is_binary_topic(topic):
+        return json.loads(payload.decode() if isinstance(payload, (bytes, bytearray)) else payload)
+    state, ts_ms, seq = decode_state(payload)
+    return {
+        "event": "machine.state.changed",
+        "data": state,
+        "timestamp": datetime.fromtimestamp(ts_ms / 1000).isoformat(),
+        "seq": seq
+    }
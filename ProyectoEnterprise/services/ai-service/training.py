@@ -0,0 +1,197 @@
+"""Offline training of per-asset trip baselines from historian telemetry.
+
+Telemetry is pulled from the historian in time windows, kept as NumPy
+columns, segmented into trips and motor duty cycles with vectorized
+operations, and summarised into a JSON model file that the service loads
+at startup to seed its streaming engine.
+
+    python training.py --hours 168            # train and write AI_MODEL_PATH
+"""
+import json
+import logging
+import os
+import time
+from datetime import datetime
+import httpx
+import numpy as np
+
+logger = logging.getLogger("ai-service.training")
+
+MODEL_VERSION = 1
+DIRECTIONS = {1: "up", 2: "down"}
+
+# --- Fetch ---
+def fetch_telemetry(base_url, start_ms, end_ms, window_ms=600_000, chunk_rows=50_000, client=None):
+    """Returns (ts, pos, mc1, mc2) arrays, oldest first, pulled from
+    /history/telemetry one window at a time. Rows come back newest first,
+    so a window that hits the row limit is complete down to its oldest
+    timestamp; the rest of it is fetched as the next page."""
+    own = client is None
+    client = client or httpx.Client(timeout=60.0)
+    chunks = []
+    try:
+        for lo in range(start_ms, end_ms, window_ms):
+            hi, pages = min(lo + window_ms, end_ms), []
+            while hi > lo:
+                r = client.get(f"{base_url}/history/telemetry", params={"from": lo, "to": hi, "limit": chunk_rows})
+                r.raise_for_status()
+                rows = r.json()
+                if len(rows) < chunk_rows:
+                    pages.append(rows)
+                    break
+                # Rows sharing the oldest timestamp may be cut by the limit: re-read them with the next page
+                oldest = rows[-1]["ts"]
+                if rows[0]["ts"] == oldest: # a whole page of one timestamp, cannot page any further
+                    pages.append(rows)
+                    hi = oldest
+                    continue
+                pages.append([row for row in rows if row["ts"] > oldest])
+                hi = oldest + 1
+            rows = [row for page in reversed(pages) for row in reversed(page)] # oldest first
+            if rows: chunks.append(_columns(rows))
+    finally:
+        if own: client.close()
+    if not chunks: return np.empty(0, np.int64), np.empty(0, np.float32), np.empty(0, np.bool_), np.empty(0, np.bool_)
+    return tuple(np.concatenate(col) for col in zip(*chunks))
+
+def _columns(rows):
+    n = len(rows)
+    return (np.fromiter((row["ts"] for row in rows), np.int64, n),
+            np.fromiter((row["position"] or 0.0 for row in rows), np.float32, n),
+            np.fromiter((bool(row["mc1"]) for row in rows), np.bool_, n),
+            np.fromiter((bool(row["mc2"]) for row in rows), np.bool_, n))
+
+# --- Vectorized segmentation ---
+def segment_trips(ts, mc1, mc2, min_trip_ms=1000, max_trip_ms=120_000):
+    """Trips are runs of constant contactor state with one contactor on; a
+    trip lasts from its first sample to the first sample of the next run.
+    Returns (start_ts, duration_s, direction) with direction 1 = up, 2 = down.
+    Runs cut by a data gap show up as implausibly long and are dropped."""
+    if len(ts) < 2:
+        return np.empty(0, np.int64), np.empty(0), np.empty(0, np.int8)
+    state = mc1.astype(np.int8) + 2 * mc2.astype(np.int8)
+    change = np.flatnonzero(state[1:] != state[:-1]) + 1
+    starts = np.concatenate(([0], change[:-1])) if len(change) else np.empty(0, np.int64)
+    ends = change # each run ends where the next one starts; the final, open run is skipped
+    direction = state[starts]
+    duration = (ts[ends] - ts[starts])
+    keep = ((direction == 1) | (direction == 2)) & (duration >= min_trip_ms) & (duration <= max_trip_ms)
+    return ts[starts][keep], duration[keep] / 1000.0, direction[keep]
+
+def duty_cycles(ts, mc1, mc2, bucket_ms=3_600_000, max_gap_ms=5_000):
+    """Fraction of each bucket (default hourly) with a contactor energized.
+    Each sample's state is held until the next sample, capped at
+    `max_gap_ms` so outages do not count as running or idle time."""
+    if len(ts) < 2: return np.empty(0, np.int64), np.empty(0)
+    dt = np.minimum(np.diff(ts), max_gap_ms).astype(np.float64)
+    on = (mc1[:-1] | mc2[:-1]).astype(np.float64)
+    bucket = (ts[:-1] - ts[0]) // bucket_ms
+    covered = np.bincount(bucket, weights=dt)
+    running = np.bincount(bucket, weights=dt * on)
+    seen = covered > 0
+    return ts[0] + np.flatnonzero(seen) * bucket_ms, running[seen] / covered[seen]
+
+# --- Fit / score ---
+def fit_baselines(durations, directions, min_trips=5):
+    """Per-direction robust baseline: trips beyond 5 MADs of the median are
+    treated as faults and left out of mean/std."""
+    model = {}
+    for code, name in DIRECTIONS.items():
+        d = durations[directions == code]
+        if len(d) < min_trips: continue
+        median = float(np.median(d))
+        mad = float(np.median(np.abs(d - median))) * 1.4826
+        normal = d[np.abs(d - median) <= 5 * mad] if mad > 0 else d
+        model[name] = {
+            "n": int(len(normal)),
+            "mean": float(normal.mean()),
+            "std": float(normal.std(ddof=1)) if len(normal) > 1 else 0.0,
+            "p50": median,
+            "p95": float(np.percentile(d, 95)),
+            "excluded": int(len(d) - len(normal))
+        }
+    return model
+
+def rescore(durations, directions, baselines, min_rel_std=0.02):
+    """z-score of every trip against the fitted baseline (same formula as the
+    streaming engine); returns the z array (NaN where no baseline)."""
+    z = np.full(len(durations), np.nan)
+    for code, name in DIRECTIONS.items():
+        b = baselines.get(name)
+        if not b: continue
+        mask = directions == code
+        std = max(b["std"], min_rel_std * b["mean"])
+        if std > 0: z[mask] = (durations[mask] - b["mean"]) / std
+    return z
+
+def train_asset(ts, mc1, mc2, z_threshold=3.0, min_rel_std=0.02):
+    timings = {}
+    t0 = time.perf_counter()
+    starts, durations, directions = segment_trips(ts, mc1, mc2)
+    timings["segment_s"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    _, duty = duty_cycles(ts, mc1, mc2)
+    timings["duty_s"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    baselines = fit_baselines(durations, directions)
+    timings["fit_s"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    z = rescore(durations, directions, baselines, min_rel_std)
+    timings["rescore_s"] = time.perf_counter() - t0
+    anomalous = np.flatnonzero(z > z_threshold)
+    worst = anomalous[np.argsort(z[anomalous])[::-1][:10]]
+    return {
+        **baselines,
+        "duty": {"hours": int(len(duty)), "mean": float(duty.mean()) if len(duty) else 0.0,
+                 "p95": float(np.percentile(duty, 95)) if len(duty) else 0.0},
+        "rescore": {
+            "samples": int(len(ts)), "trips": int(len(durations)), "anomalies": int(len(anomalous)),
+            "worst": [{"ts": int(starts[i]), "direction": DIRECTIONS[int(directions[i])],
+                       "duration": round(float(durations[i]), 3), "z": round(float(z[i]), 2)} for i in worst]
+        },
+        "timings": {k: round(v, 4) for k, v in timings.items()}
+    }
+
+# --- Model file ---
+def save_model(path, assets, span):
+    model = {"version": MODEL_VERSION, "trained_at": datetime.now().isoformat(), "span": span, "assets": assets}
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(model, f, indent=1)
+    os.replace(tmp, path)
+    return model
+
+def load_model(path):
+    if not os.path.exists(path): return None
+    with open(path, encoding="utf-8") as f:
+        model = json.load(f)
+    if model.get("version") != MODEL_VERSION:
+        logger.warning(f"⚠️ Modelo {path} con versión {model.get('version')}, se ignora")
+        return None
+    return model
+
+def train(base_url, asset, hours, model_path, z_threshold=3.0, min_rel_std=0.02):
+    """Full batch run for one asset: fetch, train, rescore, persist."""
+    end = int(time.time() * 1000)
+    start = end - int(hours * 3_600_000)
+    t0 = time.perf_counter()
+    ts, _, mc1, mc2 = fetch_telemetry(base_url, start, end)
+    fetch_s = time.perf_counter() - t0
+    result = train_asset(ts, mc1, mc2, z_threshold, min_rel_std)
+    result["timings"]["fetch_s"] = round(fetch_s, 4)
+    existing = load_model(model_path) or {"assets": {}}
+    assets = {**existing["assets"], asset: result}
+    return save_model(model_path, assets, {"from": start, "to": end})
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Train ai-service trip baselines from the historian")
+    parser.add_argument("--historian", default=os.getenv("HISTORIAN_URL", "http://historian-service:8003"))
+    parser.add_argument("--asset", default=os.getenv("HISTORIAN_ASSET", "machine"))
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--model", default=os.getenv("AI_MODEL_PATH", "ai_model.json"))
+    args = parser.parse_args()
+    model = train(args.historian, args.asset, args.hours, args.model)
+    summary = model["assets"][args.asset]
+    logger.info(f"✅ {args.asset}: {summary['rescore']['trips']} viajes, {summary['rescore']['anomalies']} anomalías -> {args.model} {summary['timings']}")
@@ -0,0 +1,70 @@
+import logging
+import random
+import statistics
+import sys
+import threading
+import time
+from unittest.mock import MagicMock
+from timers import TimerHeap
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("timer-bench")
+logging.getLogger("alarm-service").setLevel(logging.CRITICAL)
+
+def bench_churn(assets, n):
+    """Stale-timer pattern: every message re-arms its asset's timer (schedule
+    replaces), so the heap mostly holds tombstones that must stay bounded."""
+    timers = TimerHeap()
+    start = time.perf_counter()
+    for i in range(n):
+        timers.schedule((f"m{i % assets}", "stale"), 60.0, lambda: None)
+    elapsed = time.perf_counter() - start
+    logger.info(f"re-arm     {n / elapsed:12,.0f} schedules/s  live={len(timers)} heap={len(timers.heap)}")
+
+def bench_firing(count, spread):
+    """`count` timers with random deadlines over `spread` seconds; measures
+    how late each fires while the heap is at its largest."""
+    lateness, done = [], threading.Event()
+    lock = threading.Lock()
+    def fire(deadline):
+        lateness.append(time.monotonic() - deadline)
+        if len(lateness) == count: done.set()
+    timers = TimerHeap(lock)
+    timers.start()
+    start = time.perf_counter()
+    for i in range(count):
+        delay = 0.5 + random.random() * spread
+        timers.schedule(("bench", i), delay, fire, time.monotonic() + delay)
+    logger.info(f"schedule   {count / (time.perf_counter() - start):12,.0f} timers/s  pending={len(timers)}")
+    done.wait(spread + 5)
+    timers.stop()
+    lateness.sort()
+    logger.info(f"fired {len(lateness)}/{count}  lateness p50 {statistics.median(lateness) * 1000:.2f} ms  "
+                f"p99 {lateness[int(len(lateness) * 0.99) - 1] * 1000:.2f} ms  max {lateness[-1] * 1000:.2f} ms")
+
+def bench_engine(assets, seconds):
+    """Whole engine: every asset moving (on-delay timers pending) with no
+    messages after the first few, so only the timer thread raises alarms."""
+    import main
+    engine = main.AlarmEngine(main.load_rules(main.ALARM_RULES), MagicMock(), 2.0, main.AlarmHistory(assets * 4),
+                              MagicMock(), main.AlarmFilter())
+    engine.timers.start()
+    state = dict(bp1=True, bp2=False, ls1=False, ls2=False, mc1=True, mc2=False, l1=False, l2=False, pos=0.5)
+    start = time.perf_counter()
+    for a in range(assets):
+        engine.check_logic(f"m{a}", state)
+        engine.check_logic(f"m{a}", state)
+    logger.info(f"{assets} assets  {2 * assets / (time.perf_counter() - start):,.0f} msgs/s  pending timers={len(engine.timers)}")
+    time.sleep(seconds)
+    engine.timers.stop()
+    by_code = {}
+    for asset, code in engine.active_alarms:
+        by_code[code] = by_code.get(code, 0) + 1
+    logger.info(f"raised without messages after {seconds:g}s: {by_code}")
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    assets = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    bench_churn(assets, count * 5)
+    bench_firing(count, 3.0)
+    bench_engine(assets, 3.5)
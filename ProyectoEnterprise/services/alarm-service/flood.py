@@ -0,0 +1,65 @@
+from collections import deque
+from prometheus_client import Counter, Gauge
+
+# --- PROMETHEUS METRICS ---
+ALARM_NOTIFICATIONS = Counter('alarm_notifications_total', 'Raised alarms by delivery outcome (published or the suppression reason)', ['result'])
+ALARMS_SHELVED = Gauge('alarm_shelved', 'Alarms currently shelved by an operator')
+
+class AlarmFilter:
+    """ISA-18.2 style flood handling, deciding in O(1) whether a raised alarm
+    is announced (published on MQTT) or only recorded. In order:
+
+    - shelved:      an operator shelved this asset/code until an expiry
+    - grouped:      its parent alarm is already active on the same asset
+    - chattering:   it was raised `chatter_count` times within `chatter_window` s
+    - rate_limited: its code exceeded `rate_per_min` announcements fleet-wide
+                    (token bucket with `burst`)
+
+    Severities in `exempt` skip chatter and rate limiting; shelving and
+    grouping still apply, since both are explicit decisions."""
+    def __init__(self, rate_per_min=10.0, burst=5, chatter_count=5, chatter_window=60.0, exempt=("CRITICAL",)):
+        self.rate = rate_per_min / 60.0
+        self.burst = burst
+        self.chatter_count = chatter_count
+        self.chatter_window = chatter_window
+        self.exempt = set(exempt)
+        self.buckets = {}  # code -> [tokens, last refill]
+        self.raises = {}   # (asset, code) -> times of its last `chatter_count` raises
+        self.shelved = {}  # (asset, code) -> {"until": epoch s, "reason": str}
+        ALARMS_SHELVED.set_function(lambda: len(self.shelved))
+
+    def check(self, asset, code, severity, parent_active, now):
+        """Returns None to publish, else the suppression reason."""
+        key = (asset, code)
+        chattering = self._record_raise(key, now)
+        if key in self.shelved: reason = "shelved"
+        elif parent_active: reason = "grouped"
+        elif severity in self.exempt: reason = None
+        elif chattering: reason = "chattering"
+        elif not self._take_token(code, now): reason = "rate_limited"
+        else: reason = None
+        ALARM_NOTIFICATIONS.labels(result=reason or "published").inc()
+        return reason
+
+    def _record_raise(self, key, now):
+        times = self.raises.get(key)
+        if times is None:
+            times = self.raises[key] = deque(maxlen=self.chatter_count)
+        times.append(now)
+        return len(times) == self.chatter_count and now - times[0] <= self.chatter_window
+
+    def _take_token(self, code, now):
+        bucket = self.buckets.get(code)
+        if bucket is None:
+            bucket = self.buckets[code] = [float(self.burst), now]
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] < 1.0: return False
+        bucket[0] -= 1.0
+        return True
+
+    def shelve(self, asset, code, until, reason):
+        self.shelved[(asset, code)] = {"asset": asset, "code": code, "until": until, "reason": reason}
+
+    def unshelve(self, asset, code):
+        return self.shelved.pop((asset, code), None)
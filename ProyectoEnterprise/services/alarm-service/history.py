@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+from collections import deque
+
+logger = logging.getLogger("alarm-service.history")
+
+class AlarmHistory:
+    """Fixed-capacity ring of alarm events, newest overwriting oldest in O(1).
+    Every event gets a sequence number; event `seq` lives in slot
+    seq % capacity. Per-code, per-severity and per-asset deques of sequence
+    numbers serve filtered queries without scanning unrelated events, and are
+    trimmed from the left as the ring overwrites."""
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.next_seq = 0
+        self.indexes = {"code": {}, "severity": {}, "asset": {}}
+
+    def __len__(self):
+        return min(self.next_seq, self.capacity)
+
+    def oldest_seq(self):
+        return max(0, self.next_seq - self.capacity)
+
+    def append(self, evt):
+        seq = self.next_seq
+        evicted = self.slots[seq % self.capacity]
+        if evicted is not None:
+            for field, index in self.indexes.items():
+                ids = index[evicted[field]]
+                ids.popleft() # the oldest entry of each of its indexes is the evicted event
+                if not ids: del index[evicted[field]]
+        evt["seq"] = seq
+        self.slots[seq % self.capacity] = evt
+        for field, index in self.indexes.items():
+            index.setdefault(evt[field], deque()).append(seq)
+        self.next_seq += 1
+        return evt
+
+    def get(self, seq):
+        if self.oldest_seq() <= seq < self.next_seq:
+            return self.slots[seq % self.capacity]
+        return None
+
+    def query(self, code=None, severity=None, asset=None, start=None, end=None, before=None, limit=100):
+        """Newest first. `start`/`end` are epoch ms on the event's `ts`;
+        `before` is an exclusive seq cursor for paging (pass the last seq of
+        the previous page)."""
+        filters = {k: v for k, v in (("code", code), ("severity", severity), ("asset", asset)) if v is not None}
+        upper = self.next_seq if before is None else min(before, self.next_seq)
+        if filters:
+            # Walk the most selective index; check the remaining filters per event
+            candidates = min((self.indexes[k].get(v, ()) for k, v in filters.items()), key=len)
+            seqs = (s for s in reversed(candidates) if s < upper)
+        else:
+            seqs = range(upper - 1, self.oldest_seq() - 1, -1)
+        page = []
+        for seq in seqs:
+            evt = self.slots[seq % self.capacity]
+            if end is not None and evt["ts"] > end: continue
+            if start is not None and evt["ts"] < start: break # older events only get older
+            if any(evt[k] != v for k, v in filters.items()): continue
+            page.append(evt)
+            if len(page) >= limit: break
+        return page
+
+    def events(self):
+        return [self.slots[s % self.capacity] for s in range(self.oldest_seq(), self.next_seq)]
+
+class AlarmJournal:
+    """Append-only JSON-lines log of alarm transitions, replayed on startup
+    to rebuild the history ring and the active alarm set. Records are
+    {"op": "raised", "evt": {...}}, {"op": "cleared", "asset", "code",
+    "cleared_at"}, {"op": "shelved", "asset", "code", "until", "reason"} or
+    {"op": "unshelved", "asset", "code"}. `compact` rewrites it atomically
+    with only what the ring, the active set and the shelves still need."""
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self.lines = 0
+        self.file = None
+
+    def replay(self):
+        if not os.path.exists(self.path): return
+        with open(self.path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-write; everything before it is intact
+                    logger.warning(f"⚠️ Journal {self.path}: línea {number} ilegible, ignorada")
+
+    def open(self):
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def append(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        if self.fsync: os.fsync(self.file.fileno())
+        self.lines += 1
+
+    def compact(self, events, active, extra=()):
+        """Rewrites the journal as one "raised" record per retained event
+        (cleared ones carry cleared_at) plus active alarms that have already
+        left the ring, followed by `extra` records (e.g. current shelves)."""
+        in_ring = {id(e) for e in events}
+        evicted = [e for e in active if id(e) not in in_ring]
+        records = [{"op": "raised", "evt": e} for e in evicted + events] + list(extra)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if self.file: self.file.close()
+        os.replace(tmp, self.path)
+        self.lines = len(records)
+        self.open()
+
+    def close(self):
+        if self.file: self.file.close()
@@ -3,12 +3,20 @@ import logging
 import os
 import time
 from datetime import datetime
-from threading import Thread
+from typing import Optional
+from threading import Thread, RLock
 from contextlib import asynccontextmanager
 import paho.mqtt.client as mqtt
+import telemetry_codec
 import httpx
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
+from prometheus_client import Counter, make_asgi_app
+from rules import AssetEvaluator, load_rules
+from timers import TimerHeap
+from history import AlarmHistory, AlarmJournal
+from flood import AlarmFilter
 
 # --- Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -18,86 +26,221 @@ logger = logging.getLogger("alarm-service")
 MQTT_BROKER = os.getenv("MQTT_BROKER", "127.0.0.1")
 MQTT_PORT = 1883
 PLC_SERVICE_URL = os.getenv("PLC_SERVICE_URL", "http://plc-service:8000")
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "json") # json | binary
+# Every asset's state (plc-service publishes enterprise/<asset>/state)
+STATE_TOPIC = telemetry_codec.state_topic("enterprise/+/state", WIRE_FORMAT == "binary")
+ALARM_RULES = os.getenv("ALARM_RULES", "rules.json")
+# Seconds without any state message before an asset is alarmed as stale (plc-service heartbeats every 1 s; 0 disables)
+STALE_AFTER = float(os.getenv("ALARM_STALE_AFTER", "3.0"))
+STALE_CODE = "ERR_STALE_DATA"
+HISTORY_SIZE = int(os.getenv("ALARM_HISTORY_SIZE", "10000"))
+JOURNAL_PATH = os.getenv("ALARM_JOURNAL", "alarms.journal")
+JOURNAL_FSYNC = os.getenv("ALARM_JOURNAL_FSYNC", "false").lower() == "true"
+# Flood handling: announcements per code per minute (fleet-wide), chatter = N raises within a window
+RATE_PER_MIN = float(os.getenv("ALARM_RATE_PER_MIN", "10"))
+RATE_BURST = int(os.getenv("ALARM_RATE_BURST", "5"))
+CHATTER_COUNT = int(os.getenv("ALARM_CHATTER_COUNT", "5"))
+CHATTER_WINDOW = float(os.getenv("ALARM_CHATTER_WINDOW", "60"))
+SHELVE_MAX = float(os.getenv("ALARM_SHELVE_MAX", str(8 * 3600)))
+
+# --- PROMETHEUS METRICS ---
+ALARM_TRANSITIONS = Counter('alarm_transitions_total', 'Alarm raise/clear transitions', ['code', 'transition'])
+MQTT_CONSUMED = Counter('mqtt_messages_consumed_total', 'MQTT messages handled by on_message')
 
 # --- Alarm Engine Logic ---
 class AlarmEngine:
-    def __init__(self):
+    """Runs the declarative rule set against each asset's state stream. Rule
+    delays, stale-data supervision and shelve expiry run on a timer thread,
+    independent of message arrival; `lock` serialises it with the MQTT thread.
+    Every raised alarm is recorded; `alarm_filter` decides which are announced."""
+    def __init__(self, rules, client, stale_after, history, journal, alarm_filter):
+        self.rules = rules
+        self.rule_codes = {rule.code for rule in rules}
+        unknown = {r.parent for r in rules if r.parent} - self.rule_codes - {STALE_CODE}
+        if unknown:
+            raise ValueError(f"Unknown parent alarm codes: {sorted(unknown)}")
+        self.client = client
+        self.stale_after = stale_after
+        self.lock = RLock()
+        self.timers = TimerHeap(self.lock)
+        self.evaluators = {}
         self.active_alarms = {}
-        self.history = []
-        self.last_mc1 = False
-        self.last_mc2 = False
-        self.move_start_time = None
+        self.stale_deadlines = {} # asset -> monotonic deadline of its armed stale timer
+        self.history = history
+        self.journal = journal
+        self.filter = alarm_filter
+
+    def publish(self, event, data):
+        try:
+            self.client.publish("enterprise/alarms", json.dumps({
+                "event": event,
+                "data": data,
+                "timestamp": datetime.now().isoformat()
+            }))
+        except: pass
+
+    def restore(self):
+        """Rebuilds history and active alarms from the journal, then compacts it."""
+        with self.lock:
+            for record in self.journal.replay():
+                if record.get("op") == "raised":
+                    evt = self.history.append(record["evt"])
+                    if "cleared_at" not in evt:
+                        self.active_alarms[(evt["asset"], evt["code"])] = evt
+                elif record.get("op") == "cleared":
+                    evt = self.active_alarms.pop((record["asset"], record["code"]), None)
+                    if evt: evt["cleared_at"] = record["cleared_at"]
+                elif record.get("op") == "shelved":
+                    self.filter.shelve(record["asset"], record["code"], record["until"], record["reason"])
+                elif record.get("op") == "unshelved":
+                    self.filter.unshelve(record["asset"], record["code"])
+            now = time.time()
+            for shelf in list(self.filter.shelved.values()):
+                if shelf["until"] <= now:
+                    self.filter.unshelve(shelf["asset"], shelf["code"])
+                else:
+                    self.timers.schedule(("shelve", shelf["asset"], shelf["code"]), shelf["until"] - now, self.unshelve, shelf["asset"], shelf["code"])
+            self.compact()
+            # Restored assets that never report again still go stale
+            for asset in {a for a, _ in self.active_alarms}:
+                if self.stale_after > 0:
+                    self.stale_deadlines[asset] = self.timers.schedule((asset, STALE_CODE), self.stale_after, self.on_stale, asset)
+        logger.info(f"📚 Journal: {len(self.history)} alarmas en historial, {len(self.active_alarms)} activas restauradas")
+
+    def compact(self):
+        shelves = [{"op": "shelved", **shelf} for shelf in self.filter.shelved.values()]
+        self.journal.compact(self.history.events(), list(self.active_alarms.values()), shelves)
 
-    def trigger_alarm(self, code, message, severity, client):
-        if code not in self.active_alarms:
+    def write_journal(self, record):
+        """Journals one transition, compacting once the log holds well over
+        what a compaction keeps, whichever transition pushed it there."""
+        self.journal.append(record)
+        if self.journal.lines > 2 * self.history.capacity + len(self.active_alarms) + len(self.filter.shelved):
+            self.compact()
+
+    def active_parent(self, asset, code, parent):
+        if parent and (asset, parent) in self.active_alarms: return parent
+        # Nothing derived from an asset's data is trustworthy while that data is stale
+        if code != STALE_CODE and (asset, STALE_CODE) in self.active_alarms: return STALE_CODE
+        return None
+
+    def trigger_alarm(self, asset, code, message, severity, parent=None):
+        if (asset, code) not in self.active_alarms:
+            now = time.time()
+            active_parent = self.active_parent(asset, code, parent)
+            suppressed = self.filter.check(asset, code, severity, active_parent is not None, now)
             evt = {
                 "code": code,
                 "message": message,
                 "severity": severity,
-                "timestamp": datetime.now().isoformat()
+                "asset": asset,
+                "timestamp": datetime.now().isoformat(),
+                "ts": int(now * 1000)
             }
-            self.active_alarms[code] = evt
-            self.history.insert(0, evt)
-            if len(self.history) > 100: self.history.pop()
-            
-            logger.error(f"🚨 {message}")
-            try:
-                client.publish("enterprise/alarms", json.dumps({
-                    "event": "alarm",
-                    "data": evt,
-                    "timestamp": datetime.now().isoformat()
-                }))
-            except: pass
-
-    def clear_alarm(self, code, client):
-        if code in self.active_alarms:
-            logger.info(f"✅ Alarma Recuperada: {code}")
-            del self.active_alarms[code]
-
-    def check_logic(self, state, client):
-        mc1 = state.get("mc1", False)
-        mc2 = state.get("mc2", False)
-        ls1 = state.get("ls1", False)
-        ls2 = state.get("ls2", False)
-
-        # 1. Interlocking Protection (Critical)
-        if mc1 and mc2:
-            self.trigger_alarm("ERR_INTERLOCK", "Conflicto de Contactor: MC1 y MC2 activos simultáneamente.", "CRITICAL", client)
-
-        # 2. Travel Timeout (Predictive)
-        if (mc1 or mc2) and not (self.last_mc1 or self.last_mc2):
-            self.move_start_time = time.time()
-        
-        if (mc1 or mc2) and self.move_start_time:
-            if (time.time() - self.move_start_time) > 15: # 15 Segundos de viaje max
-                self.trigger_alarm("ERR_TIMEOUT", "Tiempo de viaje excedido. Posible atasco o falla de tracción.", "WARNING", client)
-        
-        if not mc1 and not mc2:
-            self.move_start_time = None
-
-        self.last_mc1 = mc1
-        self.last_mc2 = mc2
-
-engine = AlarmEngine()
+            if suppressed: evt["suppressed"] = suppressed
+            else: evt["announced"] = True
+            if suppressed == "grouped": evt["parent"] = active_parent
+            self.active_alarms[(asset, code)] = evt
+            self.history.append(evt)
+            self.write_journal({"op": "raised", "evt": evt})
+            ALARM_TRANSITIONS.labels(code=code, transition="raised").inc()
+
+            if suppressed:
+                logger.warning(f"🔕 [{asset}] {code} registrada sin anunciar ({suppressed})")
+                return
+            logger.error(f"🚨 [{asset}] {message}")
+            self.publish("alarm", evt)
+
+    def clear_alarm(self, asset, code):
+        if (asset, code) in self.active_alarms:
+            logger.info(f"✅ Alarma Recuperada: [{asset}] {code}")
+            evt = self.active_alarms.pop((asset, code))
+            evt["cleared_at"] = datetime.now().isoformat()
+            self.write_journal({"op": "cleared", "asset": asset, "code": code, "cleared_at": evt["cleared_at"]})
+            ALARM_TRANSITIONS.labels(code=code, transition="cleared").inc()
+            # Subscribers never heard of an alarm suppressed from the start, so they need no clear
+            # either; one shelved after it was announced still does
+            if evt.get("announced") or "suppressed" not in evt:
+                self.publish("alarm.cleared", {"code": code, "asset": asset, "raised_at": evt["timestamp"]})
+
+    def shelve(self, asset, code, duration, reason):
+        """Operator shelving: the alarm is recorded but not announced until
+        `duration` seconds pass or it is unshelved."""
+        with self.lock:
+            until = time.time() + duration
+            self.filter.shelve(asset, code, until, reason)
+            self.write_journal({"op": "shelved", "asset": asset, "code": code, "until": until, "reason": reason})
+            self.timers.schedule(("shelve", asset, code), duration, self.unshelve, asset, code)
+            evt = self.active_alarms.get((asset, code))
+            if evt and "suppressed" not in evt: evt["suppressed"] = "shelved"
+            logger.info(f"🗄️ [{asset}] {code} archivada {duration:g} s: {reason}")
+            return self.filter.shelved[(asset, code)]
+
+    def unshelve(self, asset, code):
+        """Ends a shelve (operator action or expiry). An alarm still active
+        and hidden by the shelve is announced now."""
+        with self.lock:
+            shelf = self.filter.unshelve(asset, code)
+            if shelf is None: return None
+            self.timers.cancel(("shelve", asset, code))
+            self.write_journal({"op": "unshelved", "asset": asset, "code": code})
+            evt = self.active_alarms.get((asset, code))
+            if evt and evt.get("suppressed") == "shelved":
+                del evt["suppressed"]
+                evt["announced"] = True
+                logger.error(f"🚨 [{asset}] {evt['message']} (fin de archivo)")
+                self.publish("alarm", evt)
+            return shelf
+
+    def on_transition(self, asset, rule, transition):
+        if transition == "raised":
+            self.trigger_alarm(asset, rule.code, rule.message, rule.severity, rule.parent)
+        else:
+            self.clear_alarm(asset, rule.code)
+
+    def on_stale(self, asset):
+        # A message that re-armed the timer after it was popped, but before this
+        # callback got the lock, left a deadline in the future: not stale
+        if self.stale_deadlines.get(asset, float("inf")) > time.monotonic(): return
+        self.trigger_alarm(asset, STALE_CODE, f"Sin datos de {asset} durante {self.stale_after:g} s. Publicador caído o enlace con el PLC perdido.", "CRITICAL")
+
+    def check_logic(self, asset, state):
+        with self.lock:
+            evaluator = self.evaluators.get(asset)
+            if evaluator is None:
+                evaluator = self.evaluators[asset] = AssetEvaluator(self.rules, asset, self.timers, self.on_transition)
+                # Alarms restored from the journal clear through their rules as usual
+                evaluator.active = {code for a, code in self.active_alarms if a == asset and code in self.rule_codes}
+            evaluator.update(state)
+            # Any message proves the publisher alive: clear and re-arm the stale timer
+            self.clear_alarm(asset, STALE_CODE)
+            if self.stale_after > 0:
+                self.stale_deadlines[asset] = self.timers.schedule((asset, STALE_CODE), self.stale_after, self.on_stale, asset)
 
 # --- MQTT Client Logic ---
 def on_message(client, userdata, msg):
     try:
-        payload = json.loads(msg.payload.decode())
+        payload = telemetry_codec.decode_message(msg.topic, msg.payload)
         if payload.get("event") == "machine.state.changed":
-            state = payload["data"]
-            engine.check_logic(state, client)
+            asset = payload.get("asset") or msg.topic.split("/")[1]
+            engine.check_logic(asset, payload["data"])
     except Exception as e:
         logger.error(f"Error processing alarm logic: {e}")
+    MQTT_CONSUMED.inc()
 
 mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
 mqtt_client.on_message = on_message
 
+engine = AlarmEngine(load_rules(ALARM_RULES), mqtt_client, STALE_AFTER,
+                     AlarmHistory(HISTORY_SIZE), AlarmJournal(JOURNAL_PATH, JOURNAL_FSYNC),
+                     AlarmFilter(RATE_PER_MIN, RATE_BURST, CHATTER_COUNT, CHATTER_WINDOW))
+logger.info(f"📜 {len(engine.rules)} alarm rules loaded from {ALARM_RULES}")
+
 def start_mqtt():
     try:
         mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        mqtt_client.subscribe("enterprise/machine/state")
-        logger.info("📡 Alarm Service subscribed to MQTT enterprise/machine/state")
+        mqtt_client.subscribe(STATE_TOPIC)
+        logger.info(f"📡 Alarm Service subscribed to MQTT {STATE_TOPIC}")
         mqtt_client.loop_forever()
     except Exception as e:
         logger.error(f"MQTT Error in Alarm Service: {e}")
@@ -107,21 +250,62 @@ def start_mqtt():
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Iniciando Alarm Service...")
+    engine.restore()
+    engine.timers.start()
     Thread(target=start_mqtt, daemon=True).start()
     yield
     # Shutdown
     mqtt_client.disconnect()
+    engine.timers.stop()
+    engine.journal.close()
 
 app = FastAPI(title="Enterprise Alarm Service", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"])
+app.mount("/metrics", make_asgi_app())
+
+class ShelveRequest(BaseModel):
+    asset: str
+    code: str
+    duration: float # seconds
+    reason: str = ""
 
 @app.get("/alarms/active")
-async def get_active():
-    return list(engine.active_alarms.values())
+async def get_active(include_suppressed: bool = False):
+    alarms = list(engine.active_alarms.values())
+    return alarms if include_suppressed else [a for a in alarms if "suppressed" not in a]
+
+@app.get("/alarms/shelved")
+async def get_shelved():
+    return list(engine.filter.shelved.values())
+
+@app.post("/alarms/shelve")
+async def shelve_alarm(req: ShelveRequest):
+    if req.code not in engine.rule_codes | {STALE_CODE}:
+        raise HTTPException(status_code=404, detail=f"Unknown alarm code {req.code}")
+    if not 0 < req.duration <= SHELVE_MAX:
+        raise HTTPException(status_code=400, detail=f"duration must be between 0 and {SHELVE_MAX:g} s")
+    return engine.shelve(req.asset, req.code, req.duration, req.reason)
+
+@app.delete("/alarms/shelve/{asset}/{code}")
+async def unshelve_alarm(asset: str, code: str):
+    shelf = engine.unshelve(asset, code)
+    if shelf is None:
+        raise HTTPException(status_code=404, detail="Alarm is not shelved")
+    return shelf
 
 @app.get("/alarms/history")
-async def get_history():
-    return engine.history
+async def get_history(
+    code: Optional[str] = None,
+    severity: Optional[str] = None,
+    asset: Optional[str] = None,
+    start: Optional[int] = Query(None, alias="from", description="epoch ms"),
+    end: Optional[int] = Query(None, alias="to", description="epoch ms"),
+    before: Optional[int] = Query(None, description="seq cursor: the last seq of the previous page"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Newest first. Page by passing the last item's `seq` as `before`."""
+    with engine.lock:
+        return engine.history.query(code, severity, asset, start, end, before, limit)
 
 if __name__ == "__main__":
     import uvicorn
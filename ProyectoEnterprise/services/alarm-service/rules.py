@@ -0,0 +1,153 @@
+"""Declarative alarm rules.
+
+A rule file is a JSON list of objects:
+
+    {"code": "ERR_TIMEOUT", "message": "...", "severity": "WARNING",
+     "when": "mc1 or mc2", "clear": "not (mc1 or mc2)",
+     "on_delay": 15, "off_delay": 0}
+
+`when` raises the alarm once it has held for `on_delay` seconds; `clear`
+(default: `not when`) clears it once it has held for `off_delay` seconds.
+Giving `clear` its own threshold is how hysteresis is expressed, e.g.
+`"when": "pos > 0.9", "clear": "pos < 0.8"`. An optional `parent` names the
+alarm this one cascades from (see flood.AlarmFilter).
+
+Expressions are a small Python subset (boolean logic, comparisons,
+arithmetic, abs/min/max) over the state tags plus the derived tags in
+DERIVED. They are parsed once at load time; the tag names they read decide
+which rules are re-checked when a message changes only some tags.
+"""
+import ast
+import json
+import time
+from prometheus_client import Counter, Histogram
+
+# --- PROMETHEUS METRICS ---
+RULE_EVAL_SECONDS = Histogram('alarm_rule_eval_seconds', 'Time to evaluate one alarm rule', ['rule'], buckets=(.000005, .00001, .000025, .00005, .0001, .00025, .001))
+RULES_SKIPPED = Counter('alarm_rules_skipped_total', 'Rule checks avoided because none of their input tags changed')
+
+TAGS = ("bp1", "bp2", "ls1", "ls2", "mc1", "mc2", "l1", "l2", "pos")
+DERIVED = ("pos_delta",) # |pos - pos in the previous message|
+SEVERITIES = ("INFO", "WARNING", "CRITICAL")
+FUNCTIONS = {"abs": abs, "min": min, "max": max}
+
+_ALLOWED = (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub,
+            ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Compare, ast.Eq, ast.NotEq,
+            ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Name, ast.Load, ast.Constant, ast.Call)
+
+def compile_expr(text, where):
+    """Returns (code object, input tag names); raises ValueError on anything
+    outside the supported subset or on unknown tags."""
+    try:
+        tree = ast.parse(text, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"{where}: invalid expression {text!r}: {e.msg}")
+    inputs = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED):
+            raise ValueError(f"{where}: {type(node).__name__} not allowed in {text!r}")
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS):
+            raise ValueError(f"{where}: only {sorted(FUNCTIONS)} may be called in {text!r}")
+        if isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+            if node.id not in TAGS + DERIVED:
+                raise ValueError(f"{where}: unknown tag {node.id!r} in {text!r}")
+            inputs.add(node.id)
+    return compile(tree, where, "eval"), inputs
+
+class Rule:
+    def __init__(self, spec):
+        self.code = spec["code"]
+        self.message = spec["message"]
+        self.severity = spec.get("severity", "WARNING")
+        if self.severity not in SEVERITIES:
+            raise ValueError(f"{self.code}: severity must be one of {SEVERITIES}")
+        self.on_delay = float(spec.get("on_delay", 0))
+        self.off_delay = float(spec.get("off_delay", 0))
+        # Alarm this one cascades from; while the parent is active it is grouped, not announced
+        self.parent = spec.get("parent")
+        if self.parent == self.code:
+            raise ValueError(f"{self.code}: a rule cannot be its own parent")
+        self.when, when_inputs = compile_expr(spec["when"], f"{self.code}.when")
+        self.clear, clear_inputs = compile_expr(spec.get("clear", f"not ({spec['when']})"), f"{self.code}.clear")
+        self.inputs = when_inputs | clear_inputs
+
+    def check(self, expr, image):
+        return bool(eval(expr, {"__builtins__": {}, **FUNCTIONS}, image))
+
+def load_rules(path):
+    with open(path, encoding="utf-8") as f:
+        rules = [Rule(spec) for spec in json.load(f)]
+    codes = [r.code for r in rules]
+    duplicates = {c for c in codes if codes.count(c) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate rule codes: {sorted(duplicates)}")
+    return rules
+
+class AssetEvaluator:
+    """Rule state for one asset. `update` re-checks only the rules that read
+    a tag whose value changed; on/off delays run on the shared `timers`
+    (a TimerHeap), so they expire even if no further message arrives.
+    Transitions go to `sink(asset, rule, "raised" | "cleared")`. Callers
+    hold the timers' lock around `update`."""
+    def __init__(self, rules, asset, timers, sink):
+        self.rules = rules
+        self.asset = asset
+        self.timers = timers
+        self.sink = sink
+        self.by_tag = {}
+        for rule in rules:
+            for tag in rule.inputs:
+                self.by_tag.setdefault(tag, []).append(rule)
+        self.image = {}
+        self.active = set()   # codes currently raised
+        self.pending = {}     # code -> deadline of its running on/off delay
+
+    def update(self, state):
+        new = {tag: state.get(tag, False) for tag in TAGS}
+        new["pos"] = state.get("pos", 0.0)
+        new["pos_delta"] = abs(new["pos"] - self.image["pos"]) if "pos" in self.image else 0.0
+        changed = [tag for tag, value in new.items() if tag not in self.image or self.image[tag] != value]
+        self.image = new
+
+        dirty = {}
+        for tag in changed:
+            for rule in self.by_tag.get(tag, ()):
+                dirty[rule.code] = rule
+        RULES_SKIPPED.inc(len(self.rules) - len(dirty))
+        for rule in dirty.values():
+            self.evaluate(rule)
+
+    def evaluate(self, rule):
+        start = time.perf_counter()
+        active = rule.code in self.active
+        condition = rule.check(rule.clear if active else rule.when, self.image)
+        RULE_EVAL_SECONDS.labels(rule=rule.code).observe(time.perf_counter() - start)
+        if not condition:
+            if self.pending.pop(rule.code, None) is not None:
+                self.timers.cancel((self.asset, rule.code))
+            return
+        delay = rule.off_delay if active else rule.on_delay
+        if delay <= 0:
+            self.fire(rule)
+        elif rule.code not in self.pending:
+            self.pending[rule.code] = self.timers.schedule((self.asset, rule.code), delay, self.expire, rule)
+
+    def expire(self, rule):
+        # The condition has held for the whole delay: anything that made it
+        # false went through evaluate() and dropped the pending deadline. A
+        # deadline still in the future belongs to a newer delay that
+        # replaced this timer while it was waiting for the lock.
+        if self.pending.get(rule.code, float("inf")) <= time.monotonic():
+            self.fire(rule)
+
+    def fire(self, rule):
+        if self.pending.pop(rule.code, None) is not None:
+            self.timers.cancel((self.asset, rule.code))
+        if rule.code in self.active:
+            self.active.discard(rule.code)
+            self.sink(self.asset, rule, "cleared")
+        else:
+            self.active.add(rule.code)
+            self.sink(self.asset, rule, "raised")
+            # Its clear condition may already hold (e.g. it went true during the on-delay)
+            self.evaluate(rule)
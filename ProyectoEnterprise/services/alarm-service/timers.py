@@ -0,0 +1,86 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from prometheus_client import Gauge, Histogram
+
+logger = logging.getLogger("alarm-service.timers")
+
+# --- PROMETHEUS METRICS ---
+TIMERS_PENDING = Gauge('alarm_timers_pending', 'Alarm delay/stale timers waiting to fire')
+TIMER_LATENESS = Histogram('alarm_timer_lateness_seconds', 'How late timers fire after their deadline', buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .5))
+
+class TimerHeap:
+    """One thread firing keyed one-shot timers from a binary heap, so alarm
+    delays and stale-data checks run on time whether or not messages keep
+    arriving. Scheduling a key that is already pending replaces it;
+    cancellation is O(1) (the heap entry is tombstoned and skipped later,
+    and the heap is rebuilt when tombstones outnumber live timers).
+
+    Callbacks run on the timer thread with `lock` held, so they see the same
+    consistent state as code that holds `lock` while calling schedule/cancel."""
+    def __init__(self, lock=None):
+        self.lock = lock or threading.RLock()
+        self.cond = threading.Condition()
+        self.heap = []
+        self.live = {}
+        self.seq = itertools.count()
+        self.thread = None
+        self.running = False
+        TIMERS_PENDING.set_function(lambda: len(self.live))
+
+    def schedule(self, key, delay, callback, *args):
+        deadline = time.monotonic() + delay
+        entry = [deadline, next(self.seq), key, callback, args]
+        with self.cond:
+            self._cancel(key)
+            heapq.heappush(self.heap, entry)
+            self.live[key] = entry
+            if self.heap[0] is entry: self.cond.notify()
+        return deadline
+
+    def cancel(self, key):
+        with self.cond:
+            self._cancel(key)
+
+    def _cancel(self, key):
+        entry = self.live.pop(key, None)
+        if entry is None: return
+        entry[3] = None
+        if len(self.heap) > 64 and len(self.heap) > 2 * len(self.live):
+            self.heap = [e for e in self.heap if e[3] is not None]
+            heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.live)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="alarm-timers", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.thread: self.thread.join(timeout=2)
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.running:
+                    while self.heap and self.heap[0][3] is None:
+                        heapq.heappop(self.heap)
+                    timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+                    if timeout is not None and timeout <= 0: break
+                    self.cond.wait(timeout)
+                if not self.running: return
+                deadline, _, key, callback, args = heapq.heappop(self.heap)
+                del self.live[key]
+            TIMER_LATENESS.observe(time.monotonic() - deadline)
+            try:
+                with self.lock:
+                    callback(*args)
+            except Exception as e:
+                logger.error(f"Timer {key} failed: {e}")
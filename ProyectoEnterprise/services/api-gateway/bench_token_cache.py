@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import sys
+import time
+from datetime import datetime, timedelta
+import httpx
+from jose import jwt
+import main
+from token_cache import TokenCache
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("token-bench")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+def make_tokens(users):
+    # Same claims auth-service puts in its tokens
+    expire = datetime.utcnow() + timedelta(minutes=30)
+    return [jwt.encode({"sub": f"user{i}", "role": "operator", "exp": expire}, main.JWT_SECRET_KEY, algorithm=main.JWT_ALGORITHM)
+            for i in range(users)]
+
+def bench_verify(tokens, n):
+    """Raw verifications per second: cached LRU vs a full jose decode every time."""
+    results = {}
+    for label, size in (("decode every time", 0), ("cached", len(tokens))):
+        cache = TokenCache(main.JWT_SECRET_KEY, main.JWT_ALGORITHM, size)
+        start = time.perf_counter()
+        for i in range(n):
+            cache.verify(tokens[i % len(tokens)])
+        results[label] = n / (time.perf_counter() - start)
+    return results
+
+async def bench_http(tokens, n, concurrency):
+    """Authenticated /auth/users/me through the gateway app in-process."""
+    transport = httpx.ASGITransport(app=main.app)
+    results = {}
+    for label, size in (("decode every time", 0), ("cached", len(tokens))):
+        main.token_cache = TokenCache(main.JWT_SECRET_KEY, main.JWT_ALGORITHM, size)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+            counter = iter(range(n))
+            async def worker():
+                for i in counter:
+                    r = await client.get("/auth/users/me", headers={"Authorization": f"Bearer {tokens[i % len(tokens)]}"})
+                    assert r.status_code == 200, r.text
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            results[label] = n / (time.perf_counter() - start)
+    return results
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    tokens = make_tokens(users)
+
+    for label, rate in bench_verify(tokens, n).items():
+        logger.info(f"verify  {label:18s} {rate:10,.0f} tokens/s")
+    for label, rate in asyncio.run(bench_http(tokens, n // 4, 32)).items():
+        logger.info(f"/me     {label:18s} {rate:10,.0f} req/s")
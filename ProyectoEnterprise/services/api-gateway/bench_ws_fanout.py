@@ -0,0 +1,96 @@
+import asyncio
+import json
+import logging
+import multiprocessing as mp
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+import uvicorn
+import websockets
+import main
+from ws_hub import WS_DROPPED, WS_EVICTIONS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("ws-bench")
+logging.getLogger("api-gateway").setLevel(logging.ERROR)
+
+PORT = 18080
+
+async def fast_client(latencies, counts, stop):
+    async with websockets.connect(f"ws://127.0.0.1:{PORT}/ws/telemetry", max_queue=None) as ws:
+        received = 0
+        while not stop.is_set():
+            try: msg = json.loads(await asyncio.wait_for(ws.recv(), 0.5))
+            except asyncio.TimeoutError: continue
+            received += 1
+            if "bench_ts" in msg: latencies.append(time.time() - msg["bench_ts"])
+        counts.append(received)
+
+async def stalled_client(stop):
+    # Connects and never reads: the worst kind of laggard
+    try:
+        async with websockets.connect(f"ws://127.0.0.1:{PORT}/ws/telemetry", max_queue=1) as ws:
+            await stop.wait()
+    except Exception:
+        pass
+
+def inject(rate, duration):
+    """Plays the MQTT thread: state at `rate` Hz plus an alarm every second."""
+    sent, period = 0, 1.0 / rate
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        payload = {"event": "machine.state.changed", "data": {"mc1": True, "pos": sent % 100 / 100}, "bench_ts": time.time(), "pad": "x" * 600}
+        main.on_mqtt_message(None, None, SimpleNamespace(topic="enterprise/machine/state", payload=json.dumps(payload).encode()))
+        if sent % rate == 0:
+            alarm = {"event": "alarm", "data": {"code": "BENCH"}, "bench_ts": time.time()}
+            main.on_mqtt_message(None, None, SimpleNamespace(topic="enterprise/alarms", payload=json.dumps(alarm).encode()))
+        sent += 1
+        time.sleep(max(0.0, start + sent * period - time.perf_counter()))
+    return sent
+
+async def client_fleet(fast, stalled, ready, stop_after):
+    stop = asyncio.Event()
+    latencies, counts = [], []
+    clients = [asyncio.create_task(fast_client(latencies, counts, stop)) for _ in range(fast)]
+    clients += [asyncio.create_task(stalled_client(stop)) for _ in range(stalled)]
+    ready.set()
+    await asyncio.to_thread(stop_after.wait)
+    stop.set()
+    await asyncio.gather(*clients, return_exceptions=True)
+    return latencies, counts
+
+def client_process(fast, stalled, ready, stop_after, results):
+    # Clients live in their own process so they do not compete with the gateway's event loop
+    results.put(asyncio.run(client_fleet(fast, stalled, ready, stop_after)))
+
+async def run(fast, stalled, rate, duration):
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=PORT, log_level="error"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started: await asyncio.sleep(0.05)
+
+    ready, stop_after, results = mp.Event(), mp.Event(), mp.Queue()
+    proc = mp.Process(target=client_process, args=(fast, stalled, ready, stop_after, results))
+    proc.start()
+    while len(main.hub) < fast + stalled: await asyncio.sleep(0.05)
+
+    sent = await asyncio.to_thread(inject, rate, duration)
+    await asyncio.sleep(1.0)
+    stop_after.set()
+    latencies, counts = await asyncio.to_thread(results.get)
+    proc.join()
+    server.should_exit = True
+    await server_task
+
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    logger.info(f"{fast} fast + {stalled} stalled clients, {sent} state msgs at {rate} Hz")
+    logger.info(f"Fast clients received avg {statistics.mean(counts):.0f} msgs (min {min(counts)}); latency p50 {p(.5):.1f} ms, p99 {p(.99):.1f} ms, max {p(1):.1f} ms")
+    logger.info(f"Coalesced {WS_DROPPED.labels(reason='coalesced')._value.get():.0f}, overflow drops {WS_DROPPED.labels(reason='overflow')._value.get():.0f}, evictions {WS_EVICTIONS._value.get():.0f}")
+
+if __name__ == "__main__":
+    fast = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    stalled = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rate = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    duration = float(sys.argv[4]) if len(sys.argv) > 4 else 10.0
+    asyncio.run(run(fast, stalled, rate, duration))
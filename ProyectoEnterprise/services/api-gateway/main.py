@@ -2,11 +2,19 @@ import asyncio
 import json
 import logging
 import os
+import time
 from contextlib import asynccontextmanager
 import httpx
-from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 import paho.mqtt.client as mqtt
+from prometheus_client import Counter, make_asgi_app
+import telemetry_codec
+from ws_hub import BroadcastHub
+from proxy_cache import ResponseCache, CachedResponse, UPSTREAM_LATENCY
+from token_cache import TokenCache
 
 # --- Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -19,32 +27,58 @@ ALARM_URL = os.getenv("ALARM_URL", "http://alarm-service:8002")
 HISTORIAN_URL = os.getenv("HISTORIAN_URL", "http://historian-service:8003")
 AI_URL = os.getenv("AI_URL", "http://ai-service:8004")
 MQTT_BROKER = os.getenv("MQTT_BROKER", "mqtt-broker")
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "json") # json | binary
+# Every asset's state (plc-service publishes enterprise/<asset>/state)
+STATE_TOPIC = telemetry_codec.state_topic("enterprise/+/state", WIRE_FORMAT == "binary")
+ALARM_TOPIC = "enterprise/alarms"
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "100"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "2.0"))
+# Seconds an idempotent GET is served from the gateway cache (0 disables caching)
+CACHE_TTLS = {
+    "plc": float(os.getenv("CACHE_TTL_PLC", "0.2")),
+    "alarms": float(os.getenv("CACHE_TTL_ALARMS", "1.0")),
+    "ai": float(os.getenv("CACHE_TTL_AI", "2.0")),
+    "history": float(os.getenv("CACHE_TTL_HISTORY", "5.0")),
+}
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "512"))
+# Must match auth-service so tokens can be validated here without a round trip
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "enterprise-secret-key-change-this")
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+# Roles allowed to drive the machine / inject simulated faults
+COMMAND_ROLES = set(os.getenv("COMMAND_ROLES", "admin,operator").split(","))
+FAULT_ROLES = set(os.getenv("FAULT_ROLES", "admin").split(","))
+SHELVE_ROLES = set(os.getenv("SHELVE_ROLES", "admin,operator").split(","))
 
 # --- Globals ---
 http_client = httpx.AsyncClient(timeout=10.0, limits=httpx.Limits(max_connections=200))
-connected_clients = set()
+response_cache = ResponseCache(CACHE_MAX_ENTRIES)
+token_cache = TokenCache(JWT_SECRET_KEY, JWT_ALGORITHM, TOKEN_CACHE_SIZE)
+hub = BroadcastHub(max_queue=WS_QUEUE_SIZE, send_timeout=WS_SEND_TIMEOUT)
 mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "GATEWAY_WS_BRIDGE")
 main_loop = None
+MQTT_CONSUMED = Counter('mqtt_messages_consumed_total', 'MQTT messages handled by on_message')
 
 def on_mqtt_message(client, userdata, msg):
-    if not connected_clients or not main_loop: return
+    MQTT_CONSUMED.inc()
+    if not hub.channels or not main_loop: return
     try:
-        payload = json.loads(msg.payload.decode())
-        # Broadcast via WebSockets in the main event loop
-        asyncio.run_coroutine_threadsafe(broadcast_ws(payload), main_loop)
+        # Serialize once for every client; JSON payloads are forwarded untouched
+        if telemetry_codec.is_binary_topic(msg.topic):
+            text = json.dumps(telemetry_codec.decode_message(msg.topic, msg.payload))
+        else:
+            text = msg.payload.decode()
+        if msg.topic == ALARM_TOPIC:
+            # Alarms carry their asset in data.asset (alarm-service and ai-service both set it)
+            data = json.loads(text).get("data")
+            asset = data.get("asset") if isinstance(data, dict) else None
+            main_loop.call_soon_threadsafe(hub.publish, msg.topic, text, "alarms", asset)
+        else:
+            asset = msg.topic.split("/")[1]
+            main_loop.call_soon_threadsafe(hub.publish, msg.topic, text, "state", asset)
     except Exception as e:
         logger.error(f"WS Bridge Error: {e}")
 
-async def broadcast_ws(payload):
-    # Create a copy to avoid Set changed size during iteration
-    for ws in list(connected_clients):
-        try:
-            await ws.send_json(payload)
-        except Exception as e:
-            logger.warning(f"Failed to send to WS client, removing: {e}")
-            if ws in connected_clients:
-                connected_clients.remove(ws)
-
 mqtt_client.on_message = on_mqtt_message
 
 @asynccontextmanager
@@ -56,8 +90,8 @@ async def lifespan(app: FastAPI):
     try:
         logger.info(f"📡 Gateway: Connecting to MQTT at {MQTT_BROKER}...")
         mqtt_client.connect(MQTT_BROKER, 1883, 60)
-        mqtt_client.subscribe("enterprise/machine/state")
-        mqtt_client.subscribe("enterprise/alarms")
+        mqtt_client.subscribe(STATE_TOPIC)
+        mqtt_client.subscribe(ALARM_TOPIC)
         mqtt_client.loop_start()
         logger.info(f"✅ Gateway: MQTT connected.")
     except Exception as e:
@@ -70,6 +104,7 @@ async def lifespan(app: FastAPI):
     await http_client.aclose()
 
 app = FastAPI(title="Enterprise API Gateway", lifespan=lifespan)
+app.mount("/metrics/prometheus", make_asgi_app())
 
 app.add_middleware(
     CORSMiddleware,
@@ -83,90 +118,173 @@ app.add_middleware(
 async def websocket_endpoint(websocket: WebSocket):
     logger.info("⚡ WS Attempt: Incoming connection...")
     await websocket.accept()
-    connected_clients.add(websocket)
-    logger.info(f"✅ WS Client Connected. Total: {len(connected_clients)}")
+    channel = hub.add(websocket)
+    logger.info(f"✅ WS Client Connected. Total: {len(hub)}")
     try:
         while True:
-            # Keep alive and check for client disconnect
-            await websocket.receive_text() 
+            # Keep alive, client disconnect and subscription messages
+            text = await websocket.receive_text()
+            try: message = json.loads(text)
+            except ValueError: continue
+            if not isinstance(message, dict) or message.get("type") != "subscribe": continue
+            try:
+                channel.send_control({"event": "subscription.ack", "data": channel.subscribe(message)})
+            except ValueError as e:
+                channel.send_control({"event": "subscription.error", "data": {"detail": str(e)}})
     except WebSocketDisconnect:
         logger.info("ℹ️ WS Client Disconnected")
     except Exception as e:
         logger.error(f"⚠️ WS Connection Error: {e}")
     finally:
-        if websocket in connected_clients:
-            connected_clients.remove(websocket)
+        hub.remove(websocket)
+
+# --- Auth ---
+def current_user(request: Request):
+    """Validates the bearer token locally (cached per token until it expires)."""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        claims = token_cache.verify(token)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+    return {"username": claims["sub"], "role": claims.get("role")}
+
+def require_role(roles):
+    def check(user: dict = Depends(current_user)):
+        if user["role"] not in roles:
+            raise HTTPException(status_code=403, detail=f"Role '{user['role']}' is not allowed to do this")
+        return user
+    return check
 
 # --- Proxies ---
+# Connection-scoped headers that must not be forwarded by a proxy (RFC 9110 7.6.1),
+# plus the ones uvicorn sets itself on the way out
+HOP_BY_HOP = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te",
+              "trailer", "transfer-encoding", "upgrade", "server", "date"}
+
+def upstream_headers(request: Request):
+    headers = dict(request.headers)
+    headers.pop("host", None)
+    return headers
+
+def downstream_headers(r: httpx.Response):
+    return {k: v for k, v in r.headers.items() if k.lower() not in HOP_BY_HOP}
+
+def route_of(request: Request):
+    # Route template (e.g. /plc/command/{button}) keeps metric labels bounded
+    route = request.scope.get("route")
+    return route.path if route else request.url.path
+
 async def proxy_request(method: str, url: str, request: Request):
+    """Streams the upstream response through untouched (status, headers, raw bytes)."""
+    route = route_of(request)
     try:
-        content = await request.body()
-        headers = dict(request.headers)
-        headers.pop("host", None)
-        
-        r = await http_client.request(
+        start = time.perf_counter()
+        upstream = http_client.build_request(
             method=method,
             url=url,
-            content=content,
-            headers=headers,
+            content=await request.body(),
+            headers=upstream_headers(request),
             params=request.query_params
         )
-        
-        if r.status_code >= 400:
-            raise HTTPException(status_code=r.status_code, detail=r.json())
-        return r.json()
+        r = await http_client.send(upstream, stream=True)
+        UPSTREAM_LATENCY.labels(route=route).observe(time.perf_counter() - start)
+        return StreamingResponse(r.aiter_raw(), status_code=r.status_code, headers=downstream_headers(r), background=BackgroundTask(r.aclose))
+    except httpx.RequestError as e:
+        logger.error(f"Proxy Link Error ({url}): {e}")
+        raise HTTPException(status_code=502, detail="Upstream service unreachable")
+    except Exception as e:
+        logger.error(f"Proxy Error: {e}")
+        raise HTTPException(status_code=500, detail="Internal Gateway Error")
+
+async def cached_get(url: str, request: Request, ttl: float):
+    """Idempotent GET served from the short-TTL cache, with concurrent misses
+    coalesced into one upstream request. The upstreams do not vary responses
+    per user, so the key is the URL and query string only."""
+    route = route_of(request)
+    key = f"{url}?{request.query_params}"
+
+    async def load():
+        start = time.perf_counter()
+        headers = upstream_headers(request)
+        headers.pop("accept-encoding", None) # cached bytes must suit every client
+        async with http_client.stream("GET", url, headers=headers, params=request.query_params) as r:
+            body = b"".join([chunk async for chunk in r.aiter_raw()])
+        UPSTREAM_LATENCY.labels(route=route).observe(time.perf_counter() - start)
+        return CachedResponse(r.status_code, downstream_headers(r), body)
+
+    try:
+        cached = await response_cache.fetch(key, ttl, load, route)
     except httpx.RequestError as e:
         logger.error(f"Proxy Link Error ({url}): {e}")
         raise HTTPException(status_code=502, detail="Upstream service unreachable")
-    except HTTPException:
-        raise
     except Exception as e:
         logger.error(f"Proxy Error: {e}")
         raise HTTPException(status_code=500, detail="Internal Gateway Error")
+    return Response(content=cached.body, status_code=cached.status_code, headers=cached.headers)
 
 @app.post("/auth/token")
 async def proxy_login(request: Request):
     return await proxy_request("POST", f"{AUTH_URL}/token", request)
 
 @app.get("/auth/users/me")
-async def proxy_me(request: Request):
-    return await proxy_request("GET", f"{AUTH_URL}/users/me", request)
+async def read_me(user: dict = Depends(current_user)):
+    # Same body as auth-service /users/me, answered from the token claims
+    return user
 
 @app.get("/plc/state")
 async def proxy_plc_state(request: Request):
-    return await proxy_request("GET", f"{PLC_URL}/state", request)
+    return await cached_get(f"{PLC_URL}/state", request, CACHE_TTLS["plc"])
 
 @app.post("/plc/command/{button}")
-async def proxy_plc_cmd(button: str, request: Request):
+async def proxy_plc_cmd(button: str, request: Request, user: dict = Depends(require_role(COMMAND_ROLES))):
     return await proxy_request("POST", f"{PLC_URL}/command/{button}", request)
 
 @app.post("/plc/simulate/inject-fault/{fault_type}")
-async def proxy_fault(fault_type: str, request: Request):
+async def proxy_fault(fault_type: str, request: Request, user: dict = Depends(require_role(FAULT_ROLES))):
     return await proxy_request("POST", f"{PLC_URL}/simulate/inject-fault/{fault_type}", request)
 
 @app.get("/alarms/alarms/active")
 async def proxy_alarms_active(request: Request):
-    return await proxy_request("GET", f"{ALARM_URL}/alarms/active", request)
+    return await cached_get(f"{ALARM_URL}/alarms/active", request, CACHE_TTLS["alarms"])
 
 @app.get("/alarms/alarms/history")
 async def proxy_alarms_history(request: Request):
-    return await proxy_request("GET", f"{ALARM_URL}/alarms/history", request)
+    return await cached_get(f"{ALARM_URL}/alarms/history", request, CACHE_TTLS["alarms"])
+
+@app.get("/alarms/alarms/shelved")
+async def proxy_alarms_shelved(request: Request):
+    return await cached_get(f"{ALARM_URL}/alarms/shelved", request, CACHE_TTLS["alarms"])
+
+@app.post("/alarms/alarms/shelve")
+async def proxy_alarm_shelve(request: Request, user: dict = Depends(require_role(SHELVE_ROLES))):
+    return await proxy_request("POST", f"{ALARM_URL}/alarms/shelve", request)
+
+@app.delete("/alarms/alarms/shelve/{asset}/{code}")
+async def proxy_alarm_unshelve(asset: str, code: str, request: Request, user: dict = Depends(require_role(SHELVE_ROLES))):
+    return await proxy_request("DELETE", f"{ALARM_URL}/alarms/shelve/{asset}/{code}", request)
 
 @app.get("/ai/insights")
 async def proxy_ai(request: Request):
-    return await proxy_request("GET", f"{AI_URL}/ai/status", request)
+    return await cached_get(f"{AI_URL}/ai/status", request, CACHE_TTLS["ai"])
+
+@app.get("/ai/forecast")
+async def proxy_ai_forecast(request: Request):
+    return await cached_get(f"{AI_URL}/ai/forecast", request, CACHE_TTLS["ai"])
 
 @app.get("/metrics")
 async def gateway_metrics():
     return {
         "status": "online",
-        "connected_ws": len(connected_clients),
+        "connected_ws": len(hub),
+        "ws_queue_depth": hub.queue_depth(),
         "mqtt_connected": mqtt_client.is_connected()
     }
 
 @app.get("/history/telemetry")
 async def proxy_history_telemetry(request: Request):
-    return await proxy_request("GET", f"{HISTORIAN_URL}/history/telemetry", request)
+    return await cached_get(f"{HISTORIAN_URL}/history/telemetry", request, CACHE_TTLS["history"])
 
 if __name__ == "__main__":
     import uvicorn
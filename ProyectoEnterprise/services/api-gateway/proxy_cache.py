@@ -0,0 +1,62 @@
+import asyncio
+import time
+from collections import OrderedDict, namedtuple
+from prometheus_client import Counter, Histogram
+
+# --- PROMETHEUS METRICS ---
+CACHE_REQUESTS = Counter('gateway_cache_requests_total', 'Cacheable proxy requests by outcome', ['route', 'result'])
+UPSTREAM_LATENCY = Histogram('gateway_upstream_latency_seconds', 'Upstream round trip per gateway route', ['route'], buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+
+CachedResponse = namedtuple("CachedResponse", ["status_code", "headers", "body"])
+
+class ResponseCache:
+    """Short-TTL cache for idempotent upstream GETs with singleflight: while
+    one request for a key is in flight, identical requests await its result
+    instead of opening their own upstream hop. Only 200 responses are stored;
+    bodies are kept as the raw upstream bytes."""
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.inflight = {}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None: return None
+        expires, response = entry
+        if time.monotonic() >= expires:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return response
+
+    def put(self, key, response, ttl):
+        self.entries[key] = (time.monotonic() + ttl, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def fetch(self, key, ttl, loader, route):
+        """Returns the response for `key`, calling `loader()` only on a miss."""
+        response = self.get(key)
+        if response is not None:
+            CACHE_REQUESTS.labels(route=route, result="hit").inc()
+            return response
+        pending = self.inflight.get(key)
+        if pending is not None:
+            CACHE_REQUESTS.labels(route=route, result="coalesced").inc()
+        else:
+            CACHE_REQUESTS.labels(route=route, result="miss").inc()
+            # The load runs as its own task: a leader whose client disconnects
+            # cancels only its own wait, never the followers'
+            pending = self.inflight[key] = asyncio.ensure_future(self._load(key, ttl, loader))
+            pending.add_done_callback(lambda t: t.cancelled() or t.exception()) # retrieved even with no waiter left
+        return await asyncio.shield(pending)
+
+    async def _load(self, key, ttl, loader):
+        try:
+            response = await loader()
+            if response.status_code == 200 and ttl > 0:
+                self.put(key, response, ttl)
+            return response
+        finally:
+            del self.inflight[key]
@@ -0,0 +1,58 @@
+import hashlib
+import time
+from collections import OrderedDict
+from jose import ExpiredSignatureError, JWTError, jwt
+from prometheus_client import Counter, Gauge
+
+# --- PROMETHEUS METRICS ---
+TOKEN_CHECKS = Counter('gateway_token_checks_total', 'Bearer token verifications at the gateway by outcome', ['result'])
+TOKEN_CACHE_SIZE = Gauge('gateway_token_cache_entries', 'Verified tokens held in the gateway cache')
+
+class TokenCache:
+    """Local JWT validation for the gateway. A token's signature is checked
+    once with the shared auth-service key; its claims are then kept in an LRU
+    keyed by the SHA-256 of the token (raw tokens are never stored) until the
+    token's own `exp`, after which it is rejected without decoding again.
+    `verify` raises ValueError with a client-safe detail on any failure."""
+    def __init__(self, secret_key, algorithm="HS256", max_entries=4096):
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        TOKEN_CACHE_SIZE.set_function(lambda: len(self.entries))
+
+    def verify(self, token):
+        key = hashlib.sha256(token.encode()).digest()
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires, claims = entry
+            if time.time() < expires:
+                self.entries.move_to_end(key)
+                TOKEN_CHECKS.labels(result="hit").inc()
+                return claims
+            del self.entries[key]
+            TOKEN_CHECKS.labels(result="expired").inc()
+            raise ValueError("Token has expired")
+
+        try:
+            claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        except ExpiredSignatureError:
+            TOKEN_CHECKS.labels(result="expired").inc()
+            raise ValueError("Token has expired")
+        except JWTError:
+            TOKEN_CHECKS.labels(result="invalid").inc()
+            raise ValueError("Could not validate credentials")
+        if claims.get("sub") is None:
+            TOKEN_CHECKS.labels(result="invalid").inc()
+            raise ValueError("Could not validate credentials")
+
+        TOKEN_CHECKS.labels(result="miss").inc()
+        # Tokens without exp are honoured but re-verified every time
+        if isinstance(claims.get("exp"), (int, float)) and self.max_entries > 0:
+            self.entries[key] = (claims["exp"], claims)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return claims
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger("api-gateway.ws")
+
+# --- PROMETHEUS METRICS ---
+WS_CLIENTS = Gauge('gateway_ws_clients', 'Connected WebSocket clients')
+WS_QUEUE_DEPTH = Gauge('gateway_ws_queue_depth', 'Messages waiting across all WebSocket client queues')
+WS_SENT = Counter('gateway_ws_messages_sent_total', 'Messages written to WebSocket clients')
+WS_DROPPED = Counter('gateway_ws_messages_dropped_total', 'Messages not delivered to a client', ['reason'])
+WS_EVICTIONS = Counter('gateway_ws_evictions_total', 'Clients disconnected for being too slow')
+WS_FILTERED = Counter('gateway_ws_messages_filtered_total', 'Messages skipped by client subscriptions')
+
+KINDS = ("state", "alarms")
+
+class ClientChannel:
+    """Outbound side of one WebSocket. Events (alarms) queue in order up to
+    `max_queue`, dropping the oldest on overflow; state updates keep only the
+    latest value per topic, so a lagging client skips stale positions instead
+    of falling further behind.
+
+    Clients may narrow what they get by sending
+    {"type": "subscribe", "topics": ["state", "alarms"], "assets": [...], "max_rate": 1}.
+    `max_rate` (Hz) conflates state to the latest value per asset per
+    interval; alarms are never throttled. `assets` filters both state and
+    alarms; alarms that name no asset reach every client."""
+    def __init__(self, hub, ws, max_queue, send_timeout):
+        self.hub = hub
+        self.ws = ws
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.events = deque()
+        self.latest = {}
+        self.last_sent = {}
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.kinds = set(KINDS)
+        self.assets = None
+        self.min_interval = 0.0
+
+    def subscribe(self, message):
+        """Applies a subscription message; raises ValueError when it is malformed."""
+        topics = message.get("topics", list(KINDS))
+        assets = message.get("assets")
+        max_rate = message.get("max_rate")
+        if not isinstance(topics, list) or not set(topics) <= set(KINDS):
+            raise ValueError(f"topics must be a list drawn from {list(KINDS)}")
+        if assets is not None and (not isinstance(assets, list) or not all(isinstance(a, str) for a in assets)):
+            raise ValueError("assets must be a list of asset ids")
+        if max_rate is not None and (not isinstance(max_rate, (int, float)) or max_rate <= 0):
+            raise ValueError("max_rate must be a positive number of updates per second")
+        self.kinds = set(topics)
+        self.assets = set(assets) if assets is not None else None
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        # Drop anything queued under the old subscription
+        self.latest.clear()
+        self.events.clear()
+        return {"topics": sorted(self.kinds), "assets": sorted(self.assets) if self.assets is not None else None, "max_rate": max_rate}
+
+    def send_control(self, payload):
+        """Replies to the client itself (acks, errors) through the writer task."""
+        self.events.append(json.dumps(payload))
+        self.wakeup.set()
+
+    def accepts(self, kind, asset):
+        if kind not in self.kinds: return False
+        return self.assets is None or asset is None or asset in self.assets
+
+    def depth(self):
+        return len(self.events) + len(self.latest)
+
+    def push(self, topic, text, kind, asset):
+        if not self.accepts(kind, asset):
+            WS_FILTERED.inc()
+            return
+        if kind == "state":
+            if topic in self.latest: WS_DROPPED.labels(reason="coalesced").inc()
+            self.latest[topic] = text
+        else:
+            if len(self.events) >= self.max_queue:
+                self.events.popleft()
+                WS_DROPPED.labels(reason="overflow").inc()
+            self.events.append(text)
+        self.wakeup.set()
+
+    async def run(self):
+        try:
+            timeout = None
+            while True:
+                try: await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError: pass
+                self.wakeup.clear()
+                timeout = await self.drain()
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.warning(f"🐢 WS client too slow (> {self.send_timeout}s per send), evicting")
+            WS_EVICTIONS.inc()
+            await self.hub.evict(self)
+        except Exception as e:
+            logger.warning(f"Failed to send to WS client, removing: {e}")
+            await self.hub.evict(self)
+
+    async def drain(self):
+        """Sends everything that is due; returns seconds until the next
+        throttled state update is due (None when nothing is held back)."""
+        while self.events:
+            await self.send(self.events.popleft())
+        next_due = None
+        for topic in list(self.latest):
+            now = time.monotonic()
+            due = self.last_sent.get(topic, 0.0) + self.min_interval
+            if now < due:
+                next_due = min(next_due, due - now) if next_due is not None else due - now
+                continue
+            await self.send(self.latest.pop(topic))
+            self.last_sent[topic] = now
+            # Alarms that arrived while sending state go out first
+            while self.events:
+                await self.send(self.events.popleft())
+        return next_due
+
+    async def send(self, text):
+        await asyncio.wait_for(self.ws.send_text(text), self.send_timeout)
+        WS_SENT.inc()
+
+class BroadcastHub:
+    """Fan-out from the MQTT bridge to every WebSocket client. Payloads are
+    serialized once by the caller; `publish` only appends to per-client
+    queues, and each client's writer task drains its own queue, so one slow
+    browser never delays the others."""
+    def __init__(self, max_queue=100, send_timeout=2.0):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.channels = {}
+        WS_QUEUE_DEPTH.set_function(self.queue_depth)
+
+    def __len__(self):
+        return len(self.channels)
+
+    def queue_depth(self):
+        return sum(ch.depth() for ch in list(self.channels.values()))
+
+    def add(self, ws):
+        channel = ClientChannel(self, ws, self.max_queue, self.send_timeout)
+        channel.task = asyncio.create_task(channel.run())
+        self.channels[ws] = channel
+        WS_CLIENTS.set(len(self.channels))
+        return channel
+
+    def remove(self, ws):
+        channel = self.channels.pop(ws, None)
+        if channel and channel.task and channel.task is not asyncio.current_task():
+            channel.task.cancel()
+        WS_CLIENTS.set(len(self.channels))
+
+    async def evict(self, channel):
+        self.remove(channel.ws)
+        try: await channel.ws.close(code=1013) # try again later
+        except Exception: pass
+
+    def publish(self, topic, text, kind, asset=None):
+        """Must run on the event loop (use loop.call_soon_threadsafe from MQTT).
+        `kind` is "state" (coalesced per topic) or "alarms" (queued in order)."""
+        for channel in self.channels.values():
+            channel.push(topic, text, kind, asset)
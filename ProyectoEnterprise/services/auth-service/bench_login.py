@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import httpx
+# Keep the service's default users.db out of the benchmark
+os.environ.setdefault("USER_STORE", "sqlite:///:memory:")
+import main
+import passwords
+from user_store import CachedUserStore, SQLiteUserStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("login-bench")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+async def loop_lag(stop, samples):
+    # How late a 10 ms sleep wakes up: shows whether hashing blocks the event loop
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        samples.append(time.perf_counter() - start - 0.01)
+
+async def bench_cost(n, r, p, logins, concurrency):
+    main.SCRYPT_N, main.SCRYPT_R, main.SCRYPT_P = n, r, p
+    main.users.put({"username": "bench", "full_name": "Bench", "role": "operator",
+                    "hashed_password": passwords.hash_password("secret", n, r, p)})
+    transport = httpx.ASGITransport(app=main.app)
+    latencies, lag, stop = [], [], asyncio.Event()
+    async with httpx.AsyncClient(transport=transport, base_url="http://auth") as client:
+        counter = iter(range(logins))
+        async def worker():
+            for _ in counter:
+                start = time.perf_counter()
+                r = await client.post("/token", data={"username": "bench", "password": "secret"})
+                assert r.status_code == 200, r.text
+                latencies.append(time.perf_counter() - start)
+        lag_task = asyncio.create_task(loop_lag(stop, lag))
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await lag_task
+    latencies.sort()
+    return {
+        "logins_s": logins / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "max_loop_lag_ms": max(lag) * 1000 if lag else 0.0,
+    }
+
+async def run(logins, concurrency):
+    with tempfile.TemporaryDirectory() as tmp:
+        main.users = CachedUserStore(SQLiteUserStore(os.path.join(tmp, "users.db")))
+        for label, (n, r, p) in (("n=2^12 r=8", (2**12, 8, 1)), ("n=2^14 r=8", (2**14, 8, 1)), ("n=2^15 r=8", (2**15, 8, 1))):
+            res = await bench_cost(n, r, p, logins, concurrency)
+            logger.info(f"{label:12s} ~{128 * n * r >> 20:3d} MiB/hash  {res['logins_s']:7.1f} logins/s  "
+                        f"p50 {res['p50_ms']:6.1f} ms  p99 {res['p99_ms']:6.1f} ms  max loop lag {res['max_loop_lag_ms']:5.1f} ms")
+    main.hash_pool.shutdown()
+
+if __name__ == "__main__":
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    logger.info(f"{main.HASH_WORKERS} hash workers, {concurrency} concurrent clients, {logins} logins per setting")
+    asyncio.run(run(logins, concurrency))
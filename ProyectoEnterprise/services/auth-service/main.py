@@ -2,28 +2,32 @@ from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+from prometheus_client import Counter, Histogram, make_asgi_app
+import asyncio
 import logging
-
-# Security Config
-SECRET_KEY = "enterprise-secret-key-change-this" # In production, use environment variables
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-import hashlib
-
-# Security Config
-SECRET_KEY = "enterprise-secret-key-change-this"
-ALGORITHM = "HS256"
+import os
+import time
+import passwords
+from user_store import CachedUserStore, open_store
+
+# Security Config (api-gateway validates tokens with the same key)
+SECRET_KEY = os.getenv("JWT_SECRET_KEY", "enterprise-secret-key-change-this")
+ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Simple SHA256 hashing for local development (avoiding bcrypt build issues)
-def hash_password(password: str):
-    return hashlib.sha256(password.encode()).hexdigest()
+# Password hashing cost (scrypt n/r/p); memory per hash is ~128*n*r bytes
+SCRYPT_N = int(os.getenv("SCRYPT_N", str(2**14)))
+SCRYPT_R = int(os.getenv("SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("SCRYPT_P", "1"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 2)))
 
-def verify_password(plain_password: str, hashed_password: str):
-    return hash_password(plain_password) == hashed_password
+# User store
+USER_STORE = os.getenv("USER_STORE", "sqlite:///users.db")
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -31,23 +35,47 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("auth-service")
 
-app = FastAPI(title="Industrial Auth Service", version="1.0.0")
-
-# Dummy DB for demo (Replace with PostgreSQL in production)
-USERS_DB = {
-    "admin": {
-        "username": "admin",
-        "full_name": "Admin User",
-        "hashed_password": hash_password("admin123"),
-        "role": "admin"
-    },
-    "operator": {
-        "username": "operator",
-        "full_name": "Shift Operator",
-        "hashed_password": hash_password("op123"),
-        "role": "operator"
-    }
-}
+# --- PROMETHEUS METRICS ---
+LOGINS = Counter('auth_logins_total', 'Login attempts by outcome', ['result'])
+HASH_SECONDS = Histogram('auth_password_hash_seconds', 'Time to hash or verify one password', buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+
+# --- Globals ---
+users = CachedUserStore(open_store(USER_STORE), ttl=USER_CACHE_TTL)
+# scrypt releases the GIL, so hashing in threads keeps the event loop free and uses every core
+hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="scrypt")
+# Verified against when the user does not exist, so unknown names cost the same as bad passwords
+DUMMY_HASH = passwords.hash_password("not-a-password", SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+async def run_hash(fn, *args):
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(hash_pool, fn, *args)
+    finally:
+        HASH_SECONDS.observe(time.perf_counter() - start)
+
+async def hash_password(password: str):
+    return await run_hash(passwords.hash_password, password, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+async def verify_password(plain_password: str, hashed_password: str):
+    return await run_hash(passwords.verify_password, plain_password, hashed_password)
+
+def seed_users():
+    # Demo accounts for an empty store (Replace with real provisioning in production)
+    if users.count(): return
+    logger.info("🌱 User store empty, creating demo users admin/operator")
+    for username, full_name, password, role in (("admin", "Admin User", "admin123", "admin"),
+                                                 ("operator", "Shift Operator", "op123", "operator")):
+        users.put({"username": username, "full_name": full_name, "role": role,
+                   "hashed_password": passwords.hash_password(password, SCRYPT_N, SCRYPT_R, SCRYPT_P)})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    seed_users()
+    yield
+    hash_pool.shutdown(wait=False)
+
+app = FastAPI(title="Industrial Auth Service", version="1.0.0", lifespan=lifespan)
+app.mount("/metrics", make_asgi_app())
 
 class Token(BaseModel):
     access_token: str
@@ -57,6 +85,12 @@ class User(BaseModel):
     username: str
     role: str
 
+class UserIn(BaseModel):
+    username: str
+    password: str
+    role: str
+    full_name: Optional[str] = None
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
@@ -65,13 +99,21 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 
 @app.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = USERS_DB.get(form_data.username)
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    # Store calls block (SQLite), so they run off the event loop like the hashing
+    user = await asyncio.to_thread(users.get, form_data.username)
+    valid = await verify_password(form_data.password, user["hashed_password"] if user else DUMMY_HASH)
+    if not user or not valid:
+        LOGINS.labels(result="rejected").inc()
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if passwords.needs_rehash(user["hashed_password"], SCRYPT_N, SCRYPT_R, SCRYPT_P):
+        # Legacy SHA-256 or an older cost: upgrade while we have the plaintext
+        await asyncio.to_thread(users.put, {**user, "hashed_password": await hash_password(form_data.password)})
+        logger.info(f"🔐 Password hash upgraded for {user['username']}")
+    LOGINS.labels(result="ok").inc()
     access_token = create_access_token(data={"sub": user["username"], "role": user["role"]})
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -90,10 +132,29 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
 
+async def get_admin(current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin role required")
+    return current_user
+
 @app.get("/users/me", response_model=User)
 async def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
+@app.put("/users/{username}", response_model=User)
+async def upsert_user(username: str, body: UserIn, admin: dict = Depends(get_admin)):
+    if body.username != username:
+        raise HTTPException(status_code=400, detail="Username in path and body differ")
+    await asyncio.to_thread(users.put, {"username": username, "full_name": body.full_name, "role": body.role,
+                                        "hashed_password": await hash_password(body.password)})
+    return {"username": username, "role": body.role}
+
+@app.delete("/users/{username}")
+async def delete_user(username: str, admin: dict = Depends(get_admin)):
+    if not await asyncio.to_thread(users.delete, username):
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"status": "deleted", "username": username}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,43 @@
+"""Salted scrypt password hashing.
+
+Stored format (all parameters travel with the hash, so the cost can be
+raised later without breaking existing users):
+
+    scrypt$<n>$<r>$<p>$<salt b64>$<key b64>
+
+Hashes written by the first version of the service (bare SHA-256 hex) still
+verify and are reported by `needs_rehash`, so they get upgraded on the next
+successful login.
+"""
+import base64
+import hashlib
+import hmac
+import os
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+def _b64(raw):
+    return base64.b64encode(raw).decode()
+
+def _derive(password, salt, n, r, p):
+    # scrypt needs ~128*n*r bytes; leave headroom above OpenSSL's 32 MiB default
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=KEY_BYTES, maxmem=256 * n * r * p + (1 << 20))
+
+def hash_password(password, n=2**14, r=8, p=1):
+    salt = os.urandom(SALT_BYTES)
+    return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(_derive(password, salt, n, r, p))}"
+
+def verify_password(password, stored):
+    """Constant-time check against either format; never raises on bad input."""
+    try:
+        if stored.startswith("scrypt$"):
+            _, n, r, p, salt, key = stored.split("$")
+            derived = _derive(password, base64.b64decode(salt), int(n), int(r), int(p))
+            return hmac.compare_digest(derived, base64.b64decode(key))
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+    except (ValueError, TypeError):
+        return False
+
+def needs_rehash(stored, n, r, p):
+    return not stored.startswith(f"scrypt${n}${r}${p}$")
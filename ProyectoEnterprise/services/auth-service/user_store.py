@@ -0,0 +1,111 @@
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from prometheus_client import Counter
+
+# --- PROMETHEUS METRICS ---
+USER_CACHE = Counter('auth_user_cache_requests_total', 'User lookups by cache outcome', ['result'])
+
+FIELDS = ("username", "full_name", "hashed_password", "role")
+
+class UserStore(ABC):
+    """Backend interface: users are plain dicts with FIELDS as keys."""
+    @abstractmethod
+    def get(self, username): ...
+
+    @abstractmethod
+    def put(self, user): ...
+
+    @abstractmethod
+    def delete(self, username): ...
+
+    @abstractmethod
+    def count(self): ...
+
+class SQLiteUserStore(UserStore):
+    """Default backend. One file every replica can share; WAL keeps readers
+    off the writer's lock."""
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS users
+                                 (username TEXT PRIMARY KEY, full_name TEXT, hashed_password TEXT NOT NULL, role TEXT NOT NULL)''')
+            self.conn.commit()
+
+    def get(self, username):
+        with self.lock:
+            row = self.conn.execute("SELECT username, full_name, hashed_password, role FROM users WHERE username = ?", (username,)).fetchone()
+        return dict(zip(FIELDS, row)) if row else None
+
+    def put(self, user):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO users (username, full_name, hashed_password, role) VALUES (?, ?, ?, ?)",
+                              tuple(user.get(f) for f in FIELDS))
+            self.conn.commit()
+
+    def delete(self, username):
+        with self.lock:
+            deleted = self.conn.execute("DELETE FROM users WHERE username = ?", (username,)).rowcount
+            self.conn.commit()
+        return deleted > 0
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+class CachedUserStore(UserStore):
+    """Read-through LRU in front of any backend. Writes made through this
+    instance invalidate their entry at once; changes made by other replicas
+    are picked up when the entry's TTL runs out. Misses are cached too, so a
+    flood of logins for unknown names does not reach the backend."""
+    def __init__(self, backend, ttl=30.0, max_entries=1024):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, username):
+        with self.lock:
+            entry = self.entries.get(username)
+            if entry is not None and time.monotonic() < entry[0]:
+                self.entries.move_to_end(username)
+                USER_CACHE.labels(result="hit").inc()
+                return entry[1]
+        USER_CACHE.labels(result="miss").inc()
+        user = self.backend.get(username)
+        if self.ttl > 0:
+            with self.lock:
+                self.entries[username] = (time.monotonic() + self.ttl, user)
+                self.entries.move_to_end(username)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return user
+
+    def put(self, user):
+        self.backend.put(user)
+        self.invalidate(user["username"])
+
+    def delete(self, username):
+        deleted = self.backend.delete(username)
+        self.invalidate(username)
+        return deleted
+
+    def count(self):
+        return self.backend.count()
+
+    def invalidate(self, username=None):
+        with self.lock:
+            if username is None: self.entries.clear()
+            else: self.entries.pop(username, None)
+
+def open_store(url):
+    """USER_STORE selects the backend, e.g. "sqlite:///users.db" (relative) or "sqlite:////data/users.db"."""
+    scheme, _, path = url.partition("://")
+    if scheme == "sqlite":
+        return SQLiteUserStore(path.removeprefix("/") or "users.db")
+    raise ValueError(f"Unsupported user store: {url}")
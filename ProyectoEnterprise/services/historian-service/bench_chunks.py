@@ -0,0 +1,89 @@
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from bench_ingest import make_db
+from chunkstore import ChunkStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("historian-chunk-bench")
+
+def synthesize(samples, seed=7):
+    """plc-service-like stream as the historian records it: 20 Hz while a
+    trip runs, 1 s heartbeats at rest, a few ms of ingest jitter."""
+    rng = random.Random(seed)
+    rows, t, up = [], 1_700_000_000_000, True
+    while len(rows) < samples:
+        for i in range(84):
+            pos = i / 84 if up else 1 - i / 84
+            rows.append((t + rng.randint(-3, 3), round(pos, 2), up, not up, False, False))
+            t += 50
+        for _ in range(3):
+            rows.append((t + rng.randint(-3, 3), 1.0 if up else 0.0, False, False, not up, up))
+            t += 1000
+        up = not up
+    return rows[:samples]
+
+def bench_sqlite(path, rows, window):
+    make_db(path)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_telemetry_ts ON telemetry(ts)")
+    start = time.perf_counter()
+    for i in range(0, len(rows), 500):
+        with conn:
+            conn.executemany("INSERT INTO telemetry (ts, position, mc1, mc2, ls1, ls2) VALUES (?, ?, ?, ?, ?, ?)", rows[i:i + 500])
+    write_s = time.perf_counter() - start
+    conn.execute("VACUUM")
+    size = os.path.getsize(path)
+    start = time.perf_counter()
+    full = conn.execute("SELECT ts, position, mc1, mc2, ls1, ls2 FROM telemetry ORDER BY ts").fetchall()
+    scan_s = time.perf_counter() - start
+    start = time.perf_counter()
+    ranged = conn.execute("SELECT ts, position, mc1, mc2, ls1, ls2 FROM telemetry WHERE ts >= ? AND ts < ? ORDER BY ts", window).fetchall()
+    range_s = time.perf_counter() - start
+    start = time.perf_counter()
+    conn.execute("SELECT ts, position, mc1, mc2, ls1, ls2 FROM telemetry ORDER BY ts DESC LIMIT 100").fetchall()
+    latest_s = time.perf_counter() - start
+    conn.close()
+    return size, write_s, scan_s, range_s, latest_s, len(full), len(ranged)
+
+def bench_chunks(path, rows, window):
+    store = ChunkStore(path)
+    start = time.perf_counter()
+    for i in range(0, len(rows), 500):
+        store.append(rows[i:i + 500])
+    store.flush()
+    write_s = time.perf_counter() - start
+    size = store.stats()["bytes"]
+    start = time.perf_counter()
+    full = list(store.scan())
+    scan_s = time.perf_counter() - start
+    start = time.perf_counter()
+    ranged = list(store.scan(*window))
+    range_s = time.perf_counter() - start
+    start = time.perf_counter()
+    store.scan_reverse(limit=100)
+    latest_s = time.perf_counter() - start
+    store.close()
+    return size, write_s, scan_s, range_s, latest_s, len(full), len(ranged)
+
+if __name__ == "__main__":
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rows = synthesize(samples)
+    mid = rows[len(rows) // 2][0]
+    window = (mid, mid + 3_600_000)
+    logger.info(f"{len(rows):,} samples over {(rows[-1][0] - rows[0][0]) / 3_600_000:.1f} h")
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            "sqlite": bench_sqlite(os.path.join(tmp, "telemetry.db"), rows, window),
+            "chunks": bench_chunks(os.path.join(tmp, "chunks"), rows, window),
+        }
+    for name, (size, write_s, scan_s, range_s, latest_s, full, ranged) in results.items():
+        logger.info(f"{name:>6}: {size / len(rows):6.2f} B/sample ({size / 1e6:.1f} MB), write {len(rows) / write_s:>9,.0f} rows/s, "
+                    f"full scan {full / scan_s:>9,.0f} rows/s, 1 h range {range_s * 1000:7.1f} ms ({ranged:,} rows), "
+                    f"latest 100 {latest_s * 1000:.2f} ms")
+    ratio = results["sqlite"][0] / results["chunks"][0]
+    logger.info(f"Chunks are x{ratio:.1f} smaller than the SQLite telemetry table + index")
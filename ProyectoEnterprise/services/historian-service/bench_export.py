@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("historian-export-bench")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+def fill(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    start = int(time.time() * 1000) - rows * 50
+    for first in range(0, rows, 50_000):
+        with conn:
+            conn.executemany("INSERT INTO telemetry (ts, position, mc1, mc2, ls1, ls2) VALUES (?, ?, ?, ?, ?, ?)",
+                             [(start + i * 50, (i % 100) / 100.0, i % 7 < 3, 3 <= i % 7 < 6, False, False)
+                              for i in range(first, min(first + 50_000, rows))])
+    conn.close()
+
+async def probe(client, stop, latencies):
+    """A dashboard-style request every 50 ms while the export runs."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/history/telemetry", params={"limit": 100})
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.05)
+
+async def run(port, fmt):
+    import httpx
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+        idle = []
+        for _ in range(20):
+            start = time.perf_counter()
+            await client.get("/history/telemetry", params={"limit": 100})
+            idle.append(time.perf_counter() - start)
+        stop, busy = asyncio.Event(), []
+        prober = asyncio.create_task(probe(client, stop, busy))
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        lines = size = 0
+        async with client.stream("GET", "/history/export/telemetry", params={"format": fmt}) as r:
+            async for chunk in r.aiter_bytes():
+                size += len(chunk)
+                lines += chunk.count(b"\n")
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await prober
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return lines, size, elapsed, sorted(idle), sorted(busy), (rss_after - rss_before) / 1024
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    fmt = sys.argv[2] if len(sys.argv) > 2 else "ndjson"
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_PATH"] = os.path.join(tmp, "historian.db")
+        os.environ["MQTT_BROKER"] = os.getenv("MQTT_BROKER", "127.0.0.1")
+        import uvicorn
+        import main
+        main.init_db()
+        fill(os.environ["DB_PATH"], rows)
+        logger.info(f"Filled {rows:,} rows ({rows * 50 / 86_400_000:.1f} days at 20 Hz)")
+        # Only the HTTP side is exercised (lifespan off): no MQTT, no writer
+        server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=8093, log_level="warning", lifespan="off"))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started: time.sleep(0.05)
+        lines, size, elapsed, idle, busy, rss = asyncio.run(run(8093, fmt))
+        server.should_exit = True
+        main.readers.close()
+    p = lambda xs, q: xs[min(len(xs) - 1, int(q * len(xs)))] * 1000
+    logger.info(f"Exported {lines:,} {fmt} lines ({size / 1e6:.0f} MB) in {elapsed:.1f}s -> {lines / elapsed:,.0f} rows/s, peak RSS +{rss:.0f} MB")
+    logger.info(f"/history/telemetry?limit=100 idle p50 {p(idle, .5):.1f} ms / p99 {p(idle, .99):.1f} ms; "
+                f"during export p50 {p(busy, .5):.1f} ms / p99 {p(busy, .99):.1f} ms ({len(busy)} requests)")
@@ -0,0 +1,45 @@
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from bench_ingest import make_db
+from bench_rollups import fill, timed
+from hottier import HotTier
+from rollups import Rollups, bucketize
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("historian-hot-bench")
+
+def dashboard_reads(conn, hot, start, end, window_ms):
+    """The two dashboard shapes: last 100 samples, and the hot window in 1 s buckets."""
+    conn.row_factory = sqlite3.Row
+    recent = "SELECT id, ts, position, mc1, mc2, ls1, ls2 FROM telemetry ORDER BY ts DESC LIMIT 100"
+    since = end - window_ms
+    yield "last 100 rows", \
+        lambda: [dict(r) for r in conn.execute(recent).fetchall()], \
+        lambda: hot.newest("machine", None, None, 100)[0]
+    yield f"last {window_ms // 1000}s in 1s buckets", \
+        lambda: bucketize(conn.execute("SELECT ts, position, mc1, mc2, ls1, ls2 FROM telemetry WHERE ts >= ?", (since,)), 1000), \
+        lambda: bucketize(hot.scan("machine", since, None), 1000)
+
+if __name__ == "__main__":
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    window_ms = int(float(sys.argv[2]) * 1000) if len(sys.argv) > 2 else 300_000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "hot.db")
+        make_db(path)
+        conn, start, end, rows, _ = fill(path, Rollups(0, {}), hours)
+        hot = HotTier(window_ms)
+        began = time.perf_counter()
+        for ts, *values in conn.execute("SELECT ts, position, mc1, mc2, ls1, ls2 FROM telemetry ORDER BY ts"):
+            hot.append("machine", (ts, *values))
+        elapsed = time.perf_counter() - began
+        logger.info(f"Hot tier ingested {rows:,} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s), "
+                    f"holding {len(hot.scan('machine')):,}")
+        for name, disk, memory in dashboard_reads(conn, hot, start, end, window_ms):
+            disk_s, _ = timed(disk, repeat=20)
+            hot_s, _ = timed(memory, repeat=20)
+            logger.info(f"{name}: sqlite {disk_s * 1000:.2f} ms, hot {hot_s * 1000:.3f} ms -> x{disk_s / hot_s:,.0f}")
+        conn.close()
@@ -0,0 +1,64 @@
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from writer import BatchWriter
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("historian-bench")
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS telemetry
+            (id INTEGER PRIMARY KEY AUTOINCREMENT, ts INTEGER NOT NULL, position REAL, mc1 BOOLEAN, mc2 BOOLEAN, ls1 BOOLEAN, ls2 BOOLEAN)'''
+EVENTS = '''CREATE TABLE IF NOT EXISTS events
+            (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, code TEXT, message TEXT, severity TEXT)'''
+
+def make_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute(SCHEMA)
+    conn.execute(EVENTS)
+    conn.commit()
+    conn.close()
+
+def sample_row(i):
+    return (int(time.time() * 1000), (i % 100) / 100.0, i % 2 == 0, i % 2 == 1, False, False)
+
+def bench_per_row(path, rows):
+    """Legacy behaviour: connect, insert, commit and close for every message."""
+    start = time.perf_counter()
+    for i in range(rows):
+        conn = sqlite3.connect(path)
+        conn.execute("INSERT INTO telemetry (ts, position, mc1, mc2, ls1, ls2) VALUES (?, ?, ?, ?, ?, ?)", sample_row(i))
+        conn.commit()
+        conn.close()
+    return rows / (time.perf_counter() - start)
+
+def bench_batched(path, rows):
+    writer = BatchWriter(path, batch_size=500, flush_interval=0.5, max_queue=rows + 1)
+    writer.start()
+    start = time.perf_counter()
+    for i in range(rows):
+        writer.submit("telemetry", sample_row(i))
+    writer.stop(timeout=120)
+    elapsed = time.perf_counter() - start
+    conn = sqlite3.connect(path)
+    stored = conn.execute("SELECT COUNT(*) FROM telemetry").fetchone()[0]
+    conn.close()
+    return stored / elapsed, stored
+
+if __name__ == "__main__":
+    legacy_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    batch_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_db = os.path.join(tmp, "legacy.db")
+        batched_db = os.path.join(tmp, "batched.db")
+        make_db(legacy_db)
+        make_db(batched_db)
+
+        legacy_rate = bench_per_row(legacy_db, legacy_rows)
+        logger.info(f"Per-row connect/commit: {legacy_rate:,.0f} rows/s ({legacy_rows} rows)")
+
+        batched_rate, stored = bench_batched(batched_db, batch_rows)
+        logger.info(f"Batched WAL writer:     {batched_rate:,.0f} rows/s ({stored} rows)")
+        logger.info(f"Speedup: x{batched_rate / legacy_rate:.1f} (20 Hz per PLC -> ~{batched_rate / 20:,.0f} PLCs)")
@@ -0,0 +1,52 @@
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from bench_ingest import make_db
+from rollups import Rollups
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("historian-rollup-bench")
+
+def fill(path, rollups, hours, batch=500):
+    """`hours` of 20 Hz telemetry, written in writer-sized batches with the rollups applied."""
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_telemetry_ts ON telemetry(ts)")
+    rollups.create(conn.cursor())
+    end = int(time.time() * 1000)
+    start = end - int(hours * 3_600_000)
+    rows = int(hours * 3600 * 20)
+    began = time.perf_counter()
+    for first in range(0, rows, batch):
+        chunk = [(start + i * 50, (i % 100) / 100.0, i % 7 < 3, 3 <= i % 7 < 6, False, False)
+                 for i in range(first, min(first + batch, rows))]
+        with conn:
+            conn.executemany("INSERT INTO telemetry (ts, position, mc1, mc2, ls1, ls2) VALUES (?, ?, ?, ?, ?, ?)", chunk)
+            rollups.apply(conn, chunk)
+    return conn, start, end, rows, time.perf_counter() - began
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        began = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - began)
+    return best, result
+
+if __name__ == "__main__":
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 24.0
+    rollups = Rollups(0, {})
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rollups.db")
+        make_db(path)
+        conn, start, end, rows, elapsed = fill(path, rollups, hours)
+        logger.info(f"Ingested {rows:,} rows with rollups in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+        for bucket in (60_000, 3_600_000):
+            tier = rollups.pick(start, end, bucket, end)
+            raw_s, raw = timed(lambda: rollups.query(conn, rollups.raw, start, end, bucket))
+            tier_s, rolled = timed(lambda: rollups.query(conn, tier, start, end, bucket))
+            logger.info(f"{hours:g} h in {bucket // 1000}s buckets: raw {raw_s * 1000:.1f} ms ({len(raw)} rows), "
+                        f"{tier.name} tier {tier_s * 1000:.2f} ms ({len(rolled)} rows) -> x{raw_s / tier_s:,.0f}")
+        conn.close()
@@ -0,0 +1,410 @@
+"""Compressed, time-partitioned telemetry storage (HISTORIAN_BACKEND=chunks).
+
+Each partition (HISTORIAN_CHUNK_HOURS wide) is one append-only file of
+sealed blocks. A block holds up to `block_rows` samples, column by column:
+
+    header   "<2sHqqIII": magic, rows, min ts, max ts, ts/pos/bool stream sizes
+    ts       first ts raw, then delta-of-delta codes (Gorilla):
+             0 | 10+7b | 110+9b | 1110+12b | 1111+64b
+    position float64 XOR with the previous value (Gorilla):
+             0 same | 10 + bits inside the previous window | 11 + 5b lead, 6b len, bits
+    bools    mc1/mc2/ls1/ls2 as one 4-bit state per sample, run-length
+             encoded as (varint run, state byte) pairs
+
+Rows not yet sealed live in memory and in `head.log`, which is replayed on
+open and truncated every time a block is sealed. Readers memory-map the
+partition files and skip blocks by their header's time range.
+"""
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+
+logger = logging.getLogger("historian-service.chunks")
+
+BLOCK = struct.Struct("<2sHqqIII")
+MAGIC = b"TB"
+HEAD_ROW = struct.Struct("<qdB")
+SUFFIX = ".tsc"
+
+# --- Bit streams ---
+class BitWriter:
+    def __init__(self):
+        self.buf = bytearray()
+        self.acc = 0
+        self.n = 0
+
+    def write(self, value, bits):
+        self.acc = (self.acc << bits) | value
+        self.n += bits
+        if self.n >= 32:
+            whole = self.n >> 3
+            rest = self.n - (whole << 3)
+            self.buf += (self.acc >> rest).to_bytes(whole, "big")
+            self.acc &= (1 << rest) - 1
+            self.n = rest
+
+    def getvalue(self):
+        if self.n:
+            pad = -self.n % 8
+            self.buf += (self.acc << pad).to_bytes((self.n + pad) >> 3, "big")
+            self.acc = self.n = 0
+        return bytes(self.buf)
+
+class BitReader:
+    """Reads through a 64-bit window, so no read costs more than one 8-byte
+    int.from_bytes whatever the stream length. `bits` <= 57."""
+    def __init__(self, data):
+        self.data = bytes(data) + bytes(8)
+        self.pos = 0
+
+    def read(self, bits):
+        p = self.pos
+        self.pos = p + bits
+        start = p >> 3
+        window = int.from_bytes(self.data[start:start + 8], "big")
+        return (window >> (64 - (p & 7) - bits)) & ((1 << bits) - 1)
+
+    def bit(self):
+        p = self.pos
+        self.pos = p + 1
+        return (self.data[p >> 3] >> (7 - (p & 7))) & 1
+
+    def read64(self):
+        return (self.read(32) << 32) | self.read(32)
+
+# --- Column codecs ---
+# (prefix, prefix bits, value bits, bias) for delta-of-delta ranges
+DOD_CLASSES = ((0b10, 2, 7, 63), (0b110, 3, 9, 255), (0b1110, 4, 12, 2047))
+
+def encode_timestamps(ts):
+    w = BitWriter()
+    w.write(ts[0] & 0xFFFFFFFFFFFFFFFF, 64)
+    prev, delta = ts[0], 0
+    for t in ts[1:]:
+        d = t - prev
+        dod = d - delta
+        prev, delta = t, d
+        if dod == 0:
+            w.write(0, 1)
+            continue
+        for prefix, plen, vbits, bias in DOD_CLASSES:
+            if -bias <= dod <= bias + 1:
+                w.write(prefix, plen)
+                w.write(dod + bias, vbits)
+                break
+        else:
+            w.write(0b1111, 4)
+            w.write(dod & 0xFFFFFFFFFFFFFFFF, 64)
+    return w.getvalue()
+
+def _signed64(v):
+    return v - (1 << 64) if v >= 1 << 63 else v
+
+def decode_timestamps(data, count):
+    r = BitReader(data)
+    t = _signed64(r.read64())
+    out = [t]
+    delta = 0
+    bit, read = r.bit, r.read
+    for _ in range(count - 1):
+        if bit():
+            if not bit(): delta += read(7) - 63
+            elif not bit(): delta += read(9) - 255
+            elif not bit(): delta += read(12) - 2047
+            else: delta += _signed64(r.read64())
+        t += delta
+        out.append(t)
+    return out
+
+def encode_floats(values):
+    bits = struct.unpack(f"<{len(values)}Q", struct.pack(f"<{len(values)}d", *values))
+    w = BitWriter()
+    w.write(bits[0], 64)
+    prev, lead, trail = bits[0], 65, 0 # no window yet
+    for v in bits[1:]:
+        x = v ^ prev
+        prev = v
+        if x == 0:
+            w.write(0, 1)
+            continue
+        l = min(64 - x.bit_length(), 31)
+        t = (x & -x).bit_length() - 1
+        if l >= lead and t >= trail:
+            w.write(0b10, 2)
+            w.write(x >> trail, 64 - lead - trail)
+        else:
+            lead, trail = l, t
+            size = 64 - l - t
+            w.write(0b11, 2)
+            w.write(l, 5)
+            w.write(size - 1, 6)
+            w.write(x >> t, size)
+    return w.getvalue()
+
+def decode_floats(data, count):
+    # BitReader inlined: this loop is most of a scan's decode time
+    data = bytes(data) + bytes(8)
+    from_bytes = int.from_bytes
+    v = from_bytes(data[:8], "big")
+    out = [v]
+    p, trail, size = 64, 0, 0
+    for _ in range(count - 1):
+        byte = data[p >> 3]
+        if not (byte >> (7 - (p & 7))) & 1:
+            p += 1
+            out.append(v)
+            continue
+        window = from_bytes(data[p >> 3:(p >> 3) + 8], "big") << (p & 7) & 0xFFFFFFFFFFFFFFFF
+        if window >> 62 == 0b11:
+            lead = window >> 57 & 0x1F
+            size = (window >> 51 & 0x3F) + 1
+            trail = 64 - lead - size
+            p += 13
+        else:
+            p += 2
+        if size <= 57:
+            start = p >> 3
+            x = (from_bytes(data[start:start + 8], "big") >> (64 - (p & 7) - size)) & ((1 << size) - 1)
+        else:
+            start = p >> 3
+            x = (from_bytes(data[start:start + 9], "big") >> (72 - (p & 7) - size)) & ((1 << size) - 1)
+        p += size
+        v ^= x << trail
+        out.append(v)
+    return list(struct.unpack(f"<{count}d", struct.pack(f"<{count}Q", *out)))
+
+def encode_states(states):
+    out = bytearray()
+    run, current = 0, states[0]
+    for s in states:
+        if s == current:
+            run += 1
+            continue
+        _put_run(out, run, current)
+        run, current = 1, s
+    _put_run(out, run, current)
+    return bytes(out)
+
+def _put_run(out, run, state):
+    while run >= 0x80:
+        out.append((run & 0x7F) | 0x80)
+        run >>= 7
+    out.append(run)
+    out.append(state)
+
+def decode_states(data):
+    out, i, n = [], 0, len(data)
+    while i < n:
+        run = shift = 0
+        while True:
+            b = data[i]
+            i += 1
+            run |= (b & 0x7F) << shift
+            shift += 7
+            if b < 0x80: break
+        out.extend((data[i],) * run)
+        i += 1
+    return out
+
+# state nibble -> (mc1, mc2, ls1, ls2)
+STATE_BITS = [(s & 1, s >> 1 & 1, s >> 2 & 1, s >> 3 & 1) for s in range(16)]
+
+def pack_state(mc1, mc2, ls1, ls2):
+    return bool(mc1) | bool(mc2) << 1 | bool(ls1) << 2 | bool(ls2) << 3
+
+def encode_block(rows):
+    """rows: (ts, position, mc1, mc2, ls1, ls2), any order within the block."""
+    rows = sorted(rows, key=lambda r: r[0])
+    ts = [r[0] for r in rows]
+    tsb = encode_timestamps(ts)
+    posb = encode_floats([r[1] if r[1] is not None else math.nan for r in rows])
+    boolb = encode_states([pack_state(*r[2:6]) for r in rows])
+    return BLOCK.pack(MAGIC, len(rows), ts[0], ts[-1], len(tsb), len(posb), len(boolb)) + tsb + posb + boolb
+
+def decode_block(buf, offset, count, ts_len, pos_len, bool_len):
+    p = offset + BLOCK.size
+    ts = decode_timestamps(buf[p:p + ts_len], count)
+    p += ts_len
+    pos = decode_floats(buf[p:p + pos_len], count)
+    p += pos_len
+    states = decode_states(buf[p:p + bool_len])
+    bits = STATE_BITS
+    return [(t, x if x == x else None, *bits[s]) for t, x, s in zip(ts, pos, states)]
+
+# --- Store ---
+def _bounds(start, end):
+    return (start if start is not None else -(1 << 63)), (end if end is not None else 1 << 63)
+
+class Partition:
+    """One memory-mapped partition file and the index of its blocks."""
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self.map = None
+        self.blocks = [] # (offset, rows, min ts, max ts, ts/pos/bool sizes)
+
+    def refresh(self):
+        size = os.path.getsize(self.path)
+        if size == self.size: return
+        # The old map is not closed here: a reader may still be decoding from it
+        with open(self.path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        offset = self.blocks[-1][0] + BLOCK.size + sum(self.blocks[-1][4:]) if self.blocks else 0
+        while offset + BLOCK.size <= size:
+            magic, rows, lo, hi, a, b, c = BLOCK.unpack_from(self.map, offset)
+            if magic != MAGIC or offset + BLOCK.size + a + b + c > size:
+                logger.warning(f"⚠️ Bloque truncado en {self.path} @ {offset}, se ignora el resto")
+                break
+            self.blocks.append((offset, rows, lo, hi, a, b, c))
+            offset += BLOCK.size + a + b + c
+        self.size = size
+
+    def close(self):
+        if self.map is not None: self.map.close()
+        self.map = None
+
+class ChunkStore:
+    def __init__(self, path, chunk_ms=3_600_000, block_rows=4096, fsync=False):
+        self.path = path
+        self.chunk_ms = chunk_ms
+        self.block_rows = block_rows
+        self.fsync = fsync
+        self.lock = threading.RLock()
+        self.partitions = {}
+        self.head = [] # unsealed rows of the newest partition
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.endswith(SUFFIX):
+                start = int(name[:-len(SUFFIX)])
+                self.partitions[start] = Partition(os.path.join(path, name))
+        self.head_path = os.path.join(path, "head.log")
+        self._replay_head()
+        self.head_file = open(self.head_path, "ab")
+
+    def _replay_head(self):
+        if not os.path.exists(self.head_path): return
+        with open(self.head_path, "rb") as f:
+            data = f.read()
+        usable = len(data) - len(data) % HEAD_ROW.size
+        for ts, pos, state in HEAD_ROW.iter_unpack(data[:usable]):
+            if self._sealed(ts): continue # crash between sealing a block and truncating the log
+            self.head.append((ts, pos if pos == pos else None, *STATE_BITS[state]))
+        if self.head: logger.info(f"🔁 {len(self.head)} muestras sin sellar recuperadas de {self.head_path}")
+
+    def _sealed(self, ts):
+        part = self.partitions.get(self.partition_of(ts))
+        if part is None: return False
+        part.refresh()
+        return bool(part.blocks) and ts <= part.blocks[-1][3]
+
+    def partition_of(self, ts):
+        return ts // self.chunk_ms * self.chunk_ms
+
+    def append(self, rows):
+        """Adds (ts, position, mc1, mc2, ls1, ls2) rows; seals a block when the
+        head is full or a row belongs to a later partition."""
+        with self.lock:
+            log = bytearray()
+            for row in rows:
+                if self.head and self.partition_of(row[0]) > self.partition_of(self.head[0][0]):
+                    self._write_head_log(log)
+                    log = bytearray()
+                    self._seal()
+                state = pack_state(*row[2:6])
+                self.head.append((row[0], row[1], *STATE_BITS[state])) # 0/1 like sealed rows and SQLite
+                log += HEAD_ROW.pack(row[0], row[1] if row[1] is not None else math.nan, state)
+                if len(self.head) >= self.block_rows:
+                    self._write_head_log(log)
+                    log = bytearray()
+                    self._seal()
+            self._write_head_log(log)
+
+    def _write_head_log(self, data):
+        if not data: return
+        self.head_file.write(data)
+        self.head_file.flush()
+        if self.fsync: os.fsync(self.head_file.fileno())
+
+    def _seal(self):
+        if not self.head: return
+        start = self.partition_of(self.head[0][0])
+        part = self.partitions.get(start)
+        if part is None:
+            part = self.partitions[start] = Partition(os.path.join(self.path, f"{start}{SUFFIX}"))
+        with open(part.path, "ab") as f:
+            f.write(encode_block(self.head))
+            f.flush()
+            os.fsync(f.fileno())
+        self.head = []
+        self.head_file.truncate(0)
+        self.head_file.seek(0)
+
+    def flush(self):
+        with self.lock:
+            self._seal()
+
+    def close(self):
+        with self.lock:
+            self._seal()
+            self.head_file.close()
+            for part in self.partitions.values(): part.close()
+
+    def _snapshot(self, lo, hi):
+        """Blocks and head rows overlapping [lo, hi), taken under one lock so a
+        block sealed meanwhile is seen exactly once."""
+        with self.lock:
+            blocks = []
+            for start, part in sorted(self.partitions.items()):
+                if start + self.chunk_ms <= lo or start >= hi: continue
+                part.refresh()
+                blocks += [(part.map, b) for b in part.blocks if b[3] >= lo and b[2] < hi]
+            head = sorted(r for r in self.head if lo <= r[0] < hi)
+        return blocks, head
+
+    @staticmethod
+    def _rows(buf, block, lo, hi):
+        offset, rows, bmin, bmax, a, b, c = block
+        decoded = decode_block(buf, offset, rows, a, b, c)
+        return decoded if bmin >= lo and bmax < hi else [r for r in decoded if lo <= r[0] < hi]
+
+    def scan(self, start=None, end=None):
+        """Rows with start <= ts < end, oldest first."""
+        lo, hi = _bounds(start, end)
+        blocks, head = self._snapshot(lo, hi)
+        for buf, block in blocks:
+            yield from self._rows(buf, block, lo, hi)
+        yield from head
+
+    def scan_reverse(self, start=None, end=None, limit=None):
+        """Newest first; decodes blocks from the end only until `limit` rows."""
+        lo, hi = _bounds(start, end)
+        blocks, head = self._snapshot(lo, hi)
+        out = head[::-1]
+        for buf, block in reversed(blocks):
+            if limit is not None and len(out) >= limit: break
+            out.extend(reversed(self._rows(buf, block, lo, hi)))
+        return out[:limit] if limit is not None else out
+
+    def drop_before(self, ts):
+        """Retention: deletes whole partitions that end before `ts`."""
+        dropped = 0
+        with self.lock:
+            for start in [s for s in self.partitions if s + self.chunk_ms <= ts]:
+                part = self.partitions.pop(start)
+                part.refresh()
+                dropped += sum(b[1] for b in part.blocks)
+                os.remove(part.path) # open maps stay valid until their readers drop them
+        return dropped
+
+    def stats(self):
+        with self.lock:
+            for part in self.partitions.values(): part.refresh()
+            return {
+                "partitions": len(self.partitions),
+                "blocks": sum(len(p.blocks) for p in self.partitions.values()),
+                "rows": sum(b[1] for p in self.partitions.values() for b in p.blocks) + len(self.head),
+                "bytes": sum(p.size for p in self.partitions.values())
+            }
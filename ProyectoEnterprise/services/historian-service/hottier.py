@@ -0,0 +1,103 @@
+"""In-memory hot tier: the last HISTORIAN_HOT_SECONDS of telemetry per asset.
+
+Each asset keeps three parallel columns (array 'q' ts, 'd' position, 'B'
+packed mc1/mc2/ls1/ls2 state, as in chunkstore) filled from the MQTT ingest
+path. Rows are appended in ts order and aged out by advancing `head`; the
+dead prefix is dropped in one memmove once it is half the buffer, so
+appends stay amortised O(1) and the live rows stay contiguous. Reads
+bisect the ts column and walk memoryview slices of the columns under the
+lock (a live export would block the arrays from resizing).
+
+`since` is the oldest ts from which the ring holds every ingested row; a
+query whose range starts at or after it never needs the disk.
+"""
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from prometheus_client import Counter, Gauge
+from chunkstore import STATE_BITS, pack_state, _bounds
+
+# --- PROMETHEUS METRICS ---
+HOT_REQUESTS = Counter('historian_hot_requests_total', 'Telemetry reads by how much the hot tier served (hit, partial, miss)', ['result'])
+HOT_ROWS = Gauge('historian_hot_rows', 'Rows held in the hot tier', ['asset'])
+
+COMPACT_MIN = 1024
+
+class Ring:
+    def __init__(self, asset, window_ms, max_rows, since):
+        self.window_ms = window_ms
+        self.max_rows = max_rows
+        self.since = since
+        self.ts = array('q')
+        self.pos = array('d')
+        self.state = array('B')
+        self.head = 0
+        self.gauge = HOT_ROWS.labels(asset=asset)
+
+    def append(self, ts, position, mc1, mc2, ls1, ls2):
+        if len(self.ts) > self.head and ts < self.ts[-1]:
+            # Clock stepped back: the columns must stay sorted, so start over
+            self._clear()
+            self.since = ts
+        self.ts.append(ts)
+        self.pos.append(position if position is not None else math.nan)
+        self.state.append(pack_state(mc1, mc2, ls1, ls2))
+        head = max(bisect_left(self.ts, ts - self.window_ms, self.head), len(self.ts) - self.max_rows)
+        if head > self.head:
+            # Evict whole timestamps so no live row is older than `since`
+            self.since = max(self.since, self.ts[head - 1] + 1)
+            self.head = head = bisect_left(self.ts, self.since, head)
+            if head >= COMPACT_MIN and head * 2 >= len(self.ts):
+                del self.ts[:head], self.pos[:head], self.state[:head]
+                self.head = 0
+        self.gauge.set(len(self.ts) - self.head)
+
+    def _clear(self):
+        del self.ts[:], self.pos[:], self.state[:]
+        self.head = 0
+
+    def _span(self, lo, hi):
+        return bisect_left(self.ts, lo, self.head), bisect_left(self.ts, hi, self.head)
+
+    def _rows(self, i, j):
+        with memoryview(self.ts)[i:j] as ts, memoryview(self.pos)[i:j] as pos, memoryview(self.state)[i:j] as state:
+            bits = STATE_BITS
+            return [(t, x if x == x else None, *bits[s]) for t, x, s in zip(ts, pos, state)]
+
+class HotTier:
+    """Per-asset rings of recent telemetry. One lock covers every ring: the
+    MQTT thread is the only writer and reads are a bisect and a short walk."""
+    def __init__(self, window_ms, max_rows=200_000):
+        self.window_ms = window_ms
+        self.max_rows = max_rows
+        self.rings = {}
+        self.lock = threading.Lock()
+
+    def append(self, asset, row):
+        """row: (ts, position, mc1, mc2, ls1, ls2), ts non-decreasing per asset."""
+        with self.lock:
+            ring = self.rings.get(asset)
+            if ring is None:
+                ring = self.rings[asset] = Ring(asset, self.window_ms, self.max_rows, row[0])
+            ring.append(*row)
+
+    def covers(self, asset, start):
+        ring = self.rings.get(asset)
+        return ring is not None and start is not None and start >= ring.since
+
+    def scan(self, asset, start=None, end=None):
+        """Rows with start <= ts < end, oldest first."""
+        with self.lock:
+            ring = self.rings.get(asset)
+            if ring is None: return []
+            return ring._rows(*ring._span(*_bounds(start, end)))
+
+    def newest(self, asset, start=None, end=None, limit=100):
+        """Up to `limit` rows in [start, end), newest first, plus the ring's
+        `since` read under the same lock (None when the asset has no ring)."""
+        with self.lock:
+            ring = self.rings.get(asset)
+            if ring is None: return [], None
+            i, j = ring._span(*_bounds(start, end))
+            return ring._rows(max(i, j - limit), j)[::-1], ring.since
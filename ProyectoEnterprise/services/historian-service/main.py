@@ -1,12 +1,22 @@
-import json
 import logging
 import os
 import sqlite3
+import time
 from datetime import datetime
 from contextlib import asynccontextmanager
+from itertools import islice
+from typing import Optional
 import paho.mqtt.client as mqtt
-from fastapi import FastAPI
+import telemetry_codec
+from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import Counter, make_asgi_app
+from chunkstore import ChunkStore
+from hottier import HOT_REQUESTS, HotTier
+from readers import ReadPool, stream_pages
+from rollups import TIER_QUERIES, Rollups, bucketize
+from writer import BatchWriter
 
 # --- Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -14,51 +24,98 @@ logger = logging.getLogger("historian-service")
 
 # --- Config ---
 MQTT_BROKER = os.getenv("MQTT_BROKER", "127.0.0.1")
-DB_PATH = "historian.db"
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "json") # json | binary
+# The telemetry tables hold a single asset; with a plc-service PLC_FLEET run one historian per asset
+HISTORIAN_ASSET = os.getenv("HISTORIAN_ASSET", "machine")
+STATE_TOPIC = telemetry_codec.state_topic(f"enterprise/{HISTORIAN_ASSET}/state", WIRE_FORMAT == "binary")
+DB_PATH = os.getenv("DB_PATH", "historian.db")
+BATCH_SIZE = int(os.getenv("HISTORIAN_BATCH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.getenv("HISTORIAN_FLUSH_INTERVAL", "0.5"))
+QUEUE_SIZE = int(os.getenv("HISTORIAN_QUEUE_SIZE", "50000"))
+
+MAX_BUCKETS = int(os.getenv("HISTORIAN_MAX_BUCKETS", "2000"))
+READ_WORKERS = int(os.getenv("HISTORIAN_READ_WORKERS", "4"))
+EXPORT_PAGE_ROWS = int(os.getenv("HISTORIAN_EXPORT_PAGE_ROWS", "5000"))
+# Retention in hours per tier (0 = forever); rollups outlive the raw rows they summarise
+HOUR_MS = 3_600_000
+RAW_RETENTION_MS = int(float(os.getenv("HISTORIAN_RAW_RETENTION_H", "48")) * HOUR_MS)
+ROLLUP_RETENTION_MS = {
+    "1s": int(float(os.getenv("HISTORIAN_1S_RETENTION_H", "336")) * HOUR_MS),
+    "1m": int(float(os.getenv("HISTORIAN_1M_RETENTION_H", "8760")) * HOUR_MS),
+    "1h": int(float(os.getenv("HISTORIAN_1H_RETENTION_H", "0")) * HOUR_MS),
+}
+COMPACT_INTERVAL = float(os.getenv("HISTORIAN_COMPACT_INTERVAL", "60"))
+# Raw telemetry storage: sqlite (telemetry table) | chunks (compressed files, see chunkstore.py)
+BACKEND = os.getenv("HISTORIAN_BACKEND", "sqlite")
+CHUNK_DIR = os.getenv("HISTORIAN_CHUNK_DIR", "chunks")
+CHUNK_MS = int(float(os.getenv("HISTORIAN_CHUNK_HOURS", "1")) * HOUR_MS)
+BLOCK_ROWS = int(os.getenv("HISTORIAN_BLOCK_ROWS", "4096"))
+# Recent telemetry served from memory (0 = off)
+HOT_WINDOW_MS = int(float(os.getenv("HISTORIAN_HOT_SECONDS", "300")) * 1000)
+HOT_MAX_ROWS = int(os.getenv("HISTORIAN_HOT_MAX_ROWS", "200000"))
 
 # --- Database ---
 def init_db():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
+    # ts = epoch milliseconds (UTC); integer keys keep range scans on the index cheap
     cursor.execute('''CREATE TABLE IF NOT EXISTS telemetry 
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, position REAL, mc1 BOOLEAN, mc2 BOOLEAN, ls1 BOOLEAN, ls2 BOOLEAN)''')
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, ts INTEGER NOT NULL, position REAL, mc1 BOOLEAN, mc2 BOOLEAN, ls1 BOOLEAN, ls2 BOOLEAN)''')
     cursor.execute('''CREATE TABLE IF NOT EXISTS events 
                      (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, code TEXT, message TEXT, severity TEXT)''')
+    migrate_telemetry_ts(cursor)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_telemetry_ts ON telemetry(ts)")
+    rollups.create(cursor)
     conn.commit()
     conn.close()
 
-def save_event(event_type, data):
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        ts = datetime.now().isoformat()
-        
-        if event_type == 'machine.state.changed':
-            cursor.execute("INSERT INTO telemetry (timestamp, position, mc1, mc2, ls1, ls2) VALUES (?, ?, ?, ?, ?, ?)",
-                           (ts, data.get('pos'), data.get('mc1'), data.get('mc2'), data.get('ls1'), data.get('ls2')))
-        elif event_type in ['alarm', 'alarm.predictive']:
-            cursor.execute("INSERT INTO events (timestamp, code, message, severity) VALUES (?, ?, ?, ?)",
-                           (ts, data.get('code'), data.get('message'), data.get('severity')))
-        
-        conn.commit()
-    except Exception as e:
-        logger.error(f"Error saving to Historian DB: {e}")
-    finally:
-        conn.close()
+def migrate_telemetry_ts(cursor):
+    """Databases created before the epoch column store ISO text in `timestamp`;
+    add `ts` and backfill it once. That text came from datetime.now(), so it
+    is converted from local time, matching ms_to_iso on the way out."""
+    columns = [r[1] for r in cursor.execute("PRAGMA table_info(telemetry)")]
+    if "ts" in columns: return
+    logger.info("🛠️ Migrando telemetry.timestamp (ISO) -> telemetry.ts (epoch ms)")
+    cursor.execute("ALTER TABLE telemetry ADD COLUMN ts INTEGER")
+    cursor.execute("UPDATE telemetry SET ts = CAST(ROUND((julianday(timestamp, 'utc') - 2440587.5) * 86400000) AS INTEGER)")
+
+def now_ms():
+    return int(time.time() * 1000)
+
+def ms_to_iso(ts):
+    return datetime.fromtimestamp(ts / 1000).isoformat()
+
+rollups = Rollups(RAW_RETENTION_MS, ROLLUP_RETENTION_MS)
+store = ChunkStore(CHUNK_DIR, CHUNK_MS, min(BLOCK_ROWS, 65535)) if BACKEND == "chunks" else None
+writer = BatchWriter(DB_PATH, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, max_queue=QUEUE_SIZE,
+                     rollups=rollups, compact_interval=COMPACT_INTERVAL, store=store)
+readers = ReadPool(DB_PATH, READ_WORKERS)
+hot = HotTier(HOT_WINDOW_MS, HOT_MAX_ROWS) if HOT_WINDOW_MS > 0 else None
+
+def save_event(event_type, data, asset=HISTORIAN_ASSET):
+    # Timestamp at ingest so batching does not shift the recorded time
+    if event_type == 'machine.state.changed':
+        row = (now_ms(), data.get('pos'), data.get('mc1'), data.get('mc2'), data.get('ls1'), data.get('ls2'))
+        if hot: hot.append(asset, row)
+        writer.submit("telemetry", row)
+    elif event_type in ['alarm', 'alarm.predictive']:
+        writer.submit("events", (datetime.now().isoformat(), data.get('code'), data.get('message'), data.get('severity')))
 
 # --- MQTT Client ---
+MQTT_CONSUMED = Counter('mqtt_messages_consumed_total', 'MQTT messages handled by on_message')
 def on_connect(client, userdata, flags, reason_code, properties):
     logger.info(f"📡 Historian conectado al Broker (RC: {reason_code})")
-    client.subscribe("enterprise/machine/state")
+    client.subscribe(STATE_TOPIC)
     client.subscribe("enterprise/alarms")
 
 def on_message(client, userdata, msg):
     try:
-        payload = json.loads(msg.payload.decode())
+        payload = telemetry_codec.decode_message(msg.topic, msg.payload)
         event_type = payload.get("event", "unknown.event")
-        save_event(event_type, payload.get("data", payload))
+        save_event(event_type, payload.get("data", payload), payload.get("asset") or msg.topic.split("/")[1])
     except Exception as e:
         logger.error(f"Error processing historian message: {e}")
+    MQTT_CONSUMED.inc()
 
 mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "HISTORIAN_SERVICE")
 mqtt_client.on_connect = on_connect
@@ -69,34 +126,149 @@ mqtt_client.on_message = on_message
 async def lifespan(app: FastAPI):
     # Startup
     init_db()
+    writer.start()
     mqtt_client.connect(MQTT_BROKER, 1883, 60)
     mqtt_client.loop_start()
     yield
     # Shutdown
     mqtt_client.loop_stop()
+    writer.stop()
+    readers.close()
+    if store: store.close()
 
 app = FastAPI(title="Industrial Historian Service", lifespan=lifespan)
+app.mount("/metrics", make_asgi_app())
 app.add_middleware(CORSMiddleware, allow_origins=["*"])
 
 @app.get("/history/telemetry")
-async def get_telemetry(limit: int = 100):
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM telemetry ORDER BY id DESC LIMIT ?", (limit,))
-    rows = [dict(r) for r in cursor.fetchall()]
-    conn.close()
-    return rows
+async def get_telemetry(
+    response: Response,
+    limit: int = 100,
+    start: Optional[int] = Query(None, alias="from"),
+    end: Optional[int] = Query(None, alias="to"),
+    bucket: Optional[int] = None,
+):
+    """Raw rows (newest first) or, with `bucket` (ms), one aggregate per bucket
+    (oldest first) read from the coarsest tier that fits, named in the
+    X-Historian-Tier header. `from`/`to` are epoch milliseconds, `to` exclusive.
+    Ranges inside the hot window are answered from memory ("hot" tier)."""
+    if bucket is not None:
+        if bucket <= 0:
+            raise HTTPException(status_code=422, detail="bucket must be a positive number of milliseconds")
+        end = end if end is not None else now_ms()
+        start = start if start is not None else end - bucket * min(limit, MAX_BUCKETS)
+        if (end - start) / bucket > MAX_BUCKETS:
+            raise HTTPException(status_code=422, detail=f"Range too large for bucket size (max {MAX_BUCKETS} buckets)")
+        if hot and hot.covers(HISTORIAN_ASSET, start):
+            HOT_REQUESTS.labels(result="hit").inc()
+            TIER_QUERIES.labels(tier="hot").inc()
+            response.headers["X-Historian-Tier"] = "hot"
+            return raw_buckets(hot.scan(HISTORIAN_ASSET, start, end), bucket)
+        tier = rollups.pick(start, end, bucket, now_ms())
+        response.headers["X-Historian-Tier"] = tier.name
+        return await readers.run(f"buckets_{tier.name}", query_buckets, tier, start, end, bucket)
+    if not hot:
+        return await readers.run("raw", query_raw, start, end, limit)
+    recent, since = hot.newest(HISTORIAN_ASSET, start, end, limit)
+    rows = [dict(zip(RAW_COLUMNS, r), timestamp=ms_to_iso(r[0])) for r in recent]
+    if len(rows) >= limit or (since is not None and start is not None and start >= since):
+        HOT_REQUESTS.labels(result="hit").inc()
+        return rows
+    # Only the part of the range older than the ring goes to disk
+    HOT_REQUESTS.labels(result="partial" if rows else "miss").inc()
+    if since is not None: end = since if end is None else min(end, since)
+    return rows + await readers.run("raw", query_raw, start, end, limit - len(rows))
+
+RAW_COLUMNS = ("ts", "position", "mc1", "mc2", "ls1", "ls2")
+TELEMETRY_COLUMNS = ("id", "ts", "timestamp", "position", "mc1", "mc2", "ls1", "ls2")
+EVENT_COLUMNS = ("id", "timestamp", "code", "message", "severity")
+
+def time_range(start, end):
+    clauses, params = [], []
+    if start is not None:
+        clauses.append("ts >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("ts < ?")
+        params.append(end)
+    return clauses, params
+
+def query_raw(conn, start, end, limit):
+    if store:
+        return [dict(zip(RAW_COLUMNS, r), timestamp=ms_to_iso(r[0])) for r in store.scan_reverse(start, end, limit)]
+    clauses, params = time_range(start, end)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cursor = conn.execute(f"SELECT id, ts, position, mc1, mc2, ls1, ls2 FROM telemetry {where} ORDER BY ts DESC LIMIT ?", (*params, limit))
+    return [dict(r, timestamp=ms_to_iso(r["ts"])) for r in cursor.fetchall()]
+
+def raw_buckets(rows, bucket):
+    return [{"ts": ts, "samples": n, "pos_min": lo, "pos_max": hi, "pos_avg": total / n,
+             "mc1_duty": on1 / n, "mc2_duty": on2 / n, "timestamp": ms_to_iso(ts)}
+            for ts, (n, lo, hi, total, on1, on2) in sorted(bucketize(rows, bucket).items())]
+
+def query_buckets(conn, tier, start, end, bucket):
+    if store and tier is rollups.raw:
+        return raw_buckets(store.scan(start, end), bucket)
+    return [dict(r, timestamp=ms_to_iso(r["ts"])) for r in rollups.query(conn, tier, start, end, bucket)]
 
 @app.get("/history/events")
 async def get_events(limit: int = 50):
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM events ORDER BY id DESC LIMIT ?", (limit,))
-    rows = [dict(r) for r in cursor.fetchall()]
-    conn.close()
-    return rows
+    return await readers.run("events", query_events, limit)
+
+def query_events(conn, limit):
+    return [dict(r) for r in conn.execute("SELECT * FROM events ORDER BY id DESC LIMIT ?", (limit,)).fetchall()]
+
+# --- Export ---
+def telemetry_page(start, end):
+    """Keyset pages over (ts, id), oldest first; the cursor is the last row's key."""
+    def fetch(conn, after, limit):
+        if store:
+            rows = after or store.scan(start, end) # the cursor is the scan itself
+            return [dict(zip(RAW_COLUMNS, r), timestamp=ms_to_iso(r[0])) for r in islice(rows, limit)], rows
+        clauses, params = time_range(start, end)
+        if after:
+            clauses.append("(ts > ? OR (ts = ? AND id > ?))")
+            params += [after[0], after[0], after[1]]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        cursor = conn.execute(f"SELECT id, ts, position, mc1, mc2, ls1, ls2 FROM telemetry {where} ORDER BY ts, id LIMIT ?", (*params, limit))
+        rows = [dict(r, timestamp=ms_to_iso(r["ts"])) for r in cursor.fetchall()]
+        return rows, (rows[-1]["ts"], rows[-1]["id"]) if rows else after
+    return fetch
+
+def events_page(start, end):
+    def fetch(conn, after, limit):
+        # events keep ISO text timestamps; local ISO strings order like the times they encode
+        clauses, params = ["id > ?"], [after or 0]
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(ms_to_iso(start))
+        if end is not None:
+            clauses.append("timestamp < ?")
+            params.append(ms_to_iso(end))
+        cursor = conn.execute(f"SELECT * FROM events WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ?", (*params, limit))
+        rows = [dict(r) for r in cursor.fetchall()]
+        return rows, rows[-1]["id"] if rows else after
+    return fetch
+
+EXPORTS = {"telemetry": (telemetry_page, TELEMETRY_COLUMNS), "events": (events_page, EVENT_COLUMNS)}
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+@app.get("/history/export/{table}")
+async def export_history(
+    table: str,
+    format: str = "ndjson",
+    start: Optional[int] = Query(None, alias="from"),
+    end: Optional[int] = Query(None, alias="to"),
+):
+    """Streams every row in [from, to) oldest first as NDJSON or CSV, one
+    page at a time from the read pool, for offline analysis of long ranges."""
+    if table not in EXPORTS: raise HTTPException(status_code=404, detail=f"Unknown table {table}")
+    if format not in MEDIA_TYPES: raise HTTPException(status_code=422, detail="format must be ndjson or csv")
+    page, columns = EXPORTS[table]
+    return StreamingResponse(
+        stream_pages(readers, table, page(start, end), columns, format, EXPORT_PAGE_ROWS),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'})
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,77 @@
+import asyncio
+import csv
+import io
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from prometheus_client import Counter, Histogram
+
+# --- PROMETHEUS METRICS ---
+READ_TIME = Histogram('historian_read_seconds', 'Time spent in one pooled read', ['query'], buckets=(.001, .005, .01, .05, .1, .5, 1, 5))
+EXPORT_ROWS = Counter('historian_export_rows_total', 'Rows streamed by the export endpoints', ['table', 'format'])
+
+class ReadPool:
+    """Blocking reads off the event loop: a fixed thread pool where each
+    worker lazily opens one read-only connection and keeps it. WAL lets
+    these readers run alongside the batch writer without blocking it.
+    Every connection is also tracked in `conns` so `close` can release them
+    once the workers have stopped."""
+    def __init__(self, db_path, workers=4):
+        self.db_path = db_path
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="historian-read")
+        self.local = threading.local()
+        self.conns = []
+        self.lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # check_same_thread=False only so close() can run on the shutdown thread
+            conn = self.local.conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            with self.lock: self.conns.append(conn)
+        return conn
+
+    def _call(self, name, fn, args):
+        start = time.perf_counter()
+        try:
+            return fn(self._conn(), *args)
+        finally:
+            READ_TIME.labels(query=name).observe(time.perf_counter() - start)
+
+    async def run(self, name, fn, *args):
+        """Runs fn(conn, *args) on a pool thread."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._call, name, fn, args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            conns, self.conns = self.conns, []
+        for conn in conns: conn.close()
+
+# --- Streaming export ---
+def encode_rows(rows, columns, fmt, header):
+    """One chunk of dict rows as NDJSON lines or CSV (with the header line first)."""
+    if fmt == "ndjson":
+        return "".join(json.dumps(r) + "\n" for r in rows)
+    buf = io.StringIO()
+    out = csv.DictWriter(buf, fieldnames=columns, extrasaction="ignore", lineterminator="\n")
+    if header: out.writeheader()
+    out.writerows(rows)
+    return buf.getvalue()
+
+async def stream_pages(pool, name, fetch_page, columns, fmt, page_rows):
+    """Yields encoded chunks. `fetch_page(conn, after, limit)` returns up to
+    `limit` dict rows after the cursor `after` (None for the first page)
+    plus the next cursor, so memory stays at one page however long the
+    range and no read transaction outlives a page."""
+    after, first = None, True
+    while True:
+        rows, after = await pool.run(name, fetch_page, after, page_rows)
+        if rows or first:
+            yield encode_rows(rows, columns, fmt, header=first)
+            EXPORT_ROWS.labels(table=name, format=fmt).inc(len(rows))
+        first = False
+        if len(rows) < page_rows: break
@@ -0,0 +1,134 @@
+import logging
+from prometheus_client import Counter
+
+logger = logging.getLogger("historian-service.rollups")
+
+# --- PROMETHEUS METRICS ---
+ROWS_COMPACTED = Counter('historian_rows_compacted_total', 'Rows aged out by retention', ['table'])
+TIER_QUERIES = Counter('historian_tier_queries_total', 'Bucketed queries by the tier that served them', ['tier'])
+
+def bucketize(rows, resolution):
+    """Raw rows -> {bucket start: [samples, pos min, pos max, pos sum, mc1 on, mc2 on]}"""
+    buckets = {}
+    for ts, position, mc1, mc2, _, _ in rows:
+        pos = position if position is not None else 0.0
+        key = ts // resolution * resolution
+        b = buckets.get(key)
+        if b is None:
+            buckets[key] = [1, pos, pos, pos, int(bool(mc1)), int(bool(mc2))]
+        else:
+            b[0] += 1
+            if pos < b[1]: b[1] = pos
+            if pos > b[2]: b[2] = pos
+            b[3] += pos
+            b[4] += bool(mc1)
+            b[5] += bool(mc2)
+    return buckets
+
+class Tier:
+    def __init__(self, name, table, resolution_ms, retention_ms):
+        self.name = name
+        self.table = table
+        self.resolution = resolution_ms
+        self.retention = retention_ms # 0 = keep forever
+
+    def covers(self, start, now):
+        return not self.retention or start >= now - self.retention
+
+class Rollups:
+    """Continuous aggregates of `telemetry` at 1 s, 1 min and 1 h.
+
+    Rollup rows hold sums (samples, position sum, contactor-on counts) and
+    extremes, so partial buckets from successive batches merge with an
+    UPSERT and a coarser bucket is just the merge of finer ones. The batch
+    writer applies each flushed batch in the same transaction as the raw
+    insert; `compact` deletes rows older than each tier's retention."""
+    def __init__(self, raw_retention_ms, retentions_ms):
+        self.raw = Tier("raw", "telemetry", 1, raw_retention_ms)
+        self.tiers = [Tier(name, f"telemetry_{name}", resolution, retentions_ms.get(name, 0))
+                      for name, resolution in (("1s", 1000), ("1m", 60_000), ("1h", 3_600_000))]
+
+    def create(self, cursor):
+        for tier in self.tiers:
+            cursor.execute(f'''CREATE TABLE IF NOT EXISTS {tier.table}
+                               (ts INTEGER PRIMARY KEY, samples INTEGER, pos_min REAL, pos_max REAL, pos_sum REAL,
+                                mc1_on INTEGER, mc2_on INTEGER)''')
+        # Databases that predate the rollups: build them once from the raw rows still on disk
+        for tier in self.tiers:
+            if cursor.execute(f"SELECT 1 FROM {tier.table} LIMIT 1").fetchone(): continue
+            cursor.execute(f'''INSERT INTO {tier.table}
+                               SELECT (ts / {tier.resolution}) * {tier.resolution}, COUNT(*), MIN(position), MAX(position),
+                                      TOTAL(position), TOTAL(mc1), TOTAL(mc2)
+                               FROM telemetry GROUP BY ts / {tier.resolution}''')
+            if cursor.rowcount > 0: logger.info(f"🛠️ Rollup {tier.table} reconstruido: {cursor.rowcount} filas")
+
+    def apply(self, conn, rows):
+        """Folds raw telemetry rows (ts, position, mc1, mc2, ls1, ls2) into every tier."""
+        buckets = bucketize(rows, self.tiers[0].resolution)
+        for i, tier in enumerate(self.tiers):
+            if i:
+                buckets = self._coarsen(buckets, tier.resolution)
+            conn.executemany(f'''INSERT INTO {tier.table} (ts, samples, pos_min, pos_max, pos_sum, mc1_on, mc2_on)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?)
+                                 ON CONFLICT(ts) DO UPDATE SET samples = samples + excluded.samples,
+                                     pos_min = MIN(pos_min, excluded.pos_min), pos_max = MAX(pos_max, excluded.pos_max),
+                                     pos_sum = pos_sum + excluded.pos_sum,
+                                     mc1_on = mc1_on + excluded.mc1_on, mc2_on = mc2_on + excluded.mc2_on''',
+                             [(ts, *b) for ts, b in buckets.items()])
+
+    @staticmethod
+    def _coarsen(buckets, resolution):
+        out = {}
+        for ts, (n, lo, hi, total, on1, on2) in buckets.items():
+            key = ts // resolution * resolution
+            b = out.get(key)
+            if b is None:
+                out[key] = [n, lo, hi, total, on1, on2]
+            else:
+                b[0] += n
+                b[1] = min(b[1], lo)
+                b[2] = max(b[2], hi)
+                b[3] += total
+                b[4] += on1
+                b[5] += on2
+        return out
+
+    def compact(self, conn, now):
+        """Ages out raw rows and rollup rows past their retention."""
+        deleted = {}
+        with conn:
+            for tier in (self.raw, *self.tiers):
+                if not tier.retention: continue
+                n = conn.execute(f"DELETE FROM {tier.table} WHERE ts < ?", (now - tier.retention,)).rowcount
+                if n:
+                    deleted[tier.table] = n
+                    ROWS_COMPACTED.labels(table=tier.table).inc(n)
+        return deleted
+
+    def pick(self, start, end, bucket, now):
+        """Coarsest tier whose resolution divides `bucket` and whose retention
+        still covers `start`. If none covers it, the finest tier that does
+        (coarser than asked beats an empty answer), else raw."""
+        fitting = [t for t in (self.raw, *self.tiers) if t.resolution <= bucket and bucket % t.resolution == 0]
+        for tier in reversed(fitting):
+            if tier.covers(start, now): return tier
+        return next((t for t in self.tiers if t.covers(start, now)), self.raw)
+
+    def query(self, conn, tier, start, end, bucket):
+        """Same columns as a GROUP BY over raw rows, read from `tier`. Rollup
+        rows are whole buckets, so one that starts before `start` is left out."""
+        TIER_QUERIES.labels(tier=tier.name).inc()
+        if tier is self.raw:
+            # AVG over 0/1 booleans is the fraction of samples with the contactor energized
+            sql = '''SELECT (ts / :b) * :b AS ts, COUNT(*) AS samples,
+                            MIN(position) AS pos_min, MAX(position) AS pos_max, AVG(position) AS pos_avg,
+                            AVG(mc1) AS mc1_duty, AVG(mc2) AS mc2_duty
+                     FROM telemetry WHERE ts >= :start AND ts < :end
+                     GROUP BY ts / :b ORDER BY ts'''
+        else:
+            sql = f'''SELECT (ts / :b) * :b AS ts, SUM(samples) AS samples,
+                             MIN(pos_min) AS pos_min, MAX(pos_max) AS pos_max, SUM(pos_sum) / SUM(samples) AS pos_avg,
+                             SUM(mc1_on) * 1.0 / SUM(samples) AS mc1_duty, SUM(mc2_on) * 1.0 / SUM(samples) AS mc2_duty
+                      FROM {tier.table} WHERE ts >= :start AND ts < :end
+                      GROUP BY ts / :b ORDER BY ts'''
+        return conn.execute(sql, {"b": bucket, "start": start, "end": end}).fetchall()
@@ -0,0 +1,147 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from prometheus_client import Counter, Gauge, Histogram
+from rollups import ROWS_COMPACTED
+
+logger = logging.getLogger("historian-service.writer")
+
+# --- PROMETHEUS METRICS ---
+ROWS_WRITTEN = Counter('historian_rows_written_total', 'Rows persisted by the batch writer', ['table'])
+ROWS_DROPPED = Counter('historian_rows_dropped_total', 'Rows lost before reaching disk (queue_full, write_error)', ['table', 'reason'])
+QUEUE_DEPTH = Gauge('historian_queue_depth', 'Rows waiting in the ingest queue')
+FLUSH_TIME = Histogram('historian_flush_seconds', 'Time spent writing one batch', buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, 1))
+BATCH_ROWS = Histogram('historian_batch_rows', 'Rows per flushed batch', buckets=(1, 10, 50, 100, 250, 500, 1000, 5000))
+
+INSERT_SQL = {
+    "telemetry": "INSERT INTO telemetry (ts, position, mc1, mc2, ls1, ls2) VALUES (?, ?, ?, ?, ?, ?)",
+    "events": "INSERT INTO events (timestamp, code, message, severity) VALUES (?, ?, ?, ?)",
+}
+
+_STOP = object()
+
+class BatchWriter:
+    """Write-behind ingestion: MQTT callbacks enqueue rows, one thread owns the
+    SQLite connection and flushes with executemany when the batch is full or
+    the flush interval expires, whichever comes first. With `rollups`, each
+    telemetry batch also updates the rollup tiers in the same transaction,
+    and retention runs on this thread every `compact_interval` seconds.
+    With a chunk `store`, raw telemetry goes there instead of SQLite."""
+
+    def __init__(self, db_path, batch_size=500, flush_interval=0.5, max_queue=50000, rollups=None, compact_interval=60.0,
+                 store=None):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rollups = rollups
+        self.compact_interval = compact_interval
+        self.store = store
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = None
+        self.conn = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="historian-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        if not self.thread: return
+        deadline = time.monotonic() + timeout
+        if self.thread.is_alive():
+            # Wait for room for the sentinel, but never past the timeout (a dead or wedged writer never drains)
+            try:
+                self.queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                logger.error(f"Historian writer did not drain within {timeout}s; {self.queue.qsize()} rows not persisted")
+        self.thread.join(max(0.0, deadline - time.monotonic()))
+        self.thread = None
+
+    def submit(self, table, row):
+        """Non-blocking enqueue from the MQTT thread. Returns False when the row
+        was dropped because the writer is behind."""
+        try:
+            self.queue.put_nowait((table, row))
+        except queue.Full:
+            ROWS_DROPPED.labels(table=table, reason="queue_full").inc()
+            return False
+        QUEUE_DEPTH.set(self.queue.qsize())
+        return True
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _run(self):
+        self.conn = self._connect()
+        logger.info(f"💾 Batch writer activo (batch={self.batch_size}, flush={self.flush_interval}s)")
+        pending = {table: [] for table in INSERT_SQL}
+        count = 0
+        deadline = time.monotonic() + self.flush_interval
+        next_compact = time.monotonic()
+        running = True
+        while running:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+                if item is _STOP:
+                    running = False
+                else:
+                    table, row = item
+                    pending[table].append(row)
+                    count += 1
+            except queue.Empty:
+                pass
+
+            if count >= self.batch_size or time.monotonic() >= deadline or not running:
+                if count:
+                    self._flush(pending, count)
+                    pending = {table: [] for table in INSERT_SQL}
+                    count = 0
+                deadline = time.monotonic() + self.flush_interval
+                QUEUE_DEPTH.set(self.queue.qsize())
+            if self.rollups and running and time.monotonic() >= next_compact:
+                self._compact()
+                next_compact = time.monotonic() + self.compact_interval
+        self.conn.close()
+        self.conn = None
+
+    def _flush(self, pending, count):
+        start = time.perf_counter()
+        stored = False
+        try:
+            if self.store and pending["telemetry"]:
+                self.store.append(pending["telemetry"])
+                stored = True
+            with self.conn:
+                for table, rows in pending.items():
+                    if rows and not (self.store and table == "telemetry"): self.conn.executemany(INSERT_SQL[table], rows)
+                if self.rollups and pending["telemetry"]: self.rollups.apply(self.conn, pending["telemetry"])
+        except Exception as e:
+            logger.error(f"Error saving batch to Historian DB ({count} rows): {e}")
+            # The transaction rolled back; telemetry already in the chunk store is kept
+            for table, rows in pending.items():
+                if rows and not (stored and table == "telemetry"):
+                    ROWS_DROPPED.labels(table=table, reason="write_error").inc(len(rows))
+            return
+        FLUSH_TIME.observe(time.perf_counter() - start)
+        BATCH_ROWS.observe(count)
+        for table, rows in pending.items():
+            if rows: ROWS_WRITTEN.labels(table=table).inc(len(rows))
+
+    def _compact(self):
+        try:
+            now = int(time.time() * 1000)
+            deleted = self.rollups.compact(self.conn, now)
+            if self.store and self.rollups.raw.retention:
+                dropped = self.store.drop_before(now - self.rollups.raw.retention)
+                if dropped:
+                    deleted["chunks"] = dropped
+                    ROWS_COMPACTED.labels(table="chunks").inc(dropped)
+        except Exception as e:
+            logger.error(f"Error compacting Historian DB: {e}")
+            return
+        if deleted: logger.info(f"🧹 Retención aplicada: {deleted}")
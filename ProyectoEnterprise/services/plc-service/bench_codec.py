@@ -0,0 +1,42 @@
+import json
+import logging
+import sys
+import time
+import timeit
+from datetime import datetime
+import telemetry_codec
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("codec-bench")
+
+STATE = {
+    "bp1": False, "bp2": False, "ls1": True, "ls2": False,
+    "mc1": True, "mc2": False, "l1": True, "l2": False, "pos": 0.42
+}
+TOPIC = "enterprise/machine/state"
+BIN_TOPIC = telemetry_codec.state_topic(TOPIC, binary=True)
+
+def encode_json():
+    return json.dumps({"event": "machine.state.changed", "data": STATE, "timestamp": datetime.now().isoformat()}).encode()
+
+def encode_binary():
+    return telemetry_codec.encode_state(telemetry_codec.pack_bits(STATE), STATE["pos"], int(time.time() * 1000), 1)
+
+def report(name, fn, number):
+    per_call = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    logger.info(f"{name:<16} {per_call * 1e6:7.2f} us/op  ({1 / per_call:,.0f} ops/s)")
+    return per_call
+
+if __name__ == "__main__":
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    json_frame, bin_frame = encode_json(), encode_binary()
+    assert telemetry_codec.decode_message(BIN_TOPIC, bin_frame)["data"] == telemetry_codec.decode_message(TOPIC, json_frame)["data"]
+
+    logger.info(f"Bytes on the wire: JSON {len(json_frame)} B, binary {len(bin_frame)} B (x{len(json_frame) / len(bin_frame):.1f} smaller)")
+    enc_json = report("encode json", encode_json, number)
+    enc_bin = report("encode binary", encode_binary, number)
+    dec_json = report("decode json", lambda: telemetry_codec.decode_message(TOPIC, json_frame), number)
+    dec_bin = report("decode binary", lambda: telemetry_codec.decode_message(BIN_TOPIC, bin_frame), number)
+    # Without the JSON-compatible envelope (ISO timestamp rendering dominates the cost above)
+    report("decode raw", lambda: telemetry_codec.decode_state(bin_frame), number)
+    logger.info(f"Encode speedup x{enc_json / enc_bin:.1f}, decode speedup x{dec_json / dec_bin:.1f}")
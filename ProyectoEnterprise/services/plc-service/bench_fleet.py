@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import sys
+import time
+import main
+from prometheus_client import REGISTRY
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("fleet-bench")
+
+class SimulatedS7Client:
+    """Stands in for snap7.client.Client: emulates the FB_Elevator latch logic
+    on one DB byte and a fixed ISO-on-TCP round-trip latency."""
+    def __init__(self, latency):
+        self.latency = latency
+        self.db = bytearray([0b00000100])
+        self.reads = 0
+
+    def get_connected(self): return True
+    def connect(self, *args): pass
+
+    def db_read(self, db_number, start, size):
+        time.sleep(self.latency)
+        self.reads += 1
+        b = self.db[0]
+        if b & 0x01: b |= 0x10   # bp1 -> mc1
+        if b & 0x08: b &= ~0x10  # ls2 stops mc1
+        if b & 0x02: b |= 0x20   # bp2 -> mc2
+        if b & 0x04: b &= ~0x20  # ls1 stops mc2
+        self.db[0] = b
+        return bytearray(self.db)
+
+    def db_write(self, db_number, start, data):
+        time.sleep(self.latency)
+        self.db[0] = data[0]
+
+def scans(asset):
+    """Completed scans so far, from the scan-time histogram's sample count."""
+    return REGISTRY.get_sample_value("plc_scan_time_seconds_count", {"asset": asset}) or 0.0
+
+async def run_fleet(count, duration, latency):
+    fleet = []
+    for i in range(count):
+        # Every pooled client talks to the same simulated PLC
+        plc = SimulatedS7Client(latency)
+        fleet.append(main.Device(f"bench-{count}-{i:04d}", "127.0.0.1", 1, client_factory=lambda: plc))
+    tasks = [asyncio.create_task(main.scan_loop(d)) for d in fleet]
+    # Keep every lift travelling so scans do physics and publish, and buttons and limit switches get written
+    start = time.monotonic()
+    while time.monotonic() - start < duration:
+        for d in fleet:
+            d.plc.write_input_bit(0 if d.physics.position < 0.5 else 1, True)
+            d.plc.write_input_bit(0 if d.physics.position < 0.5 else 1, False)
+        await asyncio.sleep(1.0)
+    elapsed = time.monotonic() - start
+    for t in tasks: t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for d in fleet: d.plc.io.shutdown(wait=False)
+    done = [scans(d.asset) for d in fleet]
+    rates = sorted(n / elapsed for n in done)
+    reads = sum(d.plc.pool.queue[0].reads for d in fleet)
+    return rates[0], sum(rates) / len(rates), reads / max(sum(done), 1)
+
+async def main_bench():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.005
+    counts = [int(c) for c in sys.argv[3].split(",")] if len(sys.argv) > 3 else [1, 10, 40, 100, 200, 400]
+    target = 1 / main.SCAN_PERIOD
+    logger.info(f"Target {target:.0f} Hz per device, simulated PLC latency {latency * 1000:.1f} ms")
+    for count in counts:
+        worst, avg, reads_per_scan = await run_fleet(count, duration, latency)
+        ok = "OK" if worst >= 0.95 * target else "SATURATED"
+        logger.info(f"{count:5d} devices: avg {avg:5.1f} Hz, worst {worst:5.1f} Hz, {reads_per_scan:.2f} PLC reads/scan -> {ok}")
+
+if __name__ == "__main__":
+    # No broker needed: publishes fail fast while disconnected, but payloads are still encoded
+    asyncio.run(main_bench())
@@ -2,8 +2,12 @@ import asyncio
 import json
 import logging
 import os
+import queue
+import random
+import threading
 import time
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from prometheus_client import Counter, Gauge, Histogram, make_asgi_app
@@ -11,6 +15,7 @@ from snap7.util import get_bool, set_bool
 import snap7
 from fastapi.middleware.cors import CORSMiddleware
 import paho.mqtt.client as mqtt
+import telemetry_codec
 
 # --- Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -18,37 +23,90 @@ logger = logging.getLogger("plc-service")
 
 # --- PROMETHEUS METRICS (Enterprise Standards) ---
 # Operational Metrics
-PLC_SCAN_TIME = Histogram('plc_scan_time_seconds', 'Industrial scan cycle time', buckets=(.005, .01, .025, .05, .075, .1, .25))
-TOTAL_WORK_CYCLES = Counter('plc_work_cycles_total', 'Total completed elevator trips')
-UPTIME_SECONDS = Counter('plc_uptime_seconds_total', 'Total service operation time')
+# Every per-device metric carries an `asset` label (one series per elevator in the fleet)
+PLC_SCAN_TIME = Histogram('plc_scan_time_seconds', 'Industrial scan cycle time', ['asset'], buckets=(.005, .01, .025, .05, .075, .1, .25))
+TOTAL_WORK_CYCLES = Counter('plc_work_cycles_total', 'Total completed elevator trips', ['asset'])
+UPTIME_SECONDS = Counter('plc_uptime_seconds_total', 'Total service operation time', ['asset'])
+PLC_SCAN_JITTER = Histogram('plc_scan_jitter_seconds', 'Scan start lateness versus its fixed-rate deadline', ['asset'], buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1))
+PLC_SCAN_OVERRUNS = Counter('plc_scan_overruns_total', 'Scans that started after their deadline', ['asset'])
+PLC_SCAN_SKIPPED = Counter('plc_scan_cycles_skipped_total', 'Cycles dropped by the skip policy or the catch-up backlog cap', ['asset'])
 
 # Health Metrics
-PLC_CPU_LOAD = Gauge('plc_cpu_load_percent', 'Simulated PLC CPU utilization')
-PLC_MEM_USAGE = Gauge('plc_memory_usage_bytes', 'Simulated PLC Memory consumption')
-MOTOR_TEMP = Gauge('plc_motor_temperature_celsius', 'Real-time motor thermal state')
-ELEVATOR_POS = Gauge('plc_elevator_position', 'Current elevator height (0-1)')
+PLC_CPU_LOAD = Gauge('plc_cpu_load_percent', 'Simulated PLC CPU utilization', ['asset'])
+PLC_MEM_USAGE = Gauge('plc_memory_usage_bytes', 'Simulated PLC Memory consumption', ['asset'])
+MOTOR_TEMP = Gauge('plc_motor_temperature_celsius', 'Real-time motor thermal state', ['asset'])
+ELEVATOR_POS = Gauge('plc_elevator_position', 'Current elevator height (0-1)', ['asset'])
+
+# S7 Link Metrics
+PLC_CONNECT_ATTEMPTS = Counter('plc_connect_attempts_total', 'S7 connect attempts', ['asset'])
+PLC_CONNECT_FAILURES = Counter('plc_connect_failures_total', 'Failed S7 connects and I/O errors that dropped the link', ['asset'])
+PLC_DISCONNECTED_SECONDS = Counter('plc_disconnected_seconds_total', 'Time spent with the S7 link down', ['asset'])
+PLC_LINK_STATE = Gauge('plc_link_state', 'S7 link health (0 connected, 1 backing off, 2 probing)', ['asset'])
 
 # Command Metrics
-COMMANDS_TOTAL = Counter('plc_commands_received_total', 'Total commands sent from HMI', ['command'])
+COMMANDS_TOTAL = Counter('plc_commands_received_total', 'Total commands sent from HMI', ['asset', 'command'])
+
+# Publish Metrics (Report-by-Exception)
+STATE_PUBLISHED = Counter('plc_state_messages_published_total', 'State messages published to MQTT', ['asset', 'reason'])
+STATE_SUPPRESSED = Counter('plc_state_messages_suppressed_total', 'Scans whose state was not published (no change)', ['asset'])
 
 # --- Config ---
 PLC_IP = os.getenv("PLC_IP", "192.168.0.11")
 DB_NUMBER = int(os.getenv("DB_NUMBER", "1"))
+ASSET_ID = os.getenv("ASSET_ID", "machine")
+# Fleet mode: "asset=ip[:db],asset=ip[:db],..." (unset = single device from PLC_IP/DB_NUMBER/ASSET_ID)
+# historian-service records one asset (HISTORIAN_ASSET): run one historian per fleet asset to keep them all
+PLC_FLEET = os.getenv("PLC_FLEET", "")
 MQTT_BROKER = os.getenv("MQTT_BROKER", "mqtt-broker")
-MQTT_TOPIC = "enterprise/machine/state"
+MQTT_TOPIC_TEMPLATE = "enterprise/{asset}/state"
+# Off by default: historian duty and position averages weight every sample equally, so they need uniform scans
+REPORT_BY_EXCEPTION = os.getenv("REPORT_BY_EXCEPTION", "false").lower() == "true"
+PUBLISH_DEADBAND = float(os.getenv("PUBLISH_DEADBAND", "0.01"))
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "1.0"))
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "json") # json | binary | both
+PLC_POOL_SIZE = int(os.getenv("PLC_POOL_SIZE", "2"))
+PLC_BACKOFF_BASE = float(os.getenv("PLC_BACKOFF_BASE", "0.5"))
+PLC_BACKOFF_MAX = float(os.getenv("PLC_BACKOFF_MAX", "30.0"))
+SCAN_PERIOD = float(os.getenv("SCAN_PERIOD", "0.05"))
+OVERRUN_POLICY = os.getenv("OVERRUN_POLICY", "skip") # skip | catch-up
+SCAN_MAX_BACKLOG = int(os.getenv("SCAN_MAX_BACKLOG", "10")) # catch-up: most missed cycles replayed after a stall
+STATE_MAX_AGE = float(os.getenv("STATE_MAX_AGE", "1.0")) # seconds before /state reports the image as stale
 
 class ElevatorPhysics:
     def __init__(self):
         self.position = 0.0
         self.speed = 0.012
         self.faults = set()
-        self.last_inputs = {}
         self.last_pos = 0.0
         self.direction = 0 # 1 up, -1 down, 0 idle
-        self.lock = asyncio.Lock()
         self.start_time = time.time()
 
-physics = ElevatorPhysics()
+class ChangeDetector:
+    """Report-by-exception: publish when any bit flips or the position moves
+    past the deadband, plus an integrity heartbeat when nothing changes."""
+    def __init__(self, deadband, heartbeat):
+        self.deadband = deadband
+        self.heartbeat = heartbeat
+        self.last_state = None
+        self.last_sent = 0.0
+
+    def check(self, state, now):
+        """Returns the publish reason, or None when the scan can be suppressed."""
+        last = self.last_state
+        if last is None:
+            reason = "initial"
+        elif any(state[k] != last[k] for k in state if k != "pos"):
+            reason = "change"
+        elif abs(state["pos"] - last["pos"]) >= self.deadband - 1e-9: # pos is rounded, allow float noise
+            reason = "deadband"
+        elif now - self.last_sent >= self.heartbeat:
+            reason = "heartbeat"
+        else:
+            return None
+        # Compare against the last *published* state so slow drift still reports
+        self.last_state = state
+        self.last_sent = now
+        return reason
 
 # --- MQTT Setup ---
 mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "PLC_SERVICE_GATEWAY")
@@ -62,93 +120,309 @@ def connect_mqtt():
         logger.error(f"MQTT Connection Error: {e}")
 
 class PLCManager:
-    def __init__(self, ip):
-        self.client = snap7.client.Client()
+    """Owns a small pool of snap7 clients. snap7 calls block, so they run on an
+    I/O executor sized to the pool; the event loop only awaits them. The scan
+    reads the DB once into `image` and writes back at most once, that image
+    with every queued input bit applied.
+
+    Link health is a small state machine shared by the pool:
+    connected -> (I/O or connect error) -> backing_off -> (delay elapsed) ->
+    probing -> connected | backing_off. While backing off, calls fail fast
+    instead of waiting out a TCP connect timeout every scan; the delay grows
+    exponentially with jitter up to PLC_BACKOFF_MAX."""
+    LINK_STATES = {"connected": 0, "backing_off": 1, "probing": 2}
+
+    def __init__(self, ip, db_number=DB_NUMBER, asset=ASSET_ID, pool_size=PLC_POOL_SIZE, client_factory=snap7.client.Client):
         self.ip = ip
+        self.db_number = db_number
+        self.asset = asset
+        self.pool = queue.Queue()
+        for _ in range(pool_size): self.pool.put(client_factory())
+        self.io = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix=f"snap7-{asset}")
+        self.image = None
+        self.image_time = 0.0
+        self.pending_inputs = {}
+
+        # Link health (guarded by link_lock; touched from the I/O threads)
+        self.link_lock = threading.Lock()
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.probing = False
+        self.down_mark = None
+        self.attempts = PLC_CONNECT_ATTEMPTS.labels(asset=asset)
+        self.connect_failures = PLC_CONNECT_FAILURES.labels(asset=asset)
+        self.downtime = PLC_DISCONNECTED_SECONDS.labels(asset=asset)
+        self.link_gauge = PLC_LINK_STATE.labels(asset=asset)
+        self._set_state("backing_off") # first call probes immediately
+
+    def _set_state(self, state):
+        self.state = state
+        self.link_gauge.set(self.LINK_STATES[state])
 
-    def connect(self):
-        if not self.client.get_connected():
-            try: self.client.connect(self.ip, 0, 1)
-            except: pass
+    def _account_downtime(self, now):
+        if self.down_mark is not None:
+            self.downtime.inc(now - self.down_mark)
+            self.down_mark = now
 
-    def read_db(self):
-        self.connect()
-        try: return self.client.db_read(DB_NUMBER, 0, 1)
-        except: return None
+    def _mark_down(self, now, error):
+        if self.state == "connected":
+            logger.warning(f"🔌 PLC {self.asset} ({self.ip}) desconectado: {error}")
+        if self.down_mark is None: self.down_mark = now
+        self.connect_failures.inc()
+        self.failures += 1
+        delay = min(PLC_BACKOFF_MAX, PLC_BACKOFF_BASE * 2 ** (self.failures - 1))
+        self.next_attempt = now + delay / 2 + random.uniform(0, delay / 2)
+        self._set_state("backing_off")
 
-    async def write_input_bit(self, bit, value):
-        if physics.last_inputs.get(bit) == value: return
-        async with physics.lock:
-            self.connect()
+    def _mark_up(self, now):
+        if self.state != "connected":
+            self._account_downtime(now)
+            self.down_mark = None
+            if self.failures: logger.info(f"✅ PLC {self.asset} ({self.ip}) reconectado tras {self.failures} intento(s)")
+        self.failures = 0
+        self._set_state("connected")
+
+    def _link_ready(self, client):
+        """True when `client` may talk to the PLC now. Connects it if needed,
+        but only one probe runs while the link is down."""
+        now = time.monotonic()
+        with self.link_lock:
+            if self.state == "connected" and client.get_connected(): return True
+            probe = self.state != "connected"
+            if probe:
+                self._account_downtime(now)
+                if self.probing or now < self.next_attempt: return False
+                self.probing = True
+                self._set_state("probing")
+        self.attempts.inc()
+        error = None
+        try:
+            if not client.get_connected(): client.connect(self.ip, 0, 1)
+            ok = client.get_connected()
+        except Exception as e:
+            ok, error = False, e
+        with self.link_lock:
+            if probe: self.probing = False
+            if ok: self._mark_up(time.monotonic())
+            else: self._mark_down(time.monotonic(), error or "connect refused")
+        return ok
+
+    def _run(self, op):
+        client = self.pool.get()
+        try:
+            if not self._link_ready(client): return None
             try:
-                data = self.client.db_read(DB_NUMBER, 0, 1)
-                set_bool(data, 0, bit, value)
-                self.client.db_write(DB_NUMBER, 0, data)
-                physics.last_inputs[bit] = value
-            except: pass
+                return op(client)
+            except Exception as e:
+                try: client.disconnect()
+                except Exception: pass
+                with self.link_lock: self._mark_down(time.monotonic(), e)
+                return None
+        finally:
+            self.pool.put(client)
+
+    def _read(self):
+        return self._run(lambda c: c.db_read(self.db_number, 0, 1))
 
-plc = PLCManager(PLC_IP)
+    def _write(self, data):
+        def op(c):
+            c.db_write(self.db_number, 0, data)
+            return data
+        return self._run(op)
+
+    async def read_db(self):
+        data = await asyncio.get_running_loop().run_in_executor(self.io, self._read)
+        if data is not None:
+            self.image = data
+            self.image_time = time.monotonic()
+        return data
+
+    def write_input_bit(self, bit, value):
+        # Queued per bit and applied one value per scan, so a button pulse
+        # shorter than the scan period still reaches the PLC. Only transitions
+        # are queued: a value equal to the last one queued (or, with nothing
+        # queued, to the scanned image) would not change the DB
+        values = self.pending_inputs.get(bit)
+        if values:
+            last = values[-1]
+        else:
+            last = get_bool(self.image, 0, bit) if self.image is not None else None
+        if value != last:
+            self.pending_inputs.setdefault(bit, []).append(value)
+
+    async def flush_inputs(self):
+        # Nothing is dequeued until the link has produced an image, so commands survive an outage
+        if not self.pending_inputs or self.image is None: return
+        changes = {bit: values[0] for bit, values in self.pending_inputs.items()}
+        # Built from the image this scan read, so read_db stays the only read per scan
+        data = bytearray(self.image)
+        for bit, value in changes.items(): set_bool(data, 0, bit, value)
+        if data != self.image:
+            if await asyncio.get_running_loop().run_in_executor(self.io, self._write, data) is None:
+                return # write failed: retried next scan
+            self.image = data
+        for bit in changes:
+            values = self.pending_inputs[bit]
+            values.pop(0)
+            if not values: del self.pending_inputs[bit]
+
+class Device:
+    """One elevator: its PLC link, simulated physics and publish state."""
+    def __init__(self, asset, ip, db_number, client_factory=snap7.client.Client):
+        self.asset = asset
+        self.topic = MQTT_TOPIC_TEMPLATE.format(asset=asset)
+        self.plc = PLCManager(ip, db_number, asset, client_factory=client_factory)
+        self.physics = ElevatorPhysics()
+        self.detector = ChangeDetector(PUBLISH_DEADBAND, HEARTBEAT_INTERVAL)
+        self.seq = 0
+
+    def publish_state(self, state, bits):
+        self.seq += 1
+        if WIRE_FORMAT in ("json", "both"):
+            mqtt_client.publish(self.topic, json.dumps({
+                "event": "machine.state.changed",
+                "asset": self.asset,
+                "data": state,
+                "timestamp": datetime.now().isoformat()
+            }))
+        if WIRE_FORMAT in ("binary", "both"):
+            frame = telemetry_codec.encode_state(bits, state["pos"], int(time.time() * 1000), self.seq)
+            mqtt_client.publish(telemetry_codec.state_topic(self.topic, binary=True), frame)
+
+def parse_fleet(spec):
+    """`lift-01=192.168.0.11:1,lift-02=192.168.0.12` -> [(asset, ip, db), ...]"""
+    fleet = []
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        asset, _, target = entry.partition("=")
+        ip, _, db = target.partition(":")
+        if not asset or not ip:
+            raise ValueError(f"Invalid PLC_FLEET entry: {entry!r}")
+        fleet.append((asset.strip(), ip.strip(), int(db) if db else DB_NUMBER))
+    return fleet
+
+devices = {asset: Device(asset, ip, db) for asset, ip, db in (parse_fleet(PLC_FLEET) or [(ASSET_ID, PLC_IP, DB_NUMBER)])}
+default_asset = next(iter(devices))
+
+def get_device(asset):
+    device = devices.get(asset or default_asset)
+    if not device:
+        raise HTTPException(status_code=404, detail=f"Unknown asset {asset}")
+    return device
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     connect_mqtt()
-    loop_task = asyncio.create_task(main_loop())
+    logger.info(f"🏗️ Escaneando {len(devices)} dispositivo(s): {', '.join(devices)}")
+    scan_tasks = [asyncio.create_task(scan_loop(device)) for device in devices.values()]
     yield
-    loop_task.cancel()
+    for task in scan_tasks: task.cancel()
     mqtt_client.loop_stop()
+    for device in devices.values(): device.plc.io.shutdown(wait=False)
 
 app = FastAPI(title="Industrial PLC Service", lifespan=lifespan)
 metrics_app = make_asgi_app()
 app.mount("/metrics", metrics_app)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
+@app.get("/devices")
+def list_devices():
+    return [{"asset": d.asset, "ip": d.plc.ip, "db": d.plc.db_number, "topic": d.topic} for d in devices.values()]
+
 @app.get("/state")
-def get_state():
-    data = plc.read_db()
-    if data:
+def get_state(asset: str = None):
+    # Served from the last scanned image; the HTTP API never touches the PLC
+    device = get_device(asset)
+    data = device.plc.image
+    if data and time.monotonic() - device.plc.image_time < STATE_MAX_AGE:
         return {
             "bp1": get_bool(data, 0, 0), "bp2": get_bool(data, 0, 1),
             "ls1": get_bool(data, 0, 2), "ls2": get_bool(data, 0, 3),
             "mc1": get_bool(data, 0, 4), "mc2": get_bool(data, 0, 5),
             "l1": get_bool(data, 0, 6), "l2": get_bool(data, 0, 7),
-            "pos": round(physics.position, 3),
+            "pos": round(device.physics.position, 3),
+            "asset": device.asset,
             "timestamp": datetime.now().isoformat()
         }
     raise HTTPException(status_code=503, detail="PLC unreachable")
 
 @app.post("/command/{button}")
-async def send_command(button: str, value: bool):
-    COMMANDS_TOTAL.labels(command=button).inc()
+async def send_command(button: str, value: bool, asset: str = None):
+    device = get_device(asset)
+    COMMANDS_TOTAL.labels(asset=device.asset, command=button).inc()
     mapping = {"bp1": 0, "bp2": 1}
     if button in mapping:
-        await plc.write_input_bit(mapping[button], value)
+        device.plc.write_input_bit(mapping[button], value)
         return {"status": "ok"}
     return {"status": "error"}
 
 @app.post("/simulate/inject-fault/{fault_type}")
-async def inject_fault(fault_type: str):
+async def inject_fault(fault_type: str, asset: str = None):
+    device = get_device(asset)
     if fault_type == "reset":
-        physics.faults.clear()
-        physics.position = 0.0
-        await plc.write_input_bit(2, True)
-        await plc.write_input_bit(3, False)
+        device.physics.faults.clear()
+        device.physics.position = 0.0
+        device.plc.write_input_bit(2, True)
+        device.plc.write_input_bit(3, False)
     else:
-        physics.faults.add(fault_type)
+        device.physics.faults.add(fault_type)
     return {"status": "injected"}
 
-async def main_loop():
-    last_loop_time = time.time()
+class ScanScheduler:
+    """Fixed-rate cycle timer on the monotonic clock. Deadlines advance by
+    exactly one period, so scan time does not accumulate as drift. When a
+    scan overruns by whole periods, `skip` drops the missed cycles and
+    realigns to the grid; `catch-up` runs them back to back, but at most
+    `max_backlog` of them, so a long stall does not turn into a burst."""
+    def __init__(self, period, policy="skip", asset=ASSET_ID, max_backlog=SCAN_MAX_BACKLOG):
+        self.period = period
+        self.policy = policy
+        self.max_backlog = max_backlog
+        self.deadline = None
+        self.last_start = None
+        self.jitter = PLC_SCAN_JITTER.labels(asset=asset)
+        self.overruns = PLC_SCAN_OVERRUNS.labels(asset=asset)
+        self.skipped = PLC_SCAN_SKIPPED.labels(asset=asset)
+
+    async def wait(self):
+        """Sleeps until the next deadline; returns the seconds since the previous cycle started."""
+        now = time.monotonic()
+        if self.deadline is None:
+            self.deadline = now
+        else:
+            self.deadline += self.period
+            delay = self.deadline - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.overruns.inc()
+                missed = int(-delay // self.period)
+                dropped = missed if self.policy == "skip" else max(0, missed - self.max_backlog)
+                if dropped:
+                    self.skipped.inc(dropped)
+                    self.deadline += dropped * self.period
+        start = time.monotonic()
+        self.jitter.observe(max(0.0, start - self.deadline))
+        elapsed = start - self.last_start if self.last_start is not None else 0.0
+        self.last_start = start
+        return elapsed
+
+async def scan_loop(device):
+    plc, physics, asset = device.plc, device.physics, device.asset
+    scheduler = ScanScheduler(SCAN_PERIOD, OVERRUN_POLICY, asset)
+    scan_time, uptime = PLC_SCAN_TIME.labels(asset=asset), UPTIME_SECONDS.labels(asset=asset)
+    cycles, suppressed = TOTAL_WORK_CYCLES.labels(asset=asset), STATE_SUPPRESSED.labels(asset=asset)
     while True:
-        start_scan = time.time()
+        elapsed = await scheduler.wait()
+        start_scan = time.monotonic()
         try:
             # Update Uptime
-            UPTIME_SECONDS.inc(0.05)
+            uptime.inc(elapsed)
             
             # Simulate PLC Health Metrics
-            PLC_CPU_LOAD.set(15.5 + (physics.position * 10.0)) # CPU rises as motor works
-            PLC_MEM_USAGE.set(1024 * 1024 * 4 + (len(physics.faults) * 1024))
+            PLC_CPU_LOAD.labels(asset=asset).set(15.5 + (physics.position * 10.0)) # CPU rises as motor works
+            PLC_MEM_USAGE.labels(asset=asset).set(1024 * 1024 * 4 + (len(physics.faults) * 1024))
             
-            data = plc.read_db()
+            data = await plc.read_db()
             if data and "jam" not in physics.faults:
                 mc1 = get_bool(data, 0, 4)
                 mc2 = get_bool(data, 0, 5)
@@ -159,18 +433,18 @@ async def main_loop():
                 elif mc2 and physics.position > 0.0:
                     physics.position = max(0.0, physics.position - physics.speed)
 
-                ELEVATOR_POS.set(physics.position)
-                MOTOR_TEMP.set(24.0 + (physics.position * 5.0) + (10.0 if mc1 or mc2 else 0.0))
+                ELEVATOR_POS.labels(asset=asset).set(physics.position)
+                MOTOR_TEMP.labels(asset=asset).set(24.0 + (physics.position * 5.0) + (10.0 if mc1 or mc2 else 0.0))
 
                 # Limit Switch Logic
-                await plc.write_input_bit(2, True if physics.position <= 0.005 else False)
-                await plc.write_input_bit(3, True if physics.position >= 0.995 else False)
+                plc.write_input_bit(2, True if physics.position <= 0.005 else False)
+                plc.write_input_bit(3, True if physics.position >= 0.995 else False)
 
                 # Cycle Counting (When it reaches floor and was moving)
                 if physics.position >= 0.995 and physics.last_pos < 0.995:
-                    TOTAL_WORK_CYCLES.inc()
+                    cycles.inc()
                 elif physics.position <= 0.005 and physics.last_pos > 0.005:
-                    TOTAL_WORK_CYCLES.inc()
+                    cycles.inc()
 
                 physics.last_pos = physics.position
 
@@ -182,17 +456,20 @@ async def main_loop():
                     "pos": round(physics.position, 2)
                 }
 
-                mqtt_client.publish(MQTT_TOPIC, json.dumps({
-                    "event": "machine.state.changed",
-                    "data": current_state,
-                    "timestamp": datetime.now().isoformat()
-                }))
+                reason = device.detector.check(current_state, time.monotonic()) if REPORT_BY_EXCEPTION else "scan"
+                if reason:
+                    device.publish_state(current_state, data[0])
+                    STATE_PUBLISHED.labels(asset=asset, reason=reason).inc()
+                else:
+                    suppressed.inc()
+
+            # Single coalesced write of limit switches + HMI commands
+            await plc.flush_inputs()
         except Exception as e:
-            logger.debug(f"Loop Error: {e}")
+            logger.debug(f"Loop Error ({asset}): {e}")
         
         # Scan Cycle Metric
-        PLC_SCAN_TIME.observe(time.time() - start_scan)
-        await asyncio.sleep(0.05)
+        scan_time.observe(time.monotonic() - start_scan)
 
 if __name__ == "__main__":
     import uvicorn